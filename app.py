@@ -1,11 +1,12 @@
 import tkinter as tk
 from tkinter import font, messagebox, filedialog, ttk
 import threading
-import pandas as pd
+import multiprocessing
 import webbrowser
 from utils import flash_paypal_button, copy_to_clipboard
-from scraper import scrape_data, export_data, stop_scan, clear_results
+from gui import scrape_data, export_data, stop_scan, clear_results
 from logging_config import configure_logging
+from results_view import ResultsView
 from config import RATE_LIMIT
 
 def open_paypal():
@@ -13,7 +14,7 @@ def open_paypal():
     webbrowser.open(paypal_url)
 
 def update_rate_limit_label(value):
-    rate_limit_label.config(text=f"Rate Limit: {value} seconds")
+    rate_limit_label.config(text=f"Rate Limit: {float(value):.1f} seconds")
 
 def main():
     root = tk.Tk()
@@ -74,11 +75,19 @@ def main():
 
     # Crawl Links Only Option
     crawl_links_var = tk.IntVar(value=0)
-    ttk.Checkbutton(content_frame, text="Crawl Only for Links", variable=crawl_links_var).grid(row=5, column=0, columnspan=2, sticky=tk.W, padx=5, pady=5)
+    ttk.Checkbutton(content_frame, text="Crawl Only for Links", variable=crawl_links_var).grid(row=5, column=0, sticky=tk.W, padx=5, pady=5)
+
+    # Sitemap Option: seed the crawl from the site's sitemaps, or take the link list straight from them
+    sitemaps_var = tk.IntVar(value=0)
+    ttk.Checkbutton(content_frame, text="Use Sitemaps", variable=sitemaps_var).grid(row=5, column=1, sticky=tk.W, padx=5, pady=5)
 
     # Scrape Images Option
     scrape_images_var = tk.IntVar(value=0)
-    ttk.Checkbutton(content_frame, text="Scrape Images", variable=scrape_images_var).grid(row=6, column=0, columnspan=2, sticky=tk.W, padx=5, pady=5)
+    ttk.Checkbutton(content_frame, text="Scrape Images", variable=scrape_images_var).grid(row=6, column=0, sticky=tk.W, padx=5, pady=5)
+
+    # Contacts-only Option: emails and phone numbers straight from the raw pages, no browser or parser
+    contacts_only_var = tk.IntVar(value=0)
+    ttk.Checkbutton(content_frame, text="Contacts Only (Fast)", variable=contacts_only_var).grid(row=6, column=1, sticky=tk.W, padx=5, pady=5)
 
     # Rate Limit Slider
     global rate_limit_label
@@ -90,7 +99,11 @@ def main():
 
     # Respect robots.txt Option
     load_robots_var = tk.IntVar(value=0)
-    ttk.Checkbutton(content_frame, text="Respect robots.txt", variable=load_robots_var).grid(row=8, column=0, columnspan=2, sticky=tk.W, padx=5, pady=5)
+    ttk.Checkbutton(content_frame, text="Respect robots.txt", variable=load_robots_var).grid(row=8, column=0, sticky=tk.W, padx=5, pady=5)
+
+    # Resumable / incremental crawl Option
+    resume_var = tk.IntVar(value=0)
+    ttk.Checkbutton(content_frame, text="Resume and Recrawl Incrementally", variable=resume_var).grid(row=8, column=1, sticky=tk.W, padx=5, pady=5)
 
     # Email and Phone Number Search Options
     search_emails_var = tk.IntVar(value=0)
@@ -99,14 +112,32 @@ def main():
     search_phones_var = tk.IntVar(value=0)
     ttk.Checkbutton(content_frame, text="Search for Phone Numbers", variable=search_phones_var).grid(row=9, column=1, sticky=tk.W, padx=5, pady=5)
 
+    # Duplicate Page Option
+    duplicates_var = tk.IntVar(value=0)
+    ttk.Checkbutton(content_frame, text="Skip Duplicate Pages", variable=duplicates_var).grid(row=10, column=0, sticky=tk.W, padx=5, pady=5)
+
+    # Image Download Option: saves the images found to the images folder, once per distinct image
+    download_images_var = tk.IntVar(value=0)
+    ttk.Checkbutton(content_frame, text="Download Images", variable=download_images_var).grid(row=10, column=1, sticky=tk.W, padx=5, pady=5)
+
+    # Crawl Budget Options: empty entries leave a limit off
+    ttk.Label(content_frame, text="Crawl Budget (depth / pages / minutes):").grid(row=11, column=0, sticky=tk.W, padx=5, pady=5)
+    budget_frame = ttk.Frame(content_frame)
+    budget_frame.grid(row=11, column=1, sticky=tk.W, padx=5, pady=5)
+    max_depth_var = tk.StringVar()
+    max_pages_var = tk.StringVar()
+    time_limit_var = tk.StringVar()
+    for column, var in enumerate((max_depth_var, max_pages_var, time_limit_var)):
+        ttk.Entry(budget_frame, textvariable=var, width=6).grid(row=0, column=column, padx=(0, 5))
+
     # Progress Bar
     global progress_bar
     progress_bar = ttk.Progressbar(content_frame, orient='horizontal', mode='determinate', length=400)
-    progress_bar.grid(row=10, column=0, columnspan=2, pady=10)
+    progress_bar.grid(row=12, column=0, columnspan=2, pady=10)
 
     # Control Buttons Frame
     button_frame = ttk.Frame(content_frame)
-    button_frame.grid(row=11, column=0, columnspan=2, pady=10)
+    button_frame.grid(row=13, column=0, columnspan=2, pady=10)
 
     # Control Buttons
     scrape_button = ttk.Button(button_frame, text="Scrape Data", command=lambda: scrape_data(
@@ -123,8 +154,19 @@ def main():
         progress_bar, 
         verbose_output, 
         stats_label, 
-        tree, 
-        donate_button  # Pass donate_button here
+        results_view, 
+        donate_button,  # Pass donate_button here
+        rate_limit_scale,
+        resume_var,
+        live_export_var,
+        metrics_label,
+        contacts_only_var,
+        sitemaps_var,
+        duplicates_var,
+        download_images_var,
+        max_depth_var,
+        max_pages_var,
+        time_limit_var
     ))
 
     scrape_button.grid(row=0, column=0, padx=5)
@@ -132,23 +174,30 @@ def main():
     stop_button = ttk.Button(button_frame, text="Stop Scan", command=lambda: stop_scan(verbose_output))
     stop_button.grid(row=0, column=1, padx=5)
 
-    clear_button = ttk.Button(button_frame, text="Clear Results", command=lambda: clear_results(tree, verbose_output))
+    clear_button = ttk.Button(button_frame, text="Clear Results", command=lambda: clear_results(results_view, verbose_output))
     clear_button.grid(row=0, column=2, padx=5)
 
     # Export Buttons Frame
     export_button_frame = ttk.Frame(content_frame)
-    export_button_frame.grid(row=12, column=0, columnspan=2, pady=10)
+    export_button_frame.grid(row=14, column=0, columnspan=2, pady=10)
 
     # Export Buttons
-    export_csv_button = ttk.Button(export_button_frame, text="Export to CSV", command=lambda: export_data("csv", url_entry, tags_combobox, classes_combobox, attribute_choice, crawl_option, crawl_links_var, scrape_images_var, load_robots_var, search_emails_var, search_phones_var, tree))
+    export_csv_button = ttk.Button(export_button_frame, text="Export to CSV", command=lambda: export_data("csv"))
     export_csv_button.grid(row=0, column=0, padx=5)
 
-    export_json_button = ttk.Button(export_button_frame, text="Export to JSON", command=lambda: export_data("json", url_entry, tags_combobox, classes_combobox, attribute_choice, crawl_option, crawl_links_var, scrape_images_var, load_robots_var, search_emails_var, search_phones_var, tree))
+    export_json_button = ttk.Button(export_button_frame, text="Export to JSON", command=lambda: export_data("json"))
     export_json_button.grid(row=0, column=1, padx=5)
 
-    export_excel_button = ttk.Button(export_button_frame, text="Export to Excel", command=lambda: export_data("excel", url_entry, tags_combobox, classes_combobox, attribute_choice, crawl_option, crawl_links_var, scrape_images_var, load_robots_var, search_emails_var, search_phones_var, tree))
+    export_excel_button = ttk.Button(export_button_frame, text="Export to Excel", command=lambda: export_data("excel"))
     export_excel_button.grid(row=0, column=2, padx=5)
 
+    export_parquet_button = ttk.Button(export_button_frame, text="Export to Parquet", command=lambda: export_data("parquet"))
+    export_parquet_button.grid(row=0, column=3, padx=5)
+
+    # Live Export Option
+    live_export_var = tk.IntVar(value=0)
+    ttk.Checkbutton(export_button_frame, text="Write Results While Crawling", variable=live_export_var).grid(row=1, column=0, columnspan=4, pady=5)
+
     # Treeview for displaying scraped data or links
     global tree
     tree = ttk.Treeview(content_frame, columns=("URL", "Content"), show="headings", selectmode="extended")
@@ -156,7 +205,7 @@ def main():
     tree.heading("Content", text="Scraped Content")
     tree.column("URL", width=300, anchor=tk.W)
     tree.column("Content", width=300, anchor=tk.W)
-    tree.grid(row=13, column=0, columnspan=2, padx=5, pady=5, sticky='nsew')
+    tree.grid(row=15, column=0, columnspan=2, padx=5, pady=5, sticky='nsew')
 
     # Enable selection and copying from Treeview
     tree.bind("<Control-c>", copy_to_clipboard)
@@ -167,19 +216,25 @@ def main():
     # Text widget for verbose output
     global verbose_output
     verbose_output = tk.Text(content_frame, height=5, wrap=tk.WORD, bg="black", fg="green", font=bold_font)
-    verbose_output.grid(row=14, column=0, columnspan=2, padx=5, pady=5, sticky='nsew')
+    verbose_output.grid(row=16, column=0, columnspan=2, padx=5, pady=5, sticky='nsew')
 
     # Add scrollbars
-    scrollbar_y = ttk.Scrollbar(content_frame, orient="vertical", command=tree.yview)
-    scrollbar_y.grid(row=13, column=2, sticky='ns')
-    tree.configure(yscrollcommand=scrollbar_y.set)
+    scrollbar_y = ttk.Scrollbar(content_frame, orient="vertical")
+    scrollbar_y.grid(row=15, column=2, sticky='ns')
 
     scrollbar_x = ttk.Scrollbar(content_frame, orient="horizontal", command=tree.xview)
-    scrollbar_x.grid(row=15, column=0, columnspan=2, sticky='ew')
+    scrollbar_x.grid(row=17, column=0, columnspan=2, sticky='ew')
     tree.configure(xscrollcommand=scrollbar_x.set)
 
+    # Live crawl metrics panel
+    metrics_frame = ttk.LabelFrame(content_frame, text="Crawl Metrics", padding="5 5 5 5")
+    metrics_frame.grid(row=18, column=0, columnspan=2, padx=5, pady=5, sticky='ew')
+    global metrics_label
+    metrics_label = ttk.Label(metrics_frame, text="No crawl running", justify=tk.LEFT, font=("Helvetica", 9))
+    metrics_label.grid(row=0, column=0, sticky=tk.W)
+
     # Configure grid weights for resizing
-    content_frame.grid_rowconfigure(13, weight=1)
+    content_frame.grid_rowconfigure(15, weight=1)
     content_frame.grid_columnconfigure(1, weight=1)
 
     # Create a footer frame
@@ -191,6 +246,14 @@ def main():
     stats_label = ttk.Label(footer_frame, text="Pages crawled: 0 | Time taken: 0 seconds", font=("Helvetica", 10))
     stats_label.grid(row=0, column=0, pady=5)
 
+    # Live results counter
+    counter_label = ttk.Label(footer_frame, text="Results: 0", font=("Helvetica", 10))
+    counter_label.grid(row=0, column=1, padx=10, pady=5)
+
+    # Only the rows on screen live in the Treeview; the view pages through the rest
+    global results_view
+    results_view = ResultsView(tree, scrollbar_y, counter_label, progress_bar)
+
     # Donation Button (Use tk.Button instead of ttk.Button for background color control)
     donate_button = tk.Button(footer_frame, text="Donate with PayPal", command=open_paypal, bg="gold", fg="black", font=("Helvetica", 12, "bold"))
     donate_button.grid(row=1, column=0, pady=5)
@@ -202,5 +265,6 @@ def main():
     root.mainloop()
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     configure_logging()
     main()
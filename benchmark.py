@@ -0,0 +1,407 @@
+import argparse
+import concurrent.futures
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import MAX_THREADS, PARSE_PROCESSES, FETCH_ENGINE
+from logging_config import configure_logging
+from options import ScrapeOptions
+
+# Pages kept ready to serve, so the server's own CPU does not show up as crawler latency
+PAGE_CACHE_SIZE = 20000
+
+WORDS = ("lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore "
+         "et dolore magna aliqua enim ad minim veniam quis nostrud exercitation ullamco laboris nisi").split()
+
+FACET_SORTS = ("price", "name", "newest", "rating")
+# The PNG signature, so served images look like images
+PNG_HEADER = b"\x89PNG\r\n\x1a\n"
+
+# A deterministic synthetic website: page n is generated from the seed, so any size of site costs
+# no disk and the same parameters always produce the same pages. Facet links point at pages with
+# session and sort parameters the server ignores, like the URL variants of a shop. Images come
+# from a shared pool, as lazy-loaded <img> tags and as CSS backgrounds on a second path that
+# serves the same bytes, like a site and its CDN.
+class SyntheticSite:
+    def __init__(self, pages=500, fan_out=10, page_kb=20, emails=2, phones=1, seed=0, facets=0, images=0, image_kb=20):
+        self.pages = pages
+        self.fan_out = fan_out
+        self.facets = facets
+        self.images = images
+        self.image_pool = max(10, pages // 10)
+        self.image_kb = image_kb
+        self.page_kb = page_kb
+        self.emails = emails
+        self.phones = phones
+        self.seed = seed
+        self.page = lru_cache(maxsize=PAGE_CACHE_SIZE)(self._page)
+        self.image = lru_cache(maxsize=PAGE_CACHE_SIZE)(self._image)
+
+    def warm(self):
+        for n in range(min(self.pages, PAGE_CACHE_SIZE)):
+            self.page(n)
+
+    def _page(self, n):
+        rng = random.Random(self.seed * 1000003 + n)
+        # A link to the next page keeps every page reachable from page 0
+        targets = {(n + 1) % self.pages} | {rng.randrange(self.pages) for _ in range(self.fan_out - 1)}
+        parts = [f"<html><head><title>Page {n}</title></head><body><h1>Page {n}</h1><ul>"]
+        parts.extend(f'<li><a href="/page/{target}.html">Page {target}</a></li>' for target in sorted(targets))
+        parts.extend(f'<li><a href="/page/{rng.randrange(self.pages)}.html?sessionid={rng.randrange(10 ** 6)}&amp;sort={rng.choice(FACET_SORTS)}">'
+                     f'Sorted</a></li>' for _ in range(self.facets))
+        parts.append("</ul>")
+        for _ in range(self.images):
+            image = rng.randrange(self.image_pool)
+            if rng.random() < 0.5:
+                parts.append(f'<img src="data:image/gif;base64,R0lGODlhAQABAAAAACw=" data-src="/img/{image}.png" alt="">')
+            else:
+                parts.append(f'<div style="background-image: url(\'/cdn/{image}.png\')"></div>')
+        contacts = [f"user{n}.{k}@example.com" for k in range(self.emails)]
+        contacts += [f"+1 555 {n % 1000:03d} {k:04d}" for k in range(self.phones)]
+        size, target_size = 0, self.page_kb * 1024
+        while size < target_size or contacts:
+            text = " ".join(rng.choice(WORDS) for _ in range(40))
+            if contacts:
+                text += f" {contacts.pop()}."
+            paragraph = f'<div class="content"><p>{text}</p></div>'
+            parts.append(paragraph)
+            size += len(paragraph)
+        parts.append("</body></html>")
+        return "".join(parts).encode('utf-8')
+
+    def _image(self, n):
+        size = self.image_kb * 1024
+        return PNG_HEADER + random.Random(self.seed * 1000003 - n - 1).getrandbits(size * 8).to_bytes(size, 'little')
+
+class SiteHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        if server.latency:
+            time.sleep((server.latency + random.uniform(0, server.jitter)) / 1000)
+        if server.rate_429 and random.random() < server.rate_429:
+            self._send(429, b"Too Many Requests", {"Retry-After": "1"})
+            return
+        path = self.path.split("?", 1)[0]
+        if path.startswith(("/img/", "/cdn/")) and path.endswith(".png"):
+            name = path[len("/img/"):-len(".png")]
+            if name.isdigit() and int(name) < server.site.image_pool:
+                self._send(200, server.site.image(int(name)), {"Content-Type": "image/png"})
+            else:
+                self._send(404, b"Not Found")
+            return
+        if path in ("/", "/index.html"):
+            path = "/page/0.html"
+        try:
+            n = int(path[len("/page/"):-len(".html")]) if path.startswith("/page/") and path.endswith(".html") else -1
+        except ValueError:
+            n = -1
+        if not 0 <= n < server.site.pages:
+            self._send(404, b"Not Found")
+            return
+        self._send(200, server.site.page(n), {"Content-Type": "text/html; charset=utf-8"})
+
+    def _send(self, status, body, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class SiteServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, site, latency=0, jitter=0, rate_429=0.0, host="127.0.0.1", port=0):
+        super().__init__((host, port), SiteHandler)
+        self.site = site
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/page/0.html"
+
+def start_servers(args):
+    # One server per host; the first --slow-hosts of them answer with --slow-latency-ms instead
+    servers = []
+    for index in range(args.hosts):
+        site = SyntheticSite(args.pages, args.fan_out, args.page_kb, args.emails, args.phones, seed=index, facets=args.facets,
+                             images=args.images, image_kb=args.image_kb)
+        site.warm()
+        latency = args.slow_latency_ms if index < args.slow_hosts else args.latency_ms
+        server = SiteServer(site, latency, args.jitter_ms, args.rate_429)
+        threading.Thread(target=server.serve_forever, name=f"bench-host-{index}", daemon=True).start()
+        servers.append(server)
+    return servers
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, round(fraction * len(values)) - 1))]
+
+def summarize(values):
+    return {
+        'count': len(values),
+        'p50_ms': round(percentile(values, 0.50) * 1000, 3) if values else None,
+        'p99_ms': round(percentile(values, 0.99) * 1000, 3) if values else None,
+        'mean_ms': round(sum(values) / len(values) * 1000, 3) if values else None,
+    }
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        info = psutil.Process().memory_info()
+        return round(getattr(info, 'peak_wset', info.rss) / (1024 * 1024), 1)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+# Wraps a fetch engine and records how long each request took and what it returned
+class TimingFetcher:
+    def __init__(self, fetcher, samples, statuses):
+        self.fetcher = fetcher
+        self.max_in_flight = fetcher.max_in_flight
+        self.samples = samples
+        self.statuses = statuses
+
+    def _record(self, future):
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is None:
+            result = future.result()
+            self.samples.append(result.elapsed)
+            self.statuses[str(result.status)] = self.statuses.get(str(result.status), 0) + 1
+        else:
+            self.statuses['error'] = self.statuses.get('error', 0) + 1
+
+    def submit(self, url, headers=None, delay=0, cancel_event=None):
+        future = self.fetcher.submit(url, headers, delay, cancel_event)
+        future.add_done_callback(self._record)
+        return future
+
+    def fetch(self, url, headers=None, delay=0, cancel_event=None):
+        return self.submit(url, headers, delay, cancel_event).result()
+
+    def submit_download(self, url, sink, max_bytes=None, headers=None, delay=0, cancel_event=None):
+        # Image and sitemap downloads are not page fetches, so they stay out of the fetch stage
+        return self.fetcher.submit_download(url, sink, max_bytes, headers, delay, cancel_event)
+
+    def close(self):
+        self.fetcher.close()
+
+def run_once(seeds, params):
+    # Runs in its own process, so peak RSS and CPU time belong to this run alone
+    configure_logging(filename=None, level=logging.DEBUG if params['verbose'] else logging.CRITICAL)
+    import scraper
+    from exporters import export_rows
+    from fetcher import get_fetcher
+    from metrics import CrawlMetrics, STAGES
+
+    stages = {'fetch': [], 'process': []}
+    statuses = {}
+    process_page = scraper.process_page
+
+    def timed_process_page(*args):
+        start = time.perf_counter()
+        try:
+            return process_page(*args)
+        finally:
+            stages['process'].append(time.perf_counter() - start)
+
+    scraper.process_page = timed_process_page
+    options = ScrapeOptions(tags=['div'], classes=['content'], crawl=True, crawl_links_only=params['mode'] == 'links',
+                            search_emails=params['mode'] != 'links', search_phones=params['mode'] != 'links',
+                            contacts_only=params['mode'] == 'contacts', skip_duplicates=params['skip_duplicates'],
+                            rate_limit=params['rate_limit'], max_threads=params['threads'],
+                            parse_processes=params['processes'],
+                            image_dir=tempfile.mkdtemp() if params['download_images'] else None,
+                            max_depth=params['max_depth'], max_pages=params['max_pages'], time_limit=params['time_limit'])
+    fetcher = TimingFetcher(get_fetcher(params['engine']), stages['fetch'], statuses)
+    # Shared by every seed's crawl, for the stages the crawler times itself
+    metrics = CrawlMetrics()
+
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(seeds)) as executor:
+        results = list(executor.map(lambda seed: scraper.crawl_site(seed, options, fetcher=fetcher, metrics=metrics), seeds))
+    crawl_seconds = time.perf_counter() - start
+    fetcher.close()
+
+    rows = sum(len(result) for result in results)
+    columns = scraper.LINK_COLUMNS if params['mode'] == 'links' else scraper.DATA_COLUMNS
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        export_rows(itertools.chain.from_iterable(results), 'csv', os.path.join(directory, 'export.csv'), columns)
+        stages['export'] = [time.perf_counter() - start]
+    for result in results:
+        result.close()
+    images = {}
+    if options.image_dir:
+        with open(os.path.join(options.image_dir, 'manifest.jsonl'), encoding='utf-8') as manifest:
+            for line in manifest:
+                status = json.loads(line)['status']
+                images[status] = images.get(status, 0) + 1
+        shutil.rmtree(options.image_dir)
+
+    pages = len(stages['process'])
+    summaries = {name: summarize(values) for name, values in stages.items()}
+    # Fetch, process and export are timed here from every sample; the crawler's other stages come
+    # from its histograms, so their percentiles are estimated within a bucket
+    crawl_stages = metrics.snapshot()['stages']
+    for stage in STAGES:
+        if stage not in summaries and stage in crawl_stages:
+            histogram = crawl_stages[stage]
+            summaries[stage] = {'count': histogram['count'], 'p50_ms': histogram['p50_ms'], 'p99_ms': histogram['p99_ms'],
+                                'mean_ms': round(histogram['sum_seconds'] / histogram['count'] * 1000, 3) if histogram['count'] else None}
+    return {
+        'pages': pages,
+        'rows': rows,
+        'seconds': round(crawl_seconds, 3),
+        'pages_per_sec': round(pages / crawl_seconds, 2) if crawl_seconds else None,
+        'stages': summaries,
+        'statuses': statuses,
+        'images': images,
+        'peak_rss_mb': peak_rss_mb(),
+        'cpu_seconds': round(time.process_time() - cpu_start, 3),
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def scenario_params(params):
+    # The parameters that decide what a run measures; how often it runs and how loudly do not
+    return {key: value for key, value in params.items() if key not in ('repeat', 'verbose')}
+
+def scenario_name(params):
+    return "-".join(f"{key}={value:g}" if isinstance(value, float) else f"{key}={value}"
+                    for key, value in scenario_params(params).items())
+
+def compare(previous, current):
+    # Median pages/sec per scenario against an earlier results file. Runs are matched on their
+    # parameters, since names given with --name need not tell configurations apart.
+    def medians(report):
+        runs, names = {}, {}
+        for run in report['runs']:
+            key = json.dumps(scenario_params(run['params']), sort_keys=True)
+            runs.setdefault(key, []).append(run['pages_per_sec'] or 0)
+            names[key] = run['scenario']
+        return {key: percentile(values, 0.5) for key, values in runs.items()}, names
+
+    (old, _), (new, names) = medians(previous), medians(current)
+    for key, value in new.items():
+        if key in old and old[key]:
+            change = (value - old[key]) / old[key] * 100
+            print(f"{names[key]}: {old[key]:.1f} -> {value:.1f} pages/sec ({change:+.1f}%) vs {previous.get('commit')}")
+        else:
+            print(f"{names[key]}: {value:.1f} pages/sec (no earlier run)")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the crawler against synthetic sites served locally.")
+    parser.add_argument("--pages", type=int, default=500, help="Pages per synthetic site")
+    parser.add_argument("--fan-out", type=int, default=10, help="Links per page")
+    parser.add_argument("--page-kb", type=int, default=20, help="Approximate page weight in KB")
+    parser.add_argument("--facets", type=int, default=0, help="Extra links per page to variants with ignored session/sort parameters")
+    parser.add_argument("--images", type=int, default=0, help="Images per page, drawn from a pool of a tenth as many as there are pages")
+    parser.add_argument("--image-kb", type=int, default=20, help="Size of each image in KB")
+    parser.add_argument("--download-images", action="store_true", help="Download the images found (into a temporary folder)")
+    parser.add_argument("--emails", type=int, default=2, help="Emails per page")
+    parser.add_argument("--phones", type=int, default=1, help="Phone numbers per page")
+    parser.add_argument("--hosts", type=int, default=1, help="Synthetic sites, each on its own port, crawled at the same time")
+    parser.add_argument("--slow-hosts", type=int, default=0, help="How many of the hosts are slow")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Latency added to every response")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="Random extra latency up to this much")
+    parser.add_argument("--slow-latency-ms", type=float, default=500, help="Latency of the slow hosts")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--mode", choices=["data", "contacts", "links"], default="data", help="Extract data, only contacts, or only crawl links")
+    parser.add_argument("--engine", choices=["async", "requests"], default=FETCH_ENGINE, help="Fetch engine")
+    parser.add_argument("--threads", type=int, default=MAX_THREADS, help="Worker threads per crawl")
+    parser.add_argument("--processes", type=int, default=PARSE_PROCESSES, help="Parser processes per crawl")
+    parser.add_argument("--skip-duplicates", action="store_true", help="Crawl with duplicate page detection")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Seconds between requests to one host")
+    parser.add_argument("--max-depth", type=int, help="Crawl budget: link depth")
+    parser.add_argument("--max-pages", type=int, help="Crawl budget: pages per site")
+    parser.add_argument("--time-limit", type=float, help="Crawl budget: seconds per site")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of the scenario, each in a fresh process")
+    parser.add_argument("--name", help="Scenario name in the results (default: built from the parameters)")
+    parser.add_argument("-o", "--output", default="bench_results.json", help="JSON file the results are written to")
+    parser.add_argument("--compare", help="Earlier results file to compare pages/sec against")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show crawler logs")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    params = {key: value for key, value in vars(args).items() if key not in ('output', 'compare', 'name')}
+    # Built from every parameter, so flags added later are part of the name without touching this
+    scenario = args.name or scenario_name(params)
+    servers = start_servers(args)
+    seeds = [server.url for server in servers]
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'runs': [],
+    }
+    try:
+        for index in range(args.repeat):
+            # A fresh spawned process per run keeps peak RSS and CPU time separate between runs
+            with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                result = pool.submit(run_once, seeds, params).result()
+            result.update(scenario=scenario, run=index + 1, params=params)
+            report['runs'].append(result)
+            timings = ", ".join(f"{name} p50/p99 {values['p50_ms']}/{values['p99_ms']} ms"
+                                for name, values in result['stages'].items() if name != 'export' and values['count'])
+            print(f"{scenario} run {index + 1}: {result['pages']} pages in {result['seconds']:.2f}s "
+                  f"({result['pages_per_sec']} pages/sec), {timings}, "
+                  f"export {result['stages']['export']['p50_ms']} ms, peak RSS {result['peak_rss_mb']} MB, CPU {result['cpu_seconds']}s"
+                  + (f", images {result['images']}" if result['images'] else ""))
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+
+    with open(args.output, 'w', encoding='utf-8') as output_file:
+        json.dump(report, output_file, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as previous_file:
+            compare(json.load(previous_file), report)
+    return 0
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
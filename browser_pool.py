@@ -0,0 +1,177 @@
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service as ChromeService
+from selenium.webdriver.common.by import By
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from config import (CHROME_DRIVER_PATH, DRIVER_POOL_SIZE, DRIVER_MAX_PAGES, DRIVER_MAX_MEMORY_MB,
+                    DRIVER_PAGE_TIMEOUT, LEAN_RENDER)
+
+# Resources the lean render profile never downloads
+LEAN_BLOCKED_URLS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.avif", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*.mp4", "*.webm", "*.ogg", "*.mp3", "*.wav", "*.m4a", "*.avi", "*.mov",
+]
+
+def build_chrome_options(lean=LEAN_RENDER):
+    chrome_options = Options()
+    chrome_options.add_argument("--headless")  # Run in headless mode (no UI)
+    chrome_options.add_argument("--disable-gpu")
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    if lean:
+        # Hand the DOM back as soon as it is parsed instead of waiting for every subresource
+        chrome_options.page_load_strategy = 'eager'
+        chrome_options.add_argument("--blink-settings=imagesEnabled=false")
+        chrome_options.add_argument("--mute-audio")
+        chrome_options.add_experimental_option("prefs", {
+            "profile.managed_default_content_settings.images": 2,
+        })
+    return chrome_options
+
+class DriverWorker:
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+
+class DriverPool:
+    def __init__(self, size=DRIVER_POOL_SIZE, max_pages=DRIVER_MAX_PAGES, max_memory_mb=DRIVER_MAX_MEMORY_MB,
+                 lean=LEAN_RENDER, stop_event=None, driver_path=CHROME_DRIVER_PATH, metrics=None):
+        self.size = max(1, size)
+        self.max_pages = max_pages
+        self.max_memory = max_memory_mb * 1024 * 1024
+        self.lean = lean
+        self.stop_event = stop_event
+        self.driver_path = driver_path
+        self.metrics = metrics
+        self._idle = queue.LifoQueue()  # LIFO keeps the warmest browsers busy
+        self._workers = set()
+        self._starting = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    @property
+    def stopped(self):
+        return self._closed or (self.stop_event is not None and self.stop_event.is_set())
+
+    def _start_worker(self):
+        service = ChromeService(executable_path=self.driver_path)
+        driver = webdriver.Chrome(service=service, options=build_chrome_options(self.lean))
+        driver.set_page_load_timeout(DRIVER_PAGE_TIMEOUT)
+        if self.lean:
+            try:
+                driver.execute_cdp_cmd("Network.enable", {})
+                driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": LEAN_BLOCKED_URLS})
+            except Exception as e:
+                logging.warning(f"Could not block heavy resources in Chrome: {e}")
+        logging.info("Started headless Chrome worker")
+        return DriverWorker(driver)
+
+    def _is_healthy(self, worker):
+        try:
+            return worker.driver.execute_script("return 1") == 1
+        except Exception:
+            return False
+
+    def _memory_used(self, worker):
+        try:
+            return worker.driver.execute_script(
+                "return (window.performance && performance.memory) ? performance.memory.usedJSHeapSize : 0") or 0
+        except Exception:
+            return 0
+
+    def _discard(self, worker):
+        with self._lock:
+            self._workers.discard(worker)
+        try:
+            worker.driver.quit()
+        except Exception as e:
+            logging.warning(f"Failed to quit Chrome worker: {e}")
+
+    def acquire(self):
+        while not self.stopped:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                worker = None
+                with self._lock:
+                    can_start = len(self._workers) + self._starting < self.size
+                    if can_start:
+                        self._starting += 1  # Reserve the slot while Chrome starts
+                if can_start:
+                    start = time.perf_counter()
+                    try:
+                        worker = self._start_worker()
+                    except Exception as e:
+                        logging.error(f"Failed to start Chrome worker: {e}")
+                        if self.metrics:
+                            self.metrics.count("errors", stage="browser_start")
+                        return None
+                    finally:
+                        with self._lock:
+                            self._starting -= 1
+                    if self.metrics:
+                        self.metrics.observe("browser_start", time.perf_counter() - start)
+                    with self._lock:
+                        self._workers.add(worker)
+                else:
+                    try:
+                        worker = self._idle.get(timeout=0.5)
+                    except queue.Empty:
+                        continue
+            if self._is_healthy(worker):
+                return worker
+            logging.warning("Discarding unresponsive Chrome worker")
+            self._discard(worker)
+        return None
+
+    def utilization(self):
+        # Browsers leased right now, and browsers running at all
+        with self._lock:
+            started = len(self._workers)
+        return max(0, started - self._idle.qsize()), started
+
+    def release(self, worker, broken=False):
+        worker.pages += 1
+        if self.stopped or broken or worker.pages >= self.max_pages or self._memory_used(worker) > self.max_memory:
+            self._discard(worker)
+        else:
+            self._idle.put(worker)
+
+    @contextmanager
+    def lease(self):
+        worker = self.acquire()
+        broken = False
+        try:
+            yield worker
+        except Exception:
+            broken = worker is not None and not self._is_healthy(worker)
+            raise
+        finally:
+            if worker is not None:
+                self.release(worker, broken)
+
+    def render(self, url, wait=10):
+        with self.lease() as worker:
+            if worker is None:
+                return None
+            worker.driver.get(url)
+            # Wait until the body is present
+            WebDriverWait(worker.driver, wait).until(EC.presence_of_element_located((By.TAG_NAME, 'body')))
+            return worker.driver.page_source
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(worker)
+        # Workers still leased are quit by release() now that the pool is closed
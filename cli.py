@@ -0,0 +1,171 @@
+import argparse
+import concurrent.futures
+import logging
+import multiprocessing
+import re
+import sys
+import threading
+import time
+from config import MAX_THREADS, RATE_LIMIT, PARSE_PROCESSES, METRICS_DIR
+from logging_config import configure_logging
+from options import ScrapeOptions, split_list
+from exporters import EXPORT_FORMATS, format_for_path, open_writer
+
+def regex(text):
+    try:
+        re.compile(text)
+    except re.error as e:
+        raise argparse.ArgumentTypeError(f"invalid regex {text!r}: {e}")
+    return text
+
+def priority_rule(text):
+    pattern, _, weight = text.rpartition("=")
+    try:
+        return regex(pattern), float(weight)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected REGEX=WEIGHT, got {text!r}")
+
+def add_scrape_arguments(parser):
+    # The scrape options, shared with the distributed coordinator
+    parser.add_argument("--tags", default="div", help="Comma-separated HTML tags to scrape")
+    parser.add_argument("--classes", default="", help="Comma-separated HTML classes to scrape")
+    parser.add_argument("--attribute", default="text", help="Attribute to scrape (text, href, src, alt, ...)")
+    parser.add_argument("--crawl", action="store_true", help="Crawl each seed's whole site instead of one page")
+    parser.add_argument("--links-only", action="store_true", help="Only collect internal links while crawling")
+    parser.add_argument("--sitemaps", action="store_true", help="Seed crawls from the site's sitemaps (with --links-only, list their URLs instead of crawling)")
+    parser.add_argument("--skip-duplicates", action="store_true", help="Skip extraction on duplicate and near-duplicate pages, and drop URL parameters learned not to change pages")
+    parser.add_argument("--include", action="append", type=regex, default=[], metavar="REGEX", help="Only crawl URLs matching REGEX (repeatable)")
+    parser.add_argument("--exclude", action="append", type=regex, default=[], metavar="REGEX", help="Never crawl URLs matching REGEX (repeatable)")
+    parser.add_argument("--priority", action="append", type=priority_rule, default=[], metavar="REGEX=WEIGHT", help="Crawl URLs matching REGEX earlier by WEIGHT, or later if negative (repeatable)")
+    parser.add_argument("--max-depth", type=int, help="Follow links at most this many clicks from the seed")
+    parser.add_argument("--max-pages", type=int, help="Stop each crawl after fetching this many pages")
+    parser.add_argument("--max-mb", type=float, help="Stop each crawl after downloading this many megabytes of pages")
+    parser.add_argument("--time-limit", type=float, metavar="SECONDS", help="Stop each crawl after this many seconds")
+    parser.add_argument("--images", action="store_true", help="Scrape images")
+    parser.add_argument("--download-images", metavar="DIR", help="Download the images found into DIR, named by content hash, with a manifest.jsonl (implies --images)")
+    parser.add_argument("--emails", action="store_true", help="Search for emails")
+    parser.add_argument("--phones", action="store_true", help="Search for phone numbers")
+    parser.add_argument("--contacts-only", action="store_true", help="Only find emails and phone numbers, scanning the raw pages without a browser or parser")
+    parser.add_argument("--robots", action="store_true", help="Respect robots.txt")
+    parser.add_argument("--resume", action="store_true", help="Resume interrupted crawls and recrawl incrementally")
+    parser.add_argument("--rate-limit", type=float, default=RATE_LIMIT, help="Seconds between requests to one host")
+    parser.add_argument("--threads", type=int, default=MAX_THREADS, help="Worker threads per crawl")
+    parser.add_argument("--processes", type=int, default=PARSE_PROCESSES, help="Parser processes per crawl (0 parses on the crawl threads, -1 uses every core)")
+    parser.add_argument("--metrics-dir", default=METRICS_DIR, help="Write JSON and Prometheus metrics snapshots per site here")
+    parser.add_argument("--profile-dir", help="Profile each crawl with cProfile and write <site>.prof here")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Scrape pages or crawl sites without the GUI.")
+    parser.add_argument("urls", nargs="*", help="Seed URLs to scrape")
+    parser.add_argument("-s", "--seeds", help="File with one seed URL per line ('#' starts a comment)")
+    parser.add_argument("-o", "--output", required=True, help="File the results are written to")
+    parser.add_argument("-f", "--format", choices=sorted(EXPORT_FORMATS), help="Output format (default: from the file extension)")
+    add_scrape_arguments(parser)
+    parser.add_argument("--parallel", type=int, default=1, help="Seeds scraped at the same time")
+    parser.add_argument("--log-file", help="Log to this file instead of stderr")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Log debug output")
+    args = parser.parse_args(argv)
+    if not args.urls and not args.seeds:
+        parser.error("give seed URLs or --seeds FILE")
+    return args
+
+def read_seeds(path):
+    with open(path, encoding="utf-8") as seed_file:
+        return [line.strip() for line in seed_file if line.strip() and not line.lstrip().startswith("#")]
+
+def options_from_args(args):
+    return ScrapeOptions(
+        tags=split_list(args.tags),
+        classes=split_list(args.classes),
+        attribute=args.attribute,
+        crawl=args.crawl or args.links_only,
+        crawl_links_only=args.links_only,
+        use_sitemaps=args.sitemaps,
+        skip_duplicates=args.skip_duplicates,
+        include=args.include,
+        exclude=args.exclude,
+        priorities=dict(args.priority),
+        max_depth=args.max_depth,
+        max_pages=args.max_pages,
+        max_bytes=None if args.max_mb is None else int(args.max_mb * 1024 * 1024),
+        time_limit=args.time_limit,
+        scrape_images=args.images or bool(args.download_images),
+        image_dir=args.download_images,
+        respect_robots=args.robots,
+        search_emails=args.emails,
+        search_phones=args.phones,
+        contacts_only=args.contacts_only,
+        resume=args.resume,
+        rate_limit=args.rate_limit,
+        max_threads=args.threads,
+        parse_processes=args.processes,
+        metrics_dir=args.metrics_dir,
+        profile_dir=args.profile_dir,
+    )
+
+def run_batch(seeds, options, output, export_format=None, parallel=1):
+    # Imported here so `--help` and argument errors return without loading the scraping stack
+    from scraper import run_scrape, stop_scan_flag, DATA_COLUMNS, LINK_COLUMNS
+    from result_store import ResultStore
+
+    columns = LINK_COLUMNS if options.crawl and options.crawl_links_only else DATA_COLUMNS
+    writer = open_writer(export_format or format_for_path(output), output, columns)
+    write_lock = threading.Lock()
+    # Shared by every seed, so a row found under two seeds is written once
+    results = ResultStore()
+    counts = {'rows': 0, 'failed': 0}
+
+    def write_rows(rows):
+        with write_lock:
+            writer.write_rows(rows)
+            counts['rows'] += len(rows)
+
+    def scrape_seed(seed):
+        start_time = time.time()
+        try:
+            run_scrape(seed, options, on_rows=write_rows, results=results)
+        except Exception as e:
+            logging.error(f"Seed {seed} failed: {e}")
+            with write_lock:
+                counts['failed'] += 1
+            return
+        logging.info(f"Finished {seed} in {time.time() - start_time:.2f} seconds")
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, parallel))
+    futures = [executor.submit(scrape_seed, seed) for seed in seeds]
+    try:
+        for future in futures:
+            future.result()
+    except KeyboardInterrupt:
+        # Let running crawls wind down cleanly so their browsers close and the output stays valid
+        stop_scan_flag.set()
+        for future in futures:
+            future.cancel()
+        raise
+    finally:
+        executor.shutdown(wait=True)
+        writer.close()
+        results.close()
+    return counts['rows'], counts['failed']
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_logging(filename=args.log_file, level=logging.DEBUG if args.verbose else logging.INFO)
+
+    seeds = list(args.urls)
+    if args.seeds:
+        seeds.extend(read_seeds(args.seeds))
+    options = options_from_args(args)
+
+    start_time = time.time()
+    try:
+        rows, failed = run_batch(seeds, options, args.output, args.format, args.parallel)
+    except KeyboardInterrupt:
+        logging.warning("Interrupted, partial results were written to the output file")
+        return 130
+    logging.info(f"Wrote {rows} rows from {len(seeds)} seeds to {args.output} in {time.time() - start_time:.2f} seconds")
+    return 1 if failed == len(seeds) else 0
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -4,3 +4,116 @@ HEADERS = {
 
 MAX_THREADS = 5
 RATE_LIMIT = 1
+
+# Path to your ChromeDriver
+CHROME_DRIVER_PATH = r'C:\chromedriver.exe'  # Update this with the actual path
+
+# Headless Chrome worker pool
+DRIVER_POOL_SIZE = MAX_THREADS
+DRIVER_MAX_PAGES = 50  # Recycle a browser after this many pages
+DRIVER_MAX_MEMORY_MB = 512  # Recycle a browser once its JS heap grows past this
+DRIVER_PAGE_TIMEOUT = 30
+LEAN_RENDER = True  # Eager page loads, no images, fonts or media
+
+# When to render pages in Chrome: 'auto' decides per URL pattern, 'always' or 'never' force it
+RENDER_MODE = 'auto'
+RENDER_SITES = {}  # Per-site override, e.g. {'www.example.com': True}
+RENDER_MIN_TEXT = 200  # Pages with less visible text than this are treated as JavaScript shells
+
+# HTTP fetch engine: 'async' uses httpx (pooled, HTTP/2, brotli) when installed, 'requests' a pooled Session
+FETCH_ENGINE = 'async'
+FETCH_CONCURRENCY = 500  # Requests in flight at once on the async engine
+FETCH_MAX_BYTES = 10 * 1024 * 1024  # Bodies are cut off past this size
+FETCH_TIMEOUTS = {'connect': 5, 'read': 15, 'write': 10, 'pool': 60}
+
+# Resumable crawls keep their frontier and page validators here, one SQLite file per site
+CRAWL_STORE_DIR = 'crawl_state'
+
+# Exports are written this many rows at a time
+EXPORT_CHUNK_SIZE = 5000
+
+# Scrape results are deduplicated into a temporary SQLite database: this many KB of it stay in
+# memory and the rest spills to a temporary file; new rows are committed this many at a time
+RESULT_CACHE_KB = 8192
+RESULT_COMMIT_EVERY = 5000
+
+# Parse and extract in this many processes to use every core; 0 keeps it on the crawl threads, -1 uses one per core
+PARSE_PROCESSES = 0
+
+# Results view: how often the GUI drains crawl results, and how long one drain may block the UI
+RESULTS_POLL_MS = 100
+RESULTS_DRAIN_BUDGET_MS = 30
+RESULTS_MAX_COLUMN_WIDTH = 2000
+
+# robots.txt: how long a host's rules are kept, how soon a failed load is retried, and how many
+# path prefixes per host keep a cached can_fetch answer
+ROBOTS_TTL = 24 * 60 * 60
+ROBOTS_ERROR_TTL = 10 * 60
+ROBOTS_PREFIX_CACHE_SIZE = 10000
+
+# URL handling: normalized URLs kept in memory, and the visited-URL index. 'exact' stores 64-bit
+# fingerprints; 'bloom' uses a fixed-size Bloom filter, kept in a file under URL_BLOOM_DIR if set
+NORMALIZE_CACHE_SIZE = 100000
+URL_INDEX = 'exact'
+URL_BLOOM_CAPACITY = 50 * 1000 * 1000
+URL_BLOOM_ERROR_RATE = 0.001
+URL_BLOOM_DIR = None
+
+# Crawl metrics: where JSON and Prometheus snapshots are written (None turns them off), how often
+# a running crawl rewrites them, and how often the GUI's live panel refreshes
+METRICS_DIR = None
+METRICS_INTERVAL = 5
+METRICS_PANEL_MS = 1000
+
+# Adaptive per-host concurrency: requests in flight per host start at AIMD_INITIAL, grow while
+# the host stays fast and healthy, and are multiplied by AIMD_DECREASE on 429/503, timeouts or
+# latency above AIMD_LATENCY_FACTOR times the host's best. RATE_LIMIT still spaces requests.
+AIMD_INITIAL = 2
+AIMD_MIN = 1
+AIMD_MAX = 32
+AIMD_DECREASE = 0.5
+AIMD_LATENCY_FACTOR = 3.0
+
+# Retries of throttled, failed or timed-out fetches, with jittered exponential backoff
+RETRY_MAX_ATTEMPTS = 4
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 120
+
+# Distributed crawls: coordinator address, frontier shards, shards per host (raise it to spread
+# one large site over several workers), URLs per leased batch, and lease/heartbeat timing
+DIST_ADDRESS = '127.0.0.1:8800'
+DIST_SHARDS = 64
+DIST_HOST_SPLIT = 1
+DIST_BATCH_SIZE = 100
+DIST_LEASE_SECONDS = 300
+DIST_HEARTBEAT_SECONDS = 10
+DIST_WORKER_TIMEOUT = 60
+
+# Sitemap discovery: where to look when robots.txt lists no sitemaps, how many sitemap files
+# (indexes included) one crawl reads at most, the download limit of one file (the protocol allows
+# 50 MB uncompressed), and how many entries at a time go to the result or crawl store
+SITEMAP_PATHS = ('/sitemap.xml', '/sitemap_index.xml', '/sitemap.xml.gz')
+SITEMAP_MAX_FILES = 1000
+SITEMAP_MAX_BYTES = 50 * 1024 * 1024
+SITEMAP_BATCH = 1000
+
+# Duplicate pages: SimHash bits two pages may differ in and still count as near-duplicates, words
+# a page needs before it is compared at all, pages remembered per crawl, how many different pages
+# a query parameter has to leave unchanged (with no counter-example) before the frontier drops it,
+# and one in how many URLs keeps a dropped parameter so the rule keeps being checked
+DEDUP_SIMHASH_DISTANCE = 3
+DEDUP_MIN_TOKENS = 50
+DEDUP_MAX_PAGES = 1000000
+DEDUP_PARAM_MIN_EVIDENCE = 3
+DEDUP_PARAM_SAMPLE = 20
+
+# Contacts-only scans: bytes scanned per step, and the country code given to phone numbers
+# written without one when they are normalized to E.164 (None drops them instead)
+CONTACT_CHUNK_SIZE = 64 * 1024
+CONTACT_DEFAULT_COUNTRY_CODE = '1'
+
+# Image downloads: the default folder for the files and their manifest.jsonl, downloads in flight
+# at once, and the size past which an image is skipped (read from Content-Length when sent)
+IMAGE_DIR = 'images'
+IMAGE_CONCURRENCY = 16
+IMAGE_MAX_BYTES = 20 * 1024 * 1024
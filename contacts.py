@@ -0,0 +1,184 @@
+import codecs
+import html
+import re
+from urllib.parse import unquote
+from config import CONTACT_CHUNK_SIZE, CONTACT_DEFAULT_COUNTRY_CODE
+from extraction import resolve_links
+
+# Longest contact (or href) that can straddle two chunks; this much of each chunk is scanned again.
+# Contacts touching the start of a window, or ending within EDGE of its end, may be cut off, so
+# they are left to the window that holds them whole.
+OVERLAP = 512
+EDGE = 64
+
+# Cheap byte-level anchors: a chunk without any of them cannot hold a contact. Like the patterns
+# below, each starts with a literal so the regex engine jumps between candidates instead of trying
+# a match at every position of the page.
+EMAIL_ANCHORS = (b'@', b'&#64;', b'&#x40;', b'&commat;', b'%40', b'at]', b'at)', b'at}', b'AT]', b'AT)', b'AT}')
+PHONE_ANCHOR_REGEXES = tuple(re.compile(anchor) for anchor in (rb'tel:', rb'\+\s?\d', rb'00\d', rb'\(\d{3}\)', rb'-\d{3}-', rb'\.\d{3}\.'))
+
+EMAIL_DOMAIN_REGEX = re.compile(r'@[a-zA-Z0-9-]+(?:\.[a-zA-Z0-9-]+)+')
+EMAIL_LOCAL_REGEX = re.compile(r'[a-zA-Z0-9_.+-]+$')
+# "name [at] example [dot] com" and friends
+AT_REGEX = re.compile(r'\s*[\[\(\{]\s*at\s*[\]\)\}]\s*', re.IGNORECASE)
+DOT_REGEX = re.compile(r'\s*[\[\(\{]\s*dot\s*[\]\)\}]\s*', re.IGNORECASE)
+OBFUSCATION_MARKERS = ('at]', 'at)', 'at}')
+TEL_REGEX = re.compile(r'tel:([^"\'>]+)(?=["\'>])')
+# International numbers, or (555) 123-4567 / 555-123-4567 / 555.123.4567 style national ones.
+# Separators are required so ids, prices and dates in the markup do not look like phone numbers.
+# Each entry also says how many digits must come right before the match. Matches are greedy and
+# their ends are checked afterwards, so a number running into other text is dropped rather than cut short.
+INTERNATIONAL_PHONE = r'\d{1,3}[\s.-]?(?:\(\d{1,4}\)[\s.-]?)?\d{1,4}(?:[\s.-]\d{2,5}){1,4}'
+PHONE_PATTERNS = (
+    (re.compile(r'\+' + INTERNATIONAL_PHONE), 0),
+    (re.compile(r'00' + INTERNATIONAL_PHONE), 0),
+    (re.compile(r'\(\d{3}\)\s?\d{3}[\s.-]\d{4}'), 0),
+    (re.compile(r'-\d{3}-\d{4}'), 3),
+    (re.compile(r'\.\d{3}\.\d{4}'), 3),
+)
+PHONE_END_REGEX = re.compile(r'[\w/-]|\.\d')
+HREF_REGEX = re.compile(r'href\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))')
+HREF_ANY_CASE_REGEX = re.compile(HREF_REGEX.pattern, re.IGNORECASE)
+# Things that look like emails but are asset names such as logo@2x.png
+ASSET_SUFFIXES = ('.png', '.jpg', '.jpeg', '.gif', '.svg', '.webp', '.css', '.js')
+
+def normalize_email(email):
+    email = email.strip('.').lower()
+    if email.endswith(ASSET_SUFFIXES) or '@' not in email:
+        return None
+    return email
+
+def normalize_phone(phone, country_code=CONTACT_DEFAULT_COUNTRY_CODE):
+    # E.164: a plus, the country code and at most 15 digits
+    phone = phone.strip()
+    digits = re.sub(r'\D', '', phone)
+    if phone.startswith('+'):
+        pass
+    elif digits.startswith('00'):
+        digits = digits[2:]
+    elif country_code:
+        # A national trunk prefix is dropped, except in NANP where a leading 1 is the country code
+        if country_code != '1':
+            digits = country_code + digits.lstrip('0')
+        elif not (len(digits) == 11 and digits.startswith('1')):
+            digits = country_code + digits
+    else:
+        return None
+    if not 8 <= len(digits) <= 15:
+        return None
+    return '+' + digits
+
+def _bounds(text, first, final):
+    # Where a whole contact may start and end inside one window of the page
+    return (0 if first else 1), (len(text) + 1 if final else len(text) - EDGE)
+
+def find_emails(text, first=True, final=True):
+    # Grows each '@' outwards into the domain and the local part
+    lowest, limit = _bounds(text, first, final)
+    at = text.find('@')
+    while at != -1:
+        domain = EMAIL_DOMAIN_REGEX.match(text, at)
+        if domain and domain.end() < limit:
+            local = EMAIL_LOCAL_REGEX.search(text, max(0, at - 64), at)
+            if local and local.start() >= lowest:
+                yield local.group() + domain.group()
+        at = text.find('@', at + 1)
+
+def find_phones(text, first=True, final=True):
+    lowest, limit = _bounds(text, first, final)
+    for pattern, lead in PHONE_PATTERNS:
+        for match in pattern.finditer(text):
+            start = match.start() - lead
+            if match.end() >= limit or start < lowest or (lead and not text[start:match.start()].isdigit()):
+                continue
+            if start and (text[start - 1].isalnum() or text[start - 1] in '_/=#-+'):
+                continue
+            if PHONE_END_REGEX.match(text, match.end()):
+                continue
+            yield text[start:match.end()]
+
+# Finds emails and phone numbers in raw page bytes without building a DOM: each chunk is
+# prefiltered on cheap byte anchors, entities and common obfuscations are decoded, and results
+# are normalized and deduplicated as they are found. Links for crawling come from the href
+# attributes in the same pass.
+class ContactPlan:
+    streaming = True
+
+    def __init__(self, search_emails=True, search_phones=True, base_domain=None, chunk_size=CONTACT_CHUNK_SIZE):
+        self.search_emails = search_emails
+        self.search_phones = search_phones
+        self.base_domain = base_domain
+        self.chunk_size = chunk_size
+        # Kept so the plan can be rebuilt inside parser processes
+        self.spec = dict(search_emails=search_emails, search_phones=search_phones, base_domain=base_domain)
+
+    def _interesting(self, raw):
+        if self.search_emails and any(anchor in raw for anchor in EMAIL_ANCHORS):
+            return True
+        return self.search_phones and any(anchor.search(raw) for anchor in PHONE_ANCHOR_REGEXES)
+
+    def _chunks(self, content, encoding):
+        # Yields (text, interesting, final) per chunk; the anchors are checked over the overlap too
+        if isinstance(content, str):
+            content, encoding = content.encode('utf-8', 'surrogatepass'), 'utf-8'
+        try:
+            decoder = codecs.getincrementaldecoder(encoding or 'utf-8')(errors='replace')
+        except LookupError:
+            decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        view = memoryview(content)
+        raw_tail = b''
+        for start in range(0, len(view), self.chunk_size):
+            chunk = view[start:start + self.chunk_size].tobytes()
+            final = start + self.chunk_size >= len(view)
+            yield decoder.decode(chunk, final=final), self._interesting(raw_tail + chunk), final
+            raw_tail = chunk[-OVERLAP:]
+
+    def _scan(self, text, first, final, emails, phones):
+        if '&' in text:
+            text = html.unescape(text)
+        if self.search_emails:
+            if '%40' in text:
+                text = text.replace('%40', '@')
+            lowered = text.lower()
+            if any(marker in lowered for marker in OBFUSCATION_MARKERS):
+                text_for_emails = DOT_REGEX.sub('.', AT_REGEX.sub('@', text))
+            else:
+                text_for_emails = text
+            for address in find_emails(text_for_emails, first, final):
+                email = normalize_email(address)
+                if email:
+                    emails.add(email)
+        if self.search_phones:
+            for number in TEL_REGEX.findall(text):
+                phone = normalize_phone(unquote(number))
+                if phone:
+                    phones.add(phone)
+            for number in find_phones(text, first, final):
+                phone = normalize_phone(number)
+                if phone:
+                    phones.add(phone)
+
+    def _hrefs(self, window, final, hrefs):
+        pattern = HREF_ANY_CASE_REGEX if 'HREF' in window or 'Href' in window else HREF_REGEX
+        for match in pattern.finditer(window):
+            # An unquoted value that runs into the end of the chunk may be cut off; the overlap
+            # sees it again whole with the next chunk
+            if final or match.end() < len(window):
+                hrefs.add(html.unescape(next(group for group in match.groups() if group is not None)))
+
+    def run(self, url, html_content, stop_event=None, encoding=None):
+        # Working memory is one chunk plus the overlap, however large the page is
+        emails, phones, hrefs = set(), set(), set()
+        tail = ''
+        for text, interesting, final in self._chunks(html_content, encoding):
+            if stop_event is not None and stop_event.is_set():
+                return set(), set()
+            window = tail + text
+            if interesting:
+                self._scan(window, not tail, final, emails, phones)
+            if self.base_domain is not None:
+                self._hrefs(window, final, hrefs)
+            tail = window[-OVERLAP:]
+        data = {(url, email) for email in emails} | {(url, phone) for phone in phones}
+        links = resolve_links(url, hrefs, self.base_domain) if self.base_domain is not None else set()
+        return data, links
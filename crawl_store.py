@@ -0,0 +1,180 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+from config import CRAWL_STORE_DIR
+
+PENDING = 0
+DONE = 1
+# URLs read back per query when a crawl resumes
+READ_BATCH = 10000
+
+SAFE_NAME_REGEX = re.compile(r'[^A-Za-z0-9._-]+')
+
+def content_hash(content):
+    return hashlib.sha1(content).hexdigest()
+
+def site_name(url):
+    # A file name for the site of a URL
+    return SAFE_NAME_REGEX.sub('_', urlparse(url).netloc.lower()) or 'default'
+
+# Persistent frontier and page store, so a crawl can be paused, resumed and cheaply recrawled
+class CrawlStore:
+    def __init__(self, path, commit_every=500, commit_interval=2.0):
+        self.path = path
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS frontier (
+                url TEXT PRIMARY KEY,
+                status INTEGER NOT NULL DEFAULT 0,
+                depth INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS frontier_status ON frontier (status);
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                content_hash TEXT,
+                links TEXT,
+                fetched_at REAL
+            );
+        """)
+        # Stores from before depths were saved resume their URLs at depth 0
+        if 'depth' not in {row[1] for row in self._conn.execute("PRAGMA table_info(frontier)")}:
+            self._conn.execute("ALTER TABLE frontier ADD COLUMN depth INTEGER NOT NULL DEFAULT 0")
+            self._conn.commit()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._last_commit = time.monotonic()
+
+    @classmethod
+    def for_site(cls, url, directory=CRAWL_STORE_DIR):
+        os.makedirs(directory, exist_ok=True)
+        return cls(os.path.join(directory, f"{site_name(url)}.sqlite3"))
+
+    def _write(self, sql, params=()):
+        with self._lock:
+            self._conn.execute(sql, params)
+            self._after_write(1)
+
+    def _write_many(self, sql, rows):
+        with self._lock:
+            cursor = self._conn.executemany(sql, rows)
+            self._after_write(max(cursor.rowcount, 1))
+
+    def _after_write(self, count):
+        self._writes += count
+        if self._writes >= self.commit_every or time.monotonic() - self._last_commit >= self.commit_interval:
+            self._conn.commit()
+            self._writes = 0
+            self._last_commit = time.monotonic()
+
+    def has_pending(self):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM frontier WHERE status = ? LIMIT 1", (PENDING,)).fetchone() is not None
+
+    def start(self, seed_urls):
+        # Resume an interrupted crawl, or start a new pass over the site keeping the page validators
+        if self.has_pending():
+            logging.info(f"Resuming crawl from {self.path}")
+        else:
+            with self._lock:
+                self._conn.execute("DELETE FROM frontier")
+                self._conn.commit()
+            self.add_pending(seed_urls)
+
+    def add_pending(self, urls, depth=0):
+        self._write_many("INSERT OR IGNORE INTO frontier (url, status, depth) VALUES (?, ?, ?)",
+                         [(url, PENDING, depth) for url in urls])
+
+    def mark_done(self, url):
+        self._write("UPDATE frontier SET status = ? WHERE url = ?", (DONE, url))
+
+    def _rows(self, status=None):
+        # (url, depth) a batch at a time by rowid, so a frontier of millions of URLs is never in
+        # memory at once and other threads can use the store in between
+        last = 0
+        while True:
+            with self._lock:
+                if status is None:
+                    rows = self._conn.execute("SELECT rowid, url, depth FROM frontier WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                                              (last, READ_BATCH)).fetchall()
+                else:
+                    rows = self._conn.execute("SELECT rowid, url, depth FROM frontier WHERE status = ? AND rowid > ? ORDER BY rowid LIMIT ?",
+                                              (status, last, READ_BATCH)).fetchall()
+            if not rows:
+                return
+            for _, url, depth in rows:
+                yield url, depth
+            last = rows[-1][0]
+
+    def _urls(self, status=None):
+        for url, _ in self._rows(status):
+            yield url
+
+    def done_count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM frontier WHERE status = ?", (DONE,)).fetchone()[0]
+
+    def pending_entries(self):
+        # (url, depth) of every URL still to visit
+        return self._rows(PENDING)
+
+    def done_urls(self):
+        return self._urls(DONE)
+
+    def frontier_urls(self):
+        return self._urls()
+
+    def page(self, url):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified, content_hash, links FROM pages WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        return {'etag': row[0], 'last_modified': row[1], 'content_hash': row[2],
+                'links': set(json.loads(row[3])) if row[3] else set()}
+
+    def fetched_at(self, url):
+        with self._lock:
+            row = self._conn.execute("SELECT fetched_at FROM pages WHERE url = ?", (url,)).fetchone()
+        return row[0] if row else None
+
+    def conditional_headers(self, url):
+        page = self.page(url)
+        headers = {}
+        if page:
+            if page['etag']:
+                headers['If-None-Match'] = page['etag']
+            if page['last_modified']:
+                headers['If-Modified-Since'] = page['last_modified']
+        return headers
+
+    def save_page(self, url, response, page_hash, links):
+        self._write(
+            "INSERT OR REPLACE INTO pages (url, etag, last_modified, content_hash, links, fetched_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (url, response.headers.get('etag'), response.headers.get('last-modified'), page_hash,
+             json.dumps(sorted(links)), time.time()))
+
+    def touch_page(self, url):
+        self._write("UPDATE pages SET fetched_at = ? WHERE url = ?", (time.time(), url))
+
+    def commit(self):
+        with self._lock:
+            self._conn.commit()
+            self._writes = 0
+            self._last_commit = time.monotonic()
+
+    def close(self):
+        self.commit()
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,151 @@
+import importlib.util
+import logging
+import re
+import threading
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from config import DEDUP_SIMHASH_DISTANCE, DEDUP_MIN_TOKENS, DEDUP_MAX_PAGES, DEDUP_PARAM_MIN_EVIDENCE, DEDUP_PARAM_SAMPLE
+from url_index import FingerprintSet, fingerprint
+
+HAS_NUMPY = importlib.util.find_spec("numpy") is not None
+
+# Markup that never shows up as page text
+INVISIBLE_REGEX = re.compile(r'<(script|style|noscript|template)\b.*?</\1\s*>|<!--.*?-->', re.IGNORECASE | re.DOTALL)
+TAG_REGEX = re.compile(r'<[^>]*>')
+WORD_REGEX = re.compile(r'\w+')
+SHINGLE_SIZE = 3
+MASK_64 = (1 << 64) - 1
+
+def page_tokens(content, encoding=None):
+    # The words of a page's visible text, lowercased; good enough to compare pages without a DOM
+    if isinstance(content, bytes):
+        content = content.decode(encoding or 'utf-8', 'replace')
+    return WORD_REGEX.findall(TAG_REGEX.sub(' ', INVISIBLE_REGEX.sub(' ', content)).lower())
+
+def simhash(tokens):
+    # 64-bit SimHash over word shingles: every bit is the majority vote of that bit across the
+    # shingle hashes, so pages sharing most shingles end up a few bits apart. Python's own string
+    # and tuple hashes are fine here since the index only lives as long as this process.
+    hashes = {hash(shingle) for shingle in zip(*(tokens[i:] for i in range(SHINGLE_SIZE)))} or {hash(tuple(tokens))}
+    if HAS_NUMPY:
+        import numpy
+        values = numpy.fromiter(hashes, dtype=numpy.int64, count=len(hashes)).view(numpy.uint8).reshape(-1, 8)
+        votes = numpy.unpackbits(values, axis=1, bitorder='little').sum(axis=0, dtype=numpy.int64) * 2 > len(hashes)
+        return int.from_bytes(numpy.packbits(votes, bitorder='little').tobytes(), 'little')
+    value = 0
+    for bit in range(64):
+        if sum((shingle >> bit) & 1 for shingle in (h & MASK_64 for h in hashes)) * 2 > len(hashes):
+            value |= 1 << bit
+    return value
+
+def strip_params(url, params):
+    parts = urlsplit(url)
+    if not parts.query or not params:
+        return url
+    query = [(name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True) if name not in params]
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), parts.fragment))
+
+# Remembers the pages of a crawl by an exact hash and a SimHash of their text, to tell which new
+# pages are duplicates or near-duplicates of one already seen. Near-duplicates are found through
+# four 16-bit bands of the SimHash: two hashes at most 3 bits apart agree on at least one band.
+# Pages whose URLs differ in one query parameter also count as evidence about that parameter, and
+# parameters that left enough different pages unchanged, and never changed one, are learned so the
+# frontier can drop them. A fixed sample of URLs keeps learned parameters, and a page of that
+# sample that does change revokes the rule.
+class DuplicateDetector:
+    def __init__(self, distance=DEDUP_SIMHASH_DISTANCE, min_tokens=DEDUP_MIN_TOKENS, max_pages=DEDUP_MAX_PAGES,
+                 min_evidence=DEDUP_PARAM_MIN_EVIDENCE, sample=DEDUP_PARAM_SAMPLE):
+        self.distance = distance
+        self.min_tokens = min_tokens
+        self.max_pages = max_pages
+        self.min_evidence = min_evidence
+        self.sample = sample
+        self._exact = FingerprintSet()
+        self._bands = [{} for _ in range(4)]
+        self._pages = 0
+        # Per host: SimHash of each page by its own URL and by its URL without one parameter,
+        # evidence per parameter (the pages it left unchanged, and how often it changed one), and
+        # the parameters learned so far. Learned sets are replaced rather than changed, since
+        # canonical() reads them without the lock.
+        self._variants = {}
+        self._evidence = {}
+        self._learned = {}
+        self._lock = threading.Lock()
+
+    def _near(self, value):
+        for band, table in enumerate(self._bands):
+            for other in table.get((value >> (16 * band)) & 0xFFFF, ()):
+                if bin(value ^ other).count('1') <= self.distance:
+                    return True
+        return False
+
+    def _add(self, value):
+        if self._pages >= self.max_pages:
+            return
+        self._pages += 1
+        for band, table in enumerate(self._bands):
+            table.setdefault((value >> (16 * band)) & 0xFFFF, []).append(value)
+
+    def check(self, url, content, encoding=None):
+        # 'exact' or 'near' if the page repeats one already seen, otherwise None. Pages with too
+        # little text to tell apart, such as JavaScript shells, are never called duplicates.
+        tokens = page_tokens(content, encoding)
+        if len(tokens) < self.min_tokens:
+            return None
+        exact = fingerprint(' '.join(tokens))
+        value = simhash(tokens)
+        with self._lock:
+            self._learn(url, value)
+            if not self._exact.add_fingerprint(exact):
+                return 'exact'
+            if self._near(value):
+                return 'near'
+            self._add(value)
+            return None
+
+    def _learn(self, url, value):
+        parts = urlsplit(url)
+        host = parts.netloc
+        variants = self._variants.setdefault(host, {})
+        if len(variants) < self.max_pages:
+            variants.setdefault((url, None), value)
+        if not parts.query:
+            return
+        evidence = self._evidence.setdefault(host, {})
+        for name, _ in parse_qsl(parts.query, keep_blank_values=True):
+            without = strip_params(url, {name})
+            # Another page that only differs in this parameter's value, or that lacks it
+            other = variants.get((without, name))
+            if other is None:
+                other = variants.get((without, None))
+            if other is None:
+                if len(variants) < self.max_pages:
+                    variants[(without, name)] = value
+                continue
+            pages, changed = evidence.get(name, (frozenset(), 0))
+            if bin(value ^ other).count('1') > self.distance:
+                evidence[name] = (pages, changed + 1)
+                learned = self._learned.get(host, frozenset())
+                if name in learned:
+                    logging.warning(f"Parameter {name} changes {url} after all; keeping it on {host} from now on")
+                    self._learned[host] = learned - {name}
+                continue
+            if len(pages) < self.min_evidence:
+                # Repeats on one page count once
+                pages = pages | {fingerprint(without)}
+                evidence[name] = (pages, changed)
+            if len(pages) >= self.min_evidence and not changed:
+                learned = self._learned.get(host, frozenset())
+                if name not in learned:
+                    self._learned[host] = learned | {name}
+
+    def canonical(self, url):
+        # The URL without the parameters learned not to change its host's pages. URLs of the sample
+        # keep them, the same ones every time, so that their pages keep testing what was learned.
+        learned = self._learned.get(urlsplit(url).netloc)
+        if not learned or fingerprint(url) % self.sample == 0:
+            return url
+        return strip_params(url, learned)
+
+    def learned_params(self):
+        with self._lock:
+            return {host: sorted(params) for host, params in self._learned.items() if params}
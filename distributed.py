@@ -0,0 +1,561 @@
+import argparse
+import concurrent.futures
+import dataclasses
+import heapq
+import hmac
+import itertools
+import json
+import logging
+import multiprocessing
+import socket
+import socketserver
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from urllib.parse import urlparse
+from config import (DIST_ADDRESS, DIST_SHARDS, DIST_HOST_SPLIT, DIST_BATCH_SIZE, DIST_LEASE_SECONDS,
+                    DIST_HEARTBEAT_SECONDS, DIST_WORKER_TIMEOUT, RETRY_MAX_ATTEMPTS)
+from frontier import UrlRules
+from logging_config import configure_logging
+from options import ScrapeOptions
+from scheduler import RETRY_STATUSES, THROTTLE_STATUSES, backoff_delay, parse_retry_after
+from url_index import fingerprint, new_url_index
+from utils import normalize_url
+
+def shard_for(url, shard_count=DIST_SHARDS, host_split=DIST_HOST_SPLIT):
+    # Every URL of a host lands in the same shard, so one worker at a time is polite to that host.
+    # host_split > 1 spreads one large host over that many shards.
+    host = urlparse(url).netloc
+    key = host if host_split <= 1 else f"{host}#{fingerprint(url) % host_split}"
+    return fingerprint(key) % shard_count
+
+def parse_address(address):
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+class Shard:
+    def __init__(self):
+        self.queue = deque()
+        self.seen = new_url_index()
+        self.owner = None
+        self.leased = 0
+
+class Lease:
+    def __init__(self, lease_id, worker, urls, deadline):
+        self.lease_id = lease_id
+        self.worker = worker
+        self.urls = urls
+        self.deadline = deadline
+
+# Holds the shared frontier: one queue and one URL index per shard, leases of URL batches handed
+# to workers, and the results writer. Leases that are not completed in time go back on the
+# frontier, so every URL is processed at least once even if a worker dies; results of URLs that
+# already completed are dropped, so the output has each page once.
+class Coordinator:
+    def __init__(self, seeds, options, writer, token=None, shard_count=DIST_SHARDS, host_split=DIST_HOST_SPLIT,
+                 lease_seconds=DIST_LEASE_SECONDS, worker_timeout=DIST_WORKER_TIMEOUT):
+        self.options = options
+        self.writer = writer
+        self.token = token
+        self.shard_count = shard_count
+        self.host_split = host_split
+        self.lease_seconds = lease_seconds
+        self.worker_timeout = worker_timeout
+        self.shards = [Shard() for _ in range(shard_count)]
+        self.leases = {}
+        self.workers = {}
+        self.retries = []
+        self.attempts = {}
+        self.completed = new_url_index()
+        self.pages = 0
+        self.rows = 0
+        self.done = threading.Event()
+        self._lock = threading.Lock()
+        # Without --crawl only the seeds themselves are scraped
+        self._follow_links = options.crawl
+        # Include and exclude rules apply to the links followed; flags of single-process crawls
+        # only are refused by parse_args
+        self._rules = UrlRules(options.include, options.exclude)
+        for seed in seeds:
+            self._add(normalize_url(seed))
+
+    def _add(self, url):
+        shard = self.shards[shard_for(url, self.shard_count, self.host_split)]
+        if shard.seen.add(url):
+            shard.queue.append(url)
+            return True
+        return False
+
+    def _alive(self, worker, now):
+        return worker is not None and now - self.workers.get(worker, 0) < self.worker_timeout
+
+    def _expire(self, now):
+        for lease_id, lease in list(self.leases.items()):
+            if lease.deadline < now or not self._alive(lease.worker, now):
+                logging.warning(f"Lease {lease_id} of worker {lease.worker} expired, requeueing {len(lease.urls)} URLs")
+                self._release(lease, requeue=True)
+        while self.retries and self.retries[0][0] <= now:
+            url = heapq.heappop(self.retries)[1]
+            self.shards[shard_for(url, self.shard_count, self.host_split)].queue.append(url)
+
+    def _release(self, lease, requeue=False):
+        del self.leases[lease.lease_id]
+        for url in lease.urls:
+            shard = self.shards[shard_for(url, self.shard_count, self.host_split)]
+            shard.leased -= 1
+            if requeue and url not in self.completed:
+                shard.queue.appendleft(url)
+
+    def _finished(self):
+        return not self.leases and not self.retries and not any(shard.queue for shard in self.shards)
+
+    def hello(self, message):
+        worker = str(uuid.uuid4())
+        with self._lock:
+            self.workers[worker] = time.monotonic()
+        logging.info(f"Worker {worker} joined from {message.get('host', 'unknown host')}")
+        return {'worker': worker, 'options': dataclasses.asdict(self.options), 'host_split': self.host_split,
+                'follow_links': self._follow_links}
+
+    def lease(self, message):
+        worker = message['worker']
+        limit = max(1, int(message.get('max', DIST_BATCH_SIZE)))
+        now = time.monotonic()
+        with self._lock:
+            self.workers[worker] = now
+            self._expire(now)
+            if self._finished():
+                self.done.set()
+                return {'done': True}
+            # A worker keeps its own shards, and takes over shards nobody is working on right now
+            shards = sorted((shard for shard in self.shards if shard.queue and (
+                shard.owner == worker or shard.leased == 0 or not self._alive(shard.owner, now))),
+                key=lambda shard: (shard.owner != worker, -len(shard.queue)))
+            urls = []
+            for shard in shards:
+                shard.owner = worker
+                while shard.queue and len(urls) < limit:
+                    urls.append(shard.queue.popleft())
+                    shard.leased += 1
+                if len(urls) >= limit:
+                    break
+            if not urls:
+                return {'wait': 0.5}
+            lease_id = str(uuid.uuid4())
+            self.leases[lease_id] = Lease(lease_id, worker, urls, now + self.lease_seconds)
+        return {'lease': lease_id, 'urls': urls}
+
+    def heartbeat(self, message):
+        now = time.monotonic()
+        with self._lock:
+            self.workers[message['worker']] = now
+            for lease_id in message.get('leases', []):
+                lease = self.leases.get(lease_id)
+                if lease is not None:
+                    lease.deadline = now + self.lease_seconds
+        return {'ok': True}
+
+    def complete(self, message):
+        with self._lock:
+            self.workers[message['worker']] = time.monotonic()
+            lease = self.leases.get(message['lease'])
+            if lease is None:
+                # Expired and handed to someone else; their results will be used instead
+                return {'ok': False}
+            self._release(lease)
+            new_rows = []
+            for page in message.get('pages', []):
+                url = page['url']
+                if not self.completed.add(url):
+                    continue
+                self.attempts.pop(url, None)
+                self.pages += 1
+                new_rows.extend(tuple(row) for row in page.get('rows', []))
+                if self._follow_links:
+                    new_links = [link for link in page.get('links', []) if self._rules.allows(link) and self._add(link)]
+                    if self.options.crawl_links_only:
+                        new_rows.extend((link,) for link in new_links)
+            for failure in message.get('failed', []):
+                url = failure['url']
+                # Workers already retry with backoff themselves and say how many attempts that took
+                attempt = self.attempts.get(url, 0) + max(1, int(failure.get('attempts', 1)))
+                if attempt > RETRY_MAX_ATTEMPTS:
+                    logging.error(f"Giving up on {url} after {attempt} attempts: {failure.get('error')}")
+                    self.attempts.pop(url, None)
+                    self.completed.add(url)
+                    continue
+                self.attempts[url] = attempt
+                delay = backoff_delay(attempt - 1, failure.get('retry_after'))
+                heapq.heappush(self.retries, (time.monotonic() + delay, url))
+            if new_rows:
+                self.writer.write_rows(new_rows)
+                self.rows += len(new_rows)
+        return {'ok': True}
+
+    def handle(self, message):
+        if self.token and not hmac.compare_digest(str(message.get('token', '')), self.token):
+            return {'error': 'bad token'}
+        handler = {'hello': self.hello, 'lease': self.lease, 'heartbeat': self.heartbeat,
+                   'complete': self.complete}.get(message.get('op'))
+        if handler is None:
+            return {'error': f"unknown op {message.get('op')!r}"}
+        return handler(message)
+
+    def status(self):
+        with self._lock:
+            now = time.monotonic()
+            queued = sum(len(shard.queue) for shard in self.shards)
+            live = sum(1 for worker in self.workers if self._alive(worker, now))
+            return f"{self.pages} pages, {self.rows} rows, {queued} queued, {len(self.leases)} leases out, {live} workers"
+
+class CoordinatorHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = self.server.coordinator.handle(json.loads(line))
+            except (ValueError, KeyError) as e:
+                response = {'error': str(e)}
+            except Exception as e:
+                # Still answered, so the worker sees the failure instead of a dropped connection
+                logging.exception(f"Coordinator failed on {line[:200]!r}")
+                response = {'error': f"internal error: {e!r}"}
+            self.wfile.write(json.dumps(response).encode('utf-8') + b"\n")
+            self.wfile.flush()
+
+class CoordinatorServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, coordinator):
+        super().__init__(address, CoordinatorHandler)
+        self.coordinator = coordinator
+
+def run_coordinator(seeds, options, writer, address=DIST_ADDRESS, token=None, host_split=DIST_HOST_SPLIT):
+    coordinator = Coordinator(seeds, options, writer, token=token, host_split=host_split)
+    server = CoordinatorServer(parse_address(address), coordinator)
+    threading.Thread(target=server.serve_forever, name="coordinator", daemon=True).start()
+    logging.info(f"Coordinator listening on {address} with {len(seeds)} seeds")
+    try:
+        while not coordinator.done.wait(10):
+            logging.info(f"Coordinator: {coordinator.status()}")
+        # Give workers polling for a lease a moment to hear that the crawl is over
+        time.sleep(2)
+    finally:
+        server.shutdown()
+        server.server_close()
+    logging.info(f"Coordinator finished: {coordinator.status()}")
+    return coordinator.pages, coordinator.rows
+
+# One JSON request and one JSON response per line, over one connection shared by the worker's threads
+class CoordinatorClient:
+    def __init__(self, address, token=None):
+        self.token = token
+        self._socket = socket.create_connection(parse_address(address))
+        self._file = self._socket.makefile('rwb')
+        self._lock = threading.Lock()
+
+    def call(self, op, **message):
+        message.update(op=op, token=self.token)
+        with self._lock:
+            self._file.write(json.dumps(message).encode('utf-8') + b"\n")
+            self._file.flush()
+            line = self._file.readline()
+        if not line:
+            raise ConnectionError("Coordinator closed the connection")
+        response = json.loads(line)
+        if 'error' in response:
+            raise RuntimeError(f"Coordinator refused {op}: {response['error']}")
+        return response
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+# Fetches and processes one leased batch with the same fetch engine, robots cache, render policy
+# and extraction as a local crawl, then reports pages, links and failures back. Like a local crawl
+# it keeps each host under its AIMD concurrency limit and robots.txt Crawl-delay, and retries
+# failed fetches with backoff; URLs that run out of attempts or are stopped go back as failures.
+class BatchWorker:
+    def __init__(self, options, host_split=1, follow_links=True):
+        import scraper
+        from fetcher import get_default_fetcher
+        from metrics import CrawlMetrics
+        from render_policy import RenderPolicy
+        from robots import get_default_robots
+        from scheduler import HostController, HostScheduler
+        self.scraper = scraper
+        self.options = options
+        self.follow_links = follow_links
+        self.host_split = max(1, host_split)
+        self.fetcher = get_default_fetcher()
+        self.robots = get_default_robots() if options.respect_robots else None
+        # A host split over several shards may be fetched by that many workers at once
+        self.scheduler = HostScheduler(delay=options.rate_limit * self.host_split, stop_event=scraper.stop_scan_flag)
+        # Shared by the batches in flight, which run on their own threads
+        self.controller = HostController()
+        self._controller_lock = threading.Lock()
+        self._robots_hosts = set()
+        self.render_policy = RenderPolicy()
+        self.metrics = CrawlMetrics()
+        self.driver_pool = None if options.crawl_links_only or options.contacts_only else scraper.new_driver_pool(metrics=self.metrics)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=options.max_threads)
+        self._plans = {}
+
+    def _plan(self, host):
+        plan = self._plans.get(host)
+        if plan is None:
+            base_domain = host if self.follow_links else None
+            plan = self._plans[host] = self.scraper.build_plan(self.options, base_domain=base_domain,
+                                                                links_only=self.options.crawl_links_only)
+        return plan
+
+    def _process(self, url, response):
+        plan = self._plan(urlparse(url).netloc)
+        page_data, links = self.scraper.process_page(url, response, plan, self.options.crawl_links_only, self.driver_pool,
+                                                     self.render_policy, None, self.metrics)
+        return {'url': url, 'rows': [list(row) for row in page_data], 'links': sorted(links)}
+
+    def _allowed(self, url, host):
+        rules = self.robots.get(url)
+        with self._controller_lock:
+            first = host not in self._robots_hosts
+            self._robots_hosts.add(host)
+        if first and rules.crawl_delay:
+            logging.info(f"Using the robots.txt Crawl-delay of {rules.crawl_delay:.1f} seconds for {host}")
+            self.scheduler.set_host_delay(host, rules.crawl_delay * self.host_split)
+        return rules.can_fetch(url)
+
+    def _retry(self, url, attempts, retries, failed, reason, retry_after=None):
+        attempt = attempts.get(url, 0) + 1
+        if attempt > RETRY_MAX_ATTEMPTS or self.scraper.stop_scan_flag.is_set():
+            # The coordinator decides whether the URL gets another worker
+            failed.append({'url': url, 'error': reason, 'retry_after': retry_after, 'attempts': attempt})
+            return
+        attempts[url] = attempt
+        delay = backoff_delay(attempt - 1, retry_after)
+        logging.warning(f"Retrying {url} in {delay:.1f} seconds (attempt {attempt + 1}): {reason}")
+        heapq.heappush(retries, (time.monotonic() + delay, url))
+
+    def run(self, urls):
+        stop = self.scraper.stop_scan_flag
+        pages, failed, processing = [], [], []
+        waiting = deque(urls)
+        fetching = {}
+        retries = []
+        attempts = {}
+        while waiting or fetching or retries:
+            now = time.monotonic()
+            while retries and retries[0][0] <= now:
+                waiting.append(heapq.heappop(retries)[1])
+            if stop.is_set():
+                # Stopped: what has not been fetched yet goes back to the coordinator
+                failed.extend({'url': url, 'error': "stopped", 'attempts': attempts.get(url, 0) + 1}
+                              for url in itertools.chain(waiting, (url for _, url in retries)))
+                waiting.clear()
+                retries.clear()
+            # URLs of hosts at their concurrency limit wait for one of that host's fetches to finish
+            held = deque()
+            while waiting:
+                url = waiting.popleft()
+                host = urlparse(url).netloc
+                if self.robots and not self._allowed(url, host):
+                    pages.append({'url': url, 'rows': [], 'links': []})
+                    continue
+                with self._controller_lock:
+                    acquired = self.controller.acquire(host)
+                if not acquired:
+                    held.append(url)
+                    continue
+                future = self.fetcher.submit(url, delay=self.scheduler.reserve(url), cancel_event=stop)
+                fetching[future] = url
+            waiting = held
+
+            timeout = 0.5 if not retries else min(0.5, max(0.0, retries[0][0] - time.monotonic()))
+            if waiting:
+                # A held host may be freed by the other batch in flight, which this one cannot wait on
+                timeout = min(timeout, 0.1)
+            if not fetching:
+                stop.wait(timeout)
+                continue
+            done, _ = concurrent.futures.wait(fetching, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                url = fetching.pop(future)
+                host = urlparse(url).netloc
+                with self._controller_lock:
+                    self.controller.release(host)
+                try:
+                    response = future.result()
+                except Exception as e:
+                    with self._controller_lock:
+                        self.controller.on_throttle(host)
+                    self._retry(url, attempts, retries, failed, str(e))
+                    continue
+                if response.status in RETRY_STATUSES:
+                    retry_after = parse_retry_after(response.headers.get('retry-after'))
+                    if response.status in THROTTLE_STATUSES:
+                        with self._controller_lock:
+                            self.controller.on_throttle(host)
+                        if retry_after:
+                            self.scheduler.pause(host, retry_after)
+                    self._retry(url, attempts, retries, failed, f"HTTP {response.status}", retry_after)
+                    continue
+                with self._controller_lock:
+                    self.controller.on_success(host, response.elapsed)
+                processing.append((url, self.executor.submit(self._process, url, response)))
+        for url, future in processing:
+            try:
+                pages.append(future.result())
+            except Exception as e:
+                logging.error(f"Failed to process {url}: {e}")
+                pages.append({'url': url, 'rows': [], 'links': []})
+        return pages, failed
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        if self.driver_pool:
+            self.driver_pool.close()
+
+def run_worker(address=DIST_ADDRESS, token=None, batch_size=DIST_BATCH_SIZE, batches=2):
+    client = CoordinatorClient(address, token)
+    hello = client.call('hello', host=socket.gethostname())
+    worker_id = hello['worker']
+    options = ScrapeOptions(**hello['options'])
+    batch_worker = BatchWorker(options, hello['host_split'], hello['follow_links'])
+    stopped = threading.Event()
+    active = set()
+    active_lock = threading.Lock()
+
+    def heartbeat():
+        while not stopped.wait(DIST_HEARTBEAT_SECONDS):
+            with active_lock:
+                leases = list(active)
+            try:
+                client.call('heartbeat', worker=worker_id, leases=leases)
+            except (OSError, RuntimeError) as e:
+                logging.error(f"Heartbeat failed: {e}")
+
+    def work(lease_id, urls):
+        try:
+            pages, failed = batch_worker.run(urls)
+            client.call('complete', worker=worker_id, lease=lease_id, pages=pages, failed=failed)
+        finally:
+            with active_lock:
+                active.discard(lease_id)
+
+    threading.Thread(target=heartbeat, name="heartbeat", daemon=True).start()
+    # Two batches in flight, so the worker fetches the next batch while the last one finishes
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=batches)
+    running = set()
+    pages = 0
+    try:
+        while True:
+            for future in [future for future in running if future.done()]:
+                running.discard(future)
+                # A failed batch stops the worker; its lease expires and the coordinator requeues it
+                future.result()
+            if len(running) >= batches:
+                concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                continue
+            response = client.call('lease', worker=worker_id, max=batch_size)
+            if response.get('done'):
+                break
+            if 'wait' in response:
+                time.sleep(response['wait'])
+                continue
+            with active_lock:
+                active.add(response['lease'])
+            pages += len(response['urls'])
+            running.add(executor.submit(work, response['lease'], response['urls']))
+    finally:
+        stopped.set()
+        executor.shutdown(wait=True)
+        batch_worker.close()
+        client.close()
+    logging.info(f"Worker {worker_id} finished after {pages} leased URLs")
+    return pages
+
+def _worker_process(address, token, batch_size, log_level):
+    configure_logging(filename=None, level=log_level)
+    run_worker(address, token, batch_size)
+
+# Scrape flags a distributed crawl has no support for, as (argument name, flag); the coordinator
+# refuses them instead of crawling without them
+LOCAL_ONLY_FLAGS = (("sitemaps", "--sitemaps"), ("skip_duplicates", "--skip-duplicates"), ("download_images", "--download-images"),
+                    ("resume", "--resume"), ("priority", "--priority"), ("max_depth", "--max-depth"), ("max_pages", "--max-pages"),
+                    ("max_mb", "--max-mb"), ("time_limit", "--time-limit"), ("processes", "--processes"),
+                    ("metrics_dir", "--metrics-dir"), ("profile_dir", "--profile-dir"))
+
+def parse_args(argv=None):
+    from cli import add_scrape_arguments
+    from exporters import EXPORT_FORMATS
+    parser = argparse.ArgumentParser(description="Spread one crawl over worker processes and machines.")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Log debug output")
+    parser.add_argument("--log-file", help="Log to this file instead of stderr")
+    parser.add_argument("--token", help="Shared secret workers must present to the coordinator")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    coordinator = commands.add_parser("coordinator", help="Hold the frontier and write the results")
+    coordinator.add_argument("urls", nargs="*", help="Seed URLs")
+    coordinator.add_argument("-s", "--seeds", help="File with one seed URL per line ('#' starts a comment)")
+    coordinator.add_argument("-o", "--output", required=True, help="File the results are written to")
+    coordinator.add_argument("-f", "--format", choices=sorted(EXPORT_FORMATS), help="Output format (default: from the file extension)")
+    coordinator.add_argument("--bind", default=DIST_ADDRESS, help="host:port to listen on")
+    coordinator.add_argument("--host-split", type=int, default=DIST_HOST_SPLIT, help="Shards each host is spread over")
+    add_scrape_arguments(coordinator)
+
+    worker = commands.add_parser("worker", help="Fetch and process batches leased from a coordinator")
+    worker.add_argument("address", nargs="?", default=DIST_ADDRESS, help="Coordinator host:port")
+    worker.add_argument("--workers", type=int, default=1, help="Worker processes to start on this machine")
+    worker.add_argument("--batch-size", type=int, default=DIST_BATCH_SIZE, help="URLs leased per batch")
+
+    args = parser.parse_args(argv)
+    if args.command == "coordinator":
+        if not args.urls and not args.seeds:
+            coordinator.error("give seed URLs or --seeds FILE")
+        unsupported = [flag for name, flag in LOCAL_ONLY_FLAGS if getattr(args, name) != coordinator.get_default(name)]
+        if unsupported:
+            coordinator.error(f"{', '.join(unsupported)} only work in single-process crawls (cli.py)")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    level = logging.DEBUG if args.verbose else logging.INFO
+    configure_logging(filename=args.log_file, level=level)
+
+    if args.command == "worker":
+        if args.workers <= 1:
+            run_worker(args.address, args.token, args.batch_size)
+            return 0
+        context = multiprocessing.get_context("spawn")
+        processes = [context.Process(target=_worker_process, args=(args.address, args.token, args.batch_size, level))
+                     for _ in range(args.workers)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        return 0 if all(process.exitcode == 0 for process in processes) else 1
+
+    from cli import options_from_args, read_seeds
+    from exporters import format_for_path, open_writer
+    from scraper import DATA_COLUMNS, LINK_COLUMNS
+    seeds = list(args.urls)
+    if args.seeds:
+        seeds.extend(read_seeds(args.seeds))
+    options = options_from_args(args)
+    columns = LINK_COLUMNS if options.crawl and options.crawl_links_only else DATA_COLUMNS
+    writer = open_writer(args.format or format_for_path(args.output), args.output, columns)
+    try:
+        pages, rows = run_coordinator(seeds, options, writer, args.bind, args.token, args.host_split)
+    except KeyboardInterrupt:
+        logging.warning("Interrupted, partial results were written to the output file")
+        return 130
+    finally:
+        writer.close()
+    logging.info(f"Wrote {rows} rows from {pages} pages to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
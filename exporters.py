@@ -0,0 +1,113 @@
+import csv
+import json
+import os
+from itertools import islice
+from config import EXPORT_CHUNK_SIZE
+
+# File extension and dialog filter for each export format
+EXPORT_FORMATS = {
+    'csv': ('.csv', [("CSV files", "*.csv")]),
+    'json': ('.jsonl', [("JSON Lines files", "*.jsonl"), ("JSON files", "*.json")]),
+    'parquet': ('.parquet', [("Parquet files", "*.parquet")]),
+    'excel': ('.xlsx', [("Excel files", "*.xlsx")]),
+}
+
+def _has_data(path):
+    return os.path.exists(path) and os.path.getsize(path) > 0
+
+class CsvWriter:
+    def __init__(self, path, columns, append=False):
+        write_header = not (append and _has_data(path))
+        self._file = open(path, 'a' if append else 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file)
+        if write_header:
+            self._writer.writerow(columns)
+
+    def write_rows(self, rows):
+        self._writer.writerows(rows)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+class JsonLinesWriter:
+    def __init__(self, path, columns, append=False):
+        self.columns = columns
+        self._file = open(path, 'a' if append else 'w', encoding='utf-8')
+
+    def write_rows(self, rows):
+        self._file.writelines(json.dumps(dict(zip(self.columns, row)), ensure_ascii=False) + "\n" for row in rows)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+class ParquetWriter:
+    def __init__(self, path, columns, append=False):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        if append and _has_data(path):
+            raise ValueError("Parquet files cannot be appended to; choose a new file")
+        self._pa = pa
+        self.columns = columns
+        self._schema = pa.schema([(column, pa.string()) for column in columns])
+        self._writer = pq.ParquetWriter(path, self._schema)
+
+    def write_rows(self, rows):
+        rows = list(rows)
+        if rows:
+            arrays = [self._pa.array([row[i] for row in rows], type=self._pa.string()) for i in range(len(self.columns))]
+            # Each chunk becomes its own row group, so memory is bounded by the chunk size
+            self._writer.write_table(self._pa.Table.from_arrays(arrays, schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+class ExcelWriter:
+    def __init__(self, path, columns, append=False):
+        from openpyxl import Workbook
+        if append and _has_data(path):
+            raise ValueError("Excel files cannot be appended to; choose a new file")
+        self.path = path
+        self._workbook = Workbook(write_only=True)
+        self._sheet = self._workbook.create_sheet("Results")
+        self._sheet.append(list(columns))
+
+    def write_rows(self, rows):
+        for row in rows:
+            self._sheet.append(list(row))
+
+    def close(self):
+        self._workbook.save(self.path)
+
+WRITERS = {
+    'csv': CsvWriter,
+    'json': JsonLinesWriter,
+    'parquet': ParquetWriter,
+    'excel': ExcelWriter,
+}
+
+def format_for_path(path):
+    extension = os.path.splitext(path)[1].lower()
+    for export_format, (default_extension, file_types) in EXPORT_FORMATS.items():
+        if extension == default_extension or any(pattern == f"*{extension}" for _, pattern in file_types):
+            return export_format
+    return 'csv'
+
+def open_writer(export_format, path, columns, append=False):
+    return WRITERS[export_format](path, columns, append=append)
+
+def export_rows(rows, export_format, path, columns, chunk_size=EXPORT_CHUNK_SIZE):
+    writer = open_writer(export_format, path, columns)
+    count = 0
+    try:
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            writer.write_rows(chunk)
+            count += len(chunk)
+    finally:
+        writer.close()
+    return count
@@ -0,0 +1,131 @@
+import importlib.util
+import re
+from urllib.parse import urljoin, urlsplit
+from bs4 import BeautifulSoup, SoupStrainer, NavigableString, CData, Tag
+from images import image_sources
+from utils import is_valid_url, normalize_url
+
+# Regular expressions for emails and phone numbers
+EMAIL_REGEX = re.compile(r'[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+')
+PHONE_REGEX = re.compile(r'\+?\(?\d{1,4}\)?[\d\s.-]{5,}')
+
+PARSER = 'lxml' if importlib.util.find_spec("lxml") is not None else 'html.parser'
+
+# Strings that count as page text, the same ones BeautifulSoup's get_text() returns
+TEXT_TYPES = (NavigableString, CData)
+
+def resolve_links(url, hrefs, base_domain):
+    links = set()
+    for href in hrefs:
+        link = urljoin(url, href)
+        parsed_link = urlsplit(link)
+
+        # Ensure the link is within the base domain and not malformed
+        if parsed_link.netloc == base_domain and is_valid_url(link):
+            links.add(normalize_url(link))
+    return links
+
+# The tag, class, attribute, contact and image options compiled once per crawl, then applied to each
+# page in a single parse and a single walk of the document
+class ExtractionPlan:
+    streaming = False
+
+    def __init__(self, tags, classes, attribute, search_emails=False, search_phones=False, scrape_images=False, base_domain=None):
+        # Kept so the plan can be rebuilt inside parser processes
+        self.spec = dict(tags=list(tags), classes=list(classes), attribute=attribute, search_emails=search_emails,
+                         search_phones=search_phones, scrape_images=scrape_images, base_domain=base_domain)
+        self.tags = frozenset(tag.lower() for tag in tags if tag)
+        self.classes = frozenset(classes)
+        self.attribute = attribute
+        self.search_emails = search_emails
+        self.search_phones = search_phones
+        self.scrape_images = scrape_images
+        self.base_domain = base_domain
+        self.needs_text = search_emails or search_phones
+
+        # Without a text search only the selected elements and links need to be built; images can
+        # hide in the style attribute of any element, so they need the whole document
+        names = set(self.tags)
+        if base_domain is not None or search_phones:
+            names.add('a')
+        self.strainer = None if self.needs_text or scrape_images else SoupStrainer(sorted(names))
+
+    def parse(self, html_content, encoding=None):
+        # Raw bytes let the parser honour <meta charset> when the server sent no charset
+        from_encoding = encoding if isinstance(html_content, bytes) else None
+        return BeautifulSoup(html_content, PARSER, parse_only=self.strainer, from_encoding=from_encoding)
+
+    def _matches(self, element):
+        if element.name not in self.tags:
+            return False
+        if not self.classes:
+            return True
+        element_classes = element.get('class') or []
+        return any(cls in self.classes for cls in element_classes) or ' '.join(element_classes) in self.classes
+
+    def run(self, url, html_content, stop_event=None, encoding=None, images=None):
+        return self.run_soup(url, self.parse(html_content, encoding), stop_event, images)
+
+    def run_soup(self, url, soup, stop_event=None, images=None):
+        # Image URLs found are also added to images, if given, for downloading
+        data = set()  # Use a set to collect unique results
+        hrefs = []
+        text_parts = []
+
+        for node in soup.descendants:
+            if not isinstance(node, Tag):
+                if self.needs_text and type(node) in TEXT_TYPES:
+                    text_parts.append(node)
+                continue
+
+            if self._matches(node):
+                if stop_event is not None and stop_event.is_set():
+                    return set(), set()
+                content = node.get_text(strip=True) if self.attribute == "text" else node.get(self.attribute)
+                if content:
+                    data.add((url, content))
+
+            if node.name == 'a':
+                href = node.get('href')
+                if href:
+                    if self.search_phones and href.startswith('tel:'):
+                        data.add((url, href.replace('tel:', '').strip()))
+                    hrefs.append(href)
+            if self.scrape_images:
+                for source in image_sources(node):
+                    image_url = urljoin(url, source)
+                    if image_url.startswith(('http://', 'https://')):
+                        data.add((url, image_url))
+                        if images is not None:
+                            images.add(image_url)
+
+        # Extracting emails and phone numbers if requested
+        if text_parts:
+            text = ''.join(text_parts)
+            if self.search_emails:
+                data.update((url, email) for email in EMAIL_REGEX.findall(text))
+            if self.search_phones:
+                data.update((url, phone) for phone in PHONE_REGEX.findall(text))
+
+        links = resolve_links(url, hrefs, self.base_domain) if self.base_domain is not None else set()
+        return data, links
+
+# Parser process side: each process builds the crawl's plan once, then turns page bytes into
+# compact (data, links) sets so only those cross back to the crawl process
+_worker_plan = None
+
+def init_worker(spec):
+    global _worker_plan
+    if 'tags' in spec:
+        _worker_plan = ExtractionPlan(**spec)
+    else:
+        from contacts import ContactPlan
+        _worker_plan = ContactPlan(**spec)
+
+def extract_in_worker(url, html_content, encoding=None, with_images=False):
+    # With with_images the image URLs come back as a third set
+    if not with_images:
+        return _worker_plan.run(url, html_content, encoding=encoding)
+    images = set()
+    data, links = _worker_plan.run(url, html_content, encoding=encoding, images=images)
+    return data, links, images
@@ -0,0 +1,255 @@
+import asyncio
+import concurrent.futures
+import importlib.util
+import logging
+import re
+import threading
+import time
+from config import HEADERS, MAX_THREADS, FETCH_ENGINE, FETCH_CONCURRENCY, FETCH_MAX_BYTES, FETCH_TIMEOUTS
+
+CHARSET_REGEX = re.compile(r'charset=["\']?([\w.:-]+)', re.IGNORECASE)
+CHUNK_SIZE = 64 * 1024
+
+HAS_HTTPX = importlib.util.find_spec("httpx") is not None
+HAS_HTTP2 = importlib.util.find_spec("h2") is not None
+HAS_BROTLI = importlib.util.find_spec("brotli") is not None or importlib.util.find_spec("brotlicffi") is not None
+
+ACCEPT_ENCODING = "br, gzip, deflate" if HAS_BROTLI else "gzip, deflate"
+
+class FetchError(Exception):
+    def __init__(self, message, status=None, result=None):
+        super().__init__(message)
+        self.status = status
+        self.result = result
+
+class FetchResult:
+    def __init__(self, url, final_url, status, headers, content, elapsed, http_version="HTTP/1.1", truncated=False):
+        self.url = url
+        self.final_url = final_url
+        self.status = status
+        self.headers = {key.lower(): value for key, value in headers.items()}
+        self.content = content
+        self.elapsed = elapsed
+        self.http_version = http_version
+        self.truncated = truncated
+
+    @property
+    def declared_encoding(self):
+        match = CHARSET_REGEX.search(self.headers.get('content-type', ''))
+        return match.group(1) if match else None
+
+    @property
+    def encoding(self):
+        return self.declared_encoding or 'utf-8'
+
+    @property
+    def text(self):
+        try:
+            return self.content.decode(self.encoding, errors='replace')
+        except LookupError:
+            return self.content.decode('utf-8', errors='replace')
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise FetchError(f"HTTP {self.status} for url: {self.url}", status=self.status, result=self)
+
+def build_headers(extra_headers=None):
+    headers = dict(HEADERS)
+    headers['Accept-Encoding'] = ACCEPT_ENCODING
+    if extra_headers:
+        headers.update(extra_headers)
+    return headers
+
+def _too_large(headers, max_bytes):
+    length = headers.get('content-length')
+    return max_bytes is not None and length is not None and length.isdigit() and int(length) > max_bytes
+
+def _sleep(delay, cancel_event=None):
+    if delay <= 0:
+        return True
+    if cancel_event is not None:
+        return not cancel_event.wait(delay)
+    time.sleep(delay)
+    return True
+
+# Blocking engine: a pooled keep-alive requests.Session driven from a thread pool
+class SessionFetcher:
+    def __init__(self, max_workers=MAX_THREADS, max_bytes=FETCH_MAX_BYTES, timeouts=FETCH_TIMEOUTS):
+        import requests
+        from requests.adapters import HTTPAdapter
+        self._requests = requests
+        self.max_in_flight = max_workers * 2
+        self.max_bytes = max_bytes
+        self.timeout = (timeouts['connect'], timeouts['read'])
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=100, pool_maxsize=max_workers, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+
+    def fetch(self, url, headers=None, delay=0, cancel_event=None):
+        if not _sleep(delay, cancel_event):
+            raise FetchError(f"Fetch of {url} cancelled")
+        start = time.monotonic()
+        try:
+            with self.session.get(url, headers=build_headers(headers), timeout=self.timeout, stream=True) as response:
+                chunks, size, truncated = [], 0, False
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        chunks.append(chunk[:len(chunk) - (size - self.max_bytes)])
+                        truncated = True
+                        break
+                    chunks.append(chunk)
+                return FetchResult(url, response.url, response.status_code, response.headers, b''.join(chunks),
+                                   time.monotonic() - start, truncated=truncated)
+        except self._requests.exceptions.RequestException as e:
+            raise FetchError(f"Request failed: {e}") from e
+
+    def submit(self, url, headers=None, delay=0, cancel_event=None):
+        return self._executor.submit(self.fetch, url, headers, delay, cancel_event)
+
+    def download(self, url, sink, max_bytes=None, headers=None, delay=0, cancel_event=None):
+        # Streams a 200 response's body into sink.write() instead of memory. A body the server says
+        # is over max_bytes is never read, and one that turns out larger is cut off; both come back
+        # truncated with whatever was written.
+        if not _sleep(delay, cancel_event):
+            raise FetchError(f"Fetch of {url} cancelled")
+        start = time.monotonic()
+        try:
+            with self.session.get(url, headers=build_headers(headers), timeout=self.timeout, stream=True) as response:
+                truncated = _too_large(response.headers, max_bytes)
+                if response.status_code == 200 and not truncated:
+                    size = 0
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        size += len(chunk)
+                        if max_bytes is not None and size > max_bytes:
+                            truncated = True
+                            break
+                        sink.write(chunk)
+                return FetchResult(url, response.url, response.status_code, response.headers, b'',
+                                   time.monotonic() - start, truncated=truncated)
+        except self._requests.exceptions.RequestException as e:
+            raise FetchError(f"Request failed: {e}") from e
+
+    def submit_download(self, url, sink, max_bytes=None, headers=None, delay=0, cancel_event=None):
+        return self._executor.submit(self.download, url, sink, max_bytes, headers, delay, cancel_event)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+# Non-blocking engine: one httpx.AsyncClient on a background event loop, so thousands of requests
+# can be in flight with pooled, multiplexed connections
+class AsyncFetcher:
+    def __init__(self, concurrency=FETCH_CONCURRENCY, max_bytes=FETCH_MAX_BYTES, timeouts=FETCH_TIMEOUTS):
+        self.max_in_flight = concurrency
+        self.max_bytes = max_bytes
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="fetch-engine", daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(concurrency, timeouts), self._loop).result()
+
+    async def _start(self, concurrency, timeouts):
+        import httpx
+        logging.getLogger("httpx").setLevel(logging.WARNING)  # httpx logs every request at INFO
+        self._httpx = httpx
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._client = httpx.AsyncClient(
+            http2=HAS_HTTP2,
+            follow_redirects=True,
+            timeout=httpx.Timeout(connect=timeouts['connect'], read=timeouts['read'],
+                                  write=timeouts['write'], pool=timeouts['pool']),
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency,
+                                keepalive_expiry=30),
+        )
+
+    async def _cancellable_sleep(self, delay, cancel_event):
+        deadline = time.monotonic() + delay
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                return False
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return True
+            await asyncio.sleep(min(remaining, 0.25))
+
+    async def _fetch(self, url, headers, delay, cancel_event):
+        if delay > 0 and not await self._cancellable_sleep(delay, cancel_event):
+            raise FetchError(f"Fetch of {url} cancelled")
+        async with self._semaphore:
+            start = time.monotonic()
+            try:
+                async with self._client.stream('GET', url, headers=build_headers(headers)) as response:
+                    chunks, size, truncated = [], 0, False
+                    async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                        size += len(chunk)
+                        if size > self.max_bytes:
+                            chunks.append(chunk[:len(chunk) - (size - self.max_bytes)])
+                            truncated = True
+                            break
+                        chunks.append(chunk)
+                    return FetchResult(url, str(response.url), response.status_code, response.headers, b''.join(chunks),
+                                       time.monotonic() - start, response.http_version, truncated)
+            except Exception as e:
+                # HTTPError, and also InvalidURL, StreamError and what badly formed URLs raise while
+                # being parsed; cancellation is a BaseException and goes through
+                raise FetchError(f"Request failed: {e!r}") from e
+
+    def submit(self, url, headers=None, delay=0, cancel_event=None):
+        return asyncio.run_coroutine_threadsafe(self._fetch(url, headers, delay, cancel_event), self._loop)
+
+    async def _download(self, url, sink, max_bytes, headers, delay, cancel_event):
+        if delay > 0 and not await self._cancellable_sleep(delay, cancel_event):
+            raise FetchError(f"Fetch of {url} cancelled")
+        async with self._semaphore:
+            start = time.monotonic()
+            try:
+                async with self._client.stream('GET', url, headers=build_headers(headers)) as response:
+                    truncated = _too_large(response.headers, max_bytes)
+                    if response.status_code == 200 and not truncated:
+                        size = 0
+                        async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                            size += len(chunk)
+                            if max_bytes is not None and size > max_bytes:
+                                truncated = True
+                                break
+                            # Writing and hashing happen off the loop, so page fetches are not held up
+                            await self._loop.run_in_executor(None, sink.write, chunk)
+                    return FetchResult(url, str(response.url), response.status_code, response.headers, b'',
+                                       time.monotonic() - start, response.http_version, truncated)
+            except Exception as e:
+                # HTTPError, and also InvalidURL, StreamError and what badly formed URLs raise while
+                # being parsed; cancellation is a BaseException and goes through
+                raise FetchError(f"Request failed: {e!r}") from e
+
+    def submit_download(self, url, sink, max_bytes=None, headers=None, delay=0, cancel_event=None):
+        # Same contract as SessionFetcher.download(); sink.write() runs on the loop's default executor,
+        # one chunk at a time
+        return asyncio.run_coroutine_threadsafe(self._download(url, sink, max_bytes, headers, delay, cancel_event), self._loop)
+
+    def fetch(self, url, headers=None, delay=0, cancel_event=None):
+        return self.submit(url, headers, delay, cancel_event).result()
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self._client.aclose(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+def get_fetcher(engine=FETCH_ENGINE):
+    if engine == 'async':
+        if HAS_HTTPX:
+            return AsyncFetcher()
+        logging.warning("httpx is not installed, falling back to the requests fetch engine")
+    return SessionFetcher()
+
+_default_fetcher = None
+_default_lock = threading.Lock()
+
+# One engine per process, so robots.txt, the anti-scraping probe and the crawl share connections
+def get_default_fetcher():
+    global _default_fetcher
+    with _default_lock:
+        if _default_fetcher is None:
+            _default_fetcher = get_fetcher()
+        return _default_fetcher
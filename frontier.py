@@ -0,0 +1,169 @@
+import heapq
+import itertools
+import re
+import time
+from urllib.parse import urlsplit
+
+# Which URLs a crawl follows and which it visits first. Exclude patterns win over include
+# patterns, and with include patterns a URL has to match one of them. Priority patterns add their
+# weight to the URLs they match; several matches add up.
+class UrlRules:
+    def __init__(self, include=(), exclude=(), priorities=None):
+        self.include = [re.compile(pattern) for pattern in include or ()]
+        self.exclude = [re.compile(pattern) for pattern in exclude or ()]
+        self.priorities = [(re.compile(pattern), float(weight)) for pattern, weight in (priorities or {}).items()]
+
+    def allows(self, url):
+        if any(pattern.search(url) for pattern in self.exclude):
+            return False
+        return not self.include or any(pattern.search(url) for pattern in self.include)
+
+    def priority(self, url):
+        return sum(weight for pattern, weight in self.priorities if pattern.search(url))
+
+# Rank of URLs pushed without one. Ranks are (float, float) pairs that order URLs of the same
+# priority and depth before the order they were found in, e.g. sitemap pages by their own priority.
+NO_RANK = (0.0, 0.0)
+
+# The URLs still to visit, highest priority first, then shallowest first, then by rank, in the
+# order they were found otherwise. Every host has its own queue, and a host at its concurrency limit is
+# held until release(), so its URLs keep their place instead of holding up other hosts. The entry
+# of every URL stays known until the crawl is done with it: a held URL goes back with the same
+# entry, a requeued one keeps its depth and rank, and its links are one level deeper.
+class Frontier:
+    def __init__(self, rules=None, max_depth=None):
+        self.rules = rules or UrlRules()
+        self.max_depth = max_depth
+        self._queues = {}
+        # (best entry key, host) of every host that may be popped from; entries for hosts that have
+        # been held or have popped their best URL since are skipped
+        self._hosts = []
+        self._held = set()
+        self._order = itertools.count()
+        # Heap entry of every URL queued or popped and not done yet
+        self._entries = {}
+        self._size = 0
+
+    def accepts(self, url, depth):
+        return (self.max_depth is None or depth <= self.max_depth) and self.rules.allows(url)
+
+    def push(self, url, depth=0, rank=NO_RANK):
+        self._push((-self.rules.priority(url), depth, rank, next(self._order), url))
+
+    def _push(self, entry):
+        url = entry[4]
+        self._entries[url] = entry
+        host = urlsplit(url).netloc
+        queue = self._queues.setdefault(host, [])
+        heapq.heappush(queue, entry)
+        self._size += 1
+        if queue[0] is entry and host not in self._held:
+            heapq.heappush(self._hosts, (entry[:4], host))
+
+    def extend(self, urls, depth=0):
+        for url in urls:
+            self.push(url, depth)
+
+    def requeue(self, url):
+        # Back in line at its own depth and rank, behind what is already queued there, e.g. after
+        # a failed fetch or while robots.txt loaded
+        entry = self._entries.get(url)
+        if entry is None:
+            self.push(url)
+        else:
+            self.push(url, entry[1], entry[2])
+
+    def pop(self):
+        # The best URL of any host not held, or None
+        while self._hosts:
+            key, host = heapq.heappop(self._hosts)
+            queue = self._queues.get(host)
+            if host in self._held or not queue or queue[0][:4] != key:
+                continue
+            url = heapq.heappop(queue)[4]
+            self._size -= 1
+            if queue:
+                heapq.heappush(self._hosts, (queue[0][:4], host))
+            else:
+                del self._queues[host]
+            return url
+        return None
+
+    def hold(self, url):
+        # Puts a URL back whose host is at its limit, in its old place, and skips the host until
+        # it is released
+        self._held.add(urlsplit(url).netloc)
+        entry = self._entries.get(url)
+        if entry is None:
+            self.push(url)
+        else:
+            self._push(entry)
+
+    def release(self, host):
+        if host in self._held:
+            self._held.discard(host)
+            queue = self._queues.get(host)
+            if queue:
+                heapq.heappush(self._hosts, (queue[0][:4], host))
+
+    def depth(self, url):
+        entry = self._entries.get(url)
+        return entry[1] if entry else 0
+
+    def rename(self, url, new_url):
+        # For a popped URL that is fetched under another name
+        entry = self._entries.pop(url, None)
+        if entry is not None:
+            self._entries[new_url] = entry[:4] + (new_url,)
+
+    def done(self, url):
+        self._entries.pop(url, None)
+
+    def clear(self):
+        self._queues.clear()
+        self._hosts.clear()
+        self._held.clear()
+        self._entries.clear()
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        for queue in self._queues.values():
+            for entry in queue:
+                yield entry[4]
+
+# Hard limits of one crawl; None leaves a limit off. Pages counts fetches started and bytes the
+# page bodies downloaded.
+class CrawlBudget:
+    def __init__(self, max_pages=None, max_bytes=None, max_seconds=None):
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.start = time.monotonic()
+        self.pages = 0
+        self.bytes = 0
+
+    def _usage(self):
+        # (name, used, limit) of every limit that is set
+        usage = []
+        if self.max_pages is not None:
+            usage.append(("page", self.pages, self.max_pages))
+        if self.max_bytes is not None:
+            usage.append(("byte", self.bytes, self.max_bytes))
+        if self.max_seconds is not None:
+            usage.append(("time", time.monotonic() - self.start, self.max_seconds))
+        return usage
+
+    def exhausted(self):
+        # The name of the first limit reached, or None
+        return next((name for name, used, limit in self._usage() if used >= limit), None)
+
+    def progress(self):
+        # (used, limit) of the limit closest to running out, or None without limits
+        usage = self._usage()
+        if not usage:
+            return None
+        _, used, limit = max(usage, key=lambda item: item[1] / item[2] if item[2] else 1.0)
+        return min(used, limit), limit
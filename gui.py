@@ -0,0 +1,177 @@
+import logging
+import threading
+import time
+import tkinter as tk  # Required for tk.END
+from tkinter import filedialog, messagebox
+from utils import flash_paypal_button
+from config import METRICS_PANEL_MS, IMAGE_DIR
+from metrics import CrawlMetrics
+from options import ScrapeOptions, split_list
+from scraper import stop_scan_flag, check_anti_scraping, run_scrape, DATA_COLUMNS, LINK_COLUMNS
+from exporters import EXPORT_FORMATS, export_rows, format_for_path, open_writer
+from result_store import ResultStore
+
+# Results of the last run, kept so exports never have to crawl again. The rows stay in their
+# result store and are read back a page at a time; a store is not closed here since its scrape
+# may still be adding to it, and goes away with its temporary file once nothing refers to it.
+last_results = {'columns': DATA_COLUMNS, 'rows': None}
+
+def read_limit(var, kind=int):
+    # An empty entry leaves the limit off; anything else has to be a positive number
+    text = var.get().strip() if var is not None else ''
+    if not text:
+        return None
+    value = kind(text)
+    if value <= 0:
+        raise ValueError(f"{text} is not a positive number")
+    return value
+
+def read_options(tags_combobox, classes_combobox, attribute_choice, crawl_option, crawl_links_var, scrape_images_var, load_robots_var, search_emails_var, search_phones_var, rate_limit_scale=None, resume_var=None, contacts_only_var=None, sitemaps_var=None, duplicates_var=None, download_images_var=None, max_depth_var=None, max_pages_var=None, time_limit_var=None):
+    time_limit = read_limit(time_limit_var, float)
+    download_images = download_images_var is not None and download_images_var.get() == 1
+    options = ScrapeOptions(
+        tags=split_list(tags_combobox.get()),
+        classes=split_list(classes_combobox.get()),
+        attribute=attribute_choice.get(),
+        crawl=crawl_option.get() == 1,
+        crawl_links_only=crawl_links_var.get() == 1,
+        scrape_images=scrape_images_var.get() == 1 or download_images,
+        image_dir=IMAGE_DIR if download_images else None,
+        respect_robots=load_robots_var.get() == 1,
+        search_emails=search_emails_var.get() == 1,
+        search_phones=search_phones_var.get() == 1,
+        resume=resume_var is not None and resume_var.get() == 1,
+        contacts_only=contacts_only_var is not None and contacts_only_var.get() == 1,
+        use_sitemaps=sitemaps_var is not None and sitemaps_var.get() == 1,
+        skip_duplicates=duplicates_var is not None and duplicates_var.get() == 1,
+        max_depth=read_limit(max_depth_var),
+        max_pages=read_limit(max_pages_var),
+        time_limit=None if time_limit is None else time_limit * 60,
+    )
+    if rate_limit_scale is not None:
+        options.rate_limit = float(rate_limit_scale.get())
+    return options
+
+def log_message(verbose_output, message):
+    verbose_output.insert(tk.END, f"{message}\n")
+    verbose_output.see(tk.END)
+
+def show_metrics(metrics_label, metrics, finished):
+    # Refreshes the live metrics panel until the scrape thread says it is done
+    metrics_label.config(text=metrics.summary())
+    if not finished.is_set():
+        metrics_label.after(METRICS_PANEL_MS, show_metrics, metrics_label, metrics, finished)
+
+def scrape_data(url_entry, tags_combobox, classes_combobox, attribute_choice, crawl_option, crawl_links_var, scrape_images_var, load_robots_var, search_emails_var, search_phones_var, progress_bar, verbose_output, stats_label, results_view, donate_button, rate_limit_scale=None, resume_var=None, live_export_var=None, metrics_label=None, contacts_only_var=None, sitemaps_var=None, duplicates_var=None, download_images_var=None, max_depth_var=None, max_pages_var=None, time_limit_var=None):
+    stop_scan_flag.clear()
+    progress_bar['value'] = 0
+
+    # Read every widget here, on the GUI thread, so the scrape itself never touches tkinter state
+    url = url_entry.get()
+    try:
+        options = read_options(tags_combobox, classes_combobox, attribute_choice, crawl_option, crawl_links_var, scrape_images_var, load_robots_var, search_emails_var, search_phones_var, rate_limit_scale, resume_var, contacts_only_var, sitemaps_var, duplicates_var, download_images_var,
+                               max_depth_var, max_pages_var, time_limit_var)
+    except ValueError as e:
+        messagebox.showerror("Invalid Crawl Budget", f"Budgets take whole depths and page counts and minutes, or nothing: {e}")
+        return
+
+    # Ask for the live export file up front
+    live_export_path = None
+    if live_export_var is not None and live_export_var.get() == 1:
+        live_export_path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[
+            ("CSV files", "*.csv"), ("JSON Lines files", "*.jsonl")])
+        if not live_export_path:
+            return
+
+    # The view reads the new run's rows from its store while the scrape thread adds them
+    results = ResultStore()
+    last_results.update(columns=LINK_COLUMNS if options.crawl and options.crawl_links_only else DATA_COLUMNS, rows=results)
+    results_view.clear(results)
+
+    metrics = CrawlMetrics()
+    finished = threading.Event()
+    if metrics_label is not None:
+        show_metrics(metrics_label, metrics, finished)
+
+    thread = threading.Thread(target=_scrape_data_thread, args=(
+        url, options, progress_bar, verbose_output, stats_label, results_view, donate_button, live_export_path, metrics, finished, results
+    ))
+    thread.start()
+
+def _scrape_data_thread(url, options, progress_bar, verbose_output, stats_label, results_view, donate_button, live_export_path=None, metrics=None, finished=None, results=None):
+    # Runs off the GUI thread: every widget update goes through the results view's queue
+    try:
+        # Check for anti-scraping measures
+        is_blocked, message = check_anti_scraping(url)
+        results_view.call_soon(log_message, verbose_output, message)
+        if is_blocked:
+            results_view.call_soon(stats_label.config, {'text': "Scraping aborted: Anti-scraping measures detected."})
+            return
+
+        metrics = metrics or CrawlMetrics()
+
+        start_time = time.time()
+        columns = LINK_COLUMNS if options.crawl and options.crawl_links_only else DATA_COLUMNS
+        # The save dialog already confirmed replacing the file; only a resumed crawl adds to it
+        live_writer = open_writer(format_for_path(live_export_path), live_export_path, columns, append=options.resume) if live_export_path else None
+
+        def on_rows(rows):
+            results_view.put_rows(rows)
+            if live_writer:
+                live_writer.write_rows(rows)
+
+        try:
+            columns, rows = run_scrape(url, options, on_progress=results_view.put_progress, on_rows=on_rows, metrics=metrics, results=results)
+        finally:
+            if live_writer:
+                live_writer.close()
+
+        end_time = time.time()
+        elapsed_time = end_time - start_time
+        results_view.call_soon(_scrape_finished, columns, rows, elapsed_time, progress_bar, stats_label, results_view, donate_button, metrics.total("pages"))
+    except Exception as e:
+        # Shown in the window like a blocked site, with the traceback in the log file
+        logging.exception(f"Scrape of {url} failed")
+        results_view.call_soon(log_message, verbose_output, f"Scrape failed: {e}")
+        results_view.call_soon(stats_label.config, {'text': f"Scraping failed: {e}"})
+        results_view.call_soon(progress_bar.configure, {'value': 0})
+    finally:
+        if finished is not None:
+            finished.set()
+
+def _scrape_finished(columns, rows, elapsed_time, progress_bar, stats_label, results_view, donate_button, pages):
+    if not rows:
+        messagebox.showwarning("No Data", "No data found with the specified parameters.")
+
+    stats_label.config(text=f"Pages crawled: {pages} | Rows: {len(rows)} | Time taken: {elapsed_time:.2f} seconds")
+
+    flash_paypal_button(donate_button)
+
+    progress_bar['value'] = 0
+
+def export_data(export_format):
+    # Exports read the results of the last run instead of crawling the site again
+    rows = last_results['rows']
+    if not rows:
+        messagebox.showwarning("No Data", "Nothing to export yet. Scrape some data first.")
+        return
+    extension, file_types = EXPORT_FORMATS[export_format]
+    file_path = filedialog.asksaveasfilename(defaultextension=extension, filetypes=file_types)
+    if file_path:
+        try:
+            count = export_rows(rows, export_format, file_path, last_results['columns'])
+        except (ImportError, ValueError, OSError) as e:
+            messagebox.showerror("Export Failed", f"Could not export as {export_format.upper()}: {e}")
+            return
+        messagebox.showinfo("Success", f"{count} rows exported successfully as {export_format.upper()}.")
+
+def stop_scan(verbose_output):
+    stop_scan_flag.set()  # Signal threads to stop
+    verbose_output.insert(tk.END, "Stop button pressed, stopping scan...\n")
+    verbose_output.see(tk.END)
+
+def clear_results(results_view, verbose_output):
+    last_results['rows'] = None
+    results_view.clear()
+    verbose_output.delete(1.0, tk.END)
+    verbose_output.insert(tk.END, "Results cleared.\n")
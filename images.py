@@ -0,0 +1,269 @@
+import concurrent.futures
+import functools
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+import tempfile
+import threading
+from collections import deque
+from urllib.parse import urlsplit
+from config import IMAGE_DIR, IMAGE_CONCURRENCY, IMAGE_MAX_BYTES
+from url_index import FingerprintSet
+
+# Attributes lazy-loading scripts keep the real image URL in until it scrolls into view
+SOURCE_ATTRIBUTES = ('src', 'data-src', 'data-lazy-src', 'data-original')
+SRCSET_ATTRIBUTES = ('srcset', 'data-srcset')
+# background: and background-image: declarations, and the url() values in them; fonts and
+# @imports use url() too and are left alone
+BACKGROUND_REGEX = re.compile(r'background(?:-image)?\s*:([^;}]*)', re.IGNORECASE)
+CSS_URL_REGEX = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)', re.IGNORECASE)
+MANIFEST_NAME = 'manifest.jsonl'
+
+def largest_srcset_candidate(srcset):
+    # The candidate with the largest width or density descriptor; URLs may hold commas, but never
+    # whitespace, so a candidate ends at a comma after its URL and descriptors
+    best, best_size = None, -1.0
+    position, length = 0, len(srcset)
+    while position < length:
+        while position < length and (srcset[position].isspace() or srcset[position] == ','):
+            position += 1
+        end = position
+        while end < length and not srcset[end].isspace():
+            end += 1
+        url = srcset[position:end]
+        if url.endswith(','):
+            url, descriptor = url.rstrip(','), ''
+            position = end
+        else:
+            comma = srcset.find(',', end)
+            comma = length if comma == -1 else comma
+            descriptor = srcset[end:comma].strip()
+            position = comma + 1
+        try:
+            size = float(descriptor[:-1]) if descriptor[-1:] in ('w', 'x') else 1.0
+        except ValueError:
+            size = 1.0
+        if url and size > best_size:
+            best, best_size = url, size
+    return best
+
+def css_image_urls(css):
+    for declaration in BACKGROUND_REGEX.finditer(css):
+        for match in CSS_URL_REGEX.finditer(declaration.group(1)):
+            yield match.group(2).strip()
+
+def image_sources(node):
+    # The image URLs one element refers to, unresolved: src and its lazy-loading stand-ins, the
+    # largest srcset candidate (<picture> sources included), and CSS backgrounds in style
+    # attributes and <style> blocks
+    if node.name == 'img':
+        for name in SOURCE_ATTRIBUTES:
+            value = node.get(name)
+            if value:
+                yield value.strip()
+    if node.name in ('img', 'source'):
+        for name in SRCSET_ATTRIBUTES:
+            value = node.get(name)
+            if value:
+                candidate = largest_srcset_candidate(value)
+                if candidate:
+                    yield candidate
+    style = node.get('style')
+    if style and 'url(' in style:
+        yield from css_image_urls(style)
+    if node.name == 'style' and node.string:
+        yield from css_image_urls(node.string)
+
+def file_extension(content_type, url):
+    extension = os.path.splitext(urlsplit(url).path)[1].lower()
+    if content_type:
+        guessed = mimetypes.guess_extension(content_type.split(';')[0].strip())
+        if guessed:
+            # mimetypes' first pick for image/jpeg varies between Pythons
+            return '.jpg' if guessed in ('.jpe', '.jpeg') else guessed
+    return extension if 1 < len(extension) <= 6 else ''
+
+# Writes a download to a temporary file and hashes it on the way
+class HashingFile:
+    def __init__(self, directory):
+        self._file = tempfile.NamedTemporaryFile(dir=directory, suffix='.part', delete=False)
+        self.path = self._file.name
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, chunk):
+        self._file.write(chunk)
+        self.sha256.update(chunk)
+        self.size += len(chunk)
+
+    def close(self):
+        self._file.close()
+
+    def discard(self):
+        self._file.close()
+        os.remove(self.path)
+
+# Downloads the images a crawl finds on the fetch engine's pooled connections, at most
+# concurrency at a time. Every image URL is requested once per image directory, since the
+# manifest of earlier runs is read back on start. Files are named by the SHA-256 of their content,
+# so the same image behind different URLs is stored once, and every URL gets a manifest line
+# saying what became of it, 'skipped' for the ones a stopped crawl never started.
+class ImageDownloader:
+    def __init__(self, directory=IMAGE_DIR, fetcher=None, scheduler=None, concurrency=IMAGE_CONCURRENCY,
+                 max_bytes=IMAGE_MAX_BYTES, cancel_event=None, metrics=None):
+        if fetcher is None:
+            from fetcher import get_default_fetcher
+            fetcher = get_default_fetcher()
+        self.directory = directory
+        self.fetcher = fetcher
+        self.scheduler = scheduler
+        self.concurrency = concurrency
+        self.max_bytes = max_bytes
+        self.cancel_event = cancel_event
+        self.metrics = metrics
+        os.makedirs(directory, exist_ok=True)
+        self.manifest_path = os.path.join(directory, MANIFEST_NAME)
+        self._requested = FingerprintSet(self._saved_urls())
+        self._manifest = open(self.manifest_path, 'a', encoding='utf-8')
+        self._pending = deque()
+        self._in_flight = 0
+        # Temporary files of downloads not stored or discarded yet, removed on close if still there
+        self._parts = set()
+        self.counts = {'saved': 0, 'duplicate': 0, 'too_large': 0, 'failed': 0, 'skipped': 0}
+        self._lock = threading.Condition()
+        # Finished downloads are stored here rather than on the fetch engine's thread, which may be
+        # the event loop every page fetch runs on
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="images")
+
+    def _saved_urls(self):
+        # Failed downloads of earlier runs are tried again
+        if not os.path.exists(self.manifest_path):
+            return
+        with open(self.manifest_path, encoding='utf-8') as manifest:
+            for line in manifest:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get('file') or entry.get('status') == 'too_large':
+                    yield entry['url']
+
+    def add(self, page_url, image_urls):
+        with self._lock:
+            for image_url in image_urls:
+                if self._requested.add(image_url):
+                    self._pending.append((image_url, page_url))
+            self._pump()
+
+    def _pump(self):
+        while self._pending and self._in_flight < self.concurrency:
+            if self.cancel_event is not None and self.cancel_event.is_set():
+                self._skip_pending()
+                break
+            image_url, page_url = self._pending.popleft()
+            sink = None
+            try:
+                sink = HashingFile(self.directory)
+                self._parts.add(sink.path)
+                delay = self.scheduler.reserve(image_url) if self.scheduler else 0
+                future = self.fetcher.submit_download(image_url, sink, self.max_bytes, delay=delay, cancel_event=self.cancel_event)
+            except Exception as e:
+                if sink is not None:
+                    # Its file goes on close()
+                    sink.close()
+                self._record({'url': image_url, 'page': page_url, 'status': 'failed', 'error': str(e)})
+                continue
+            # Counted once it is submitted; its callback needs the lock held here to finish
+            self._in_flight += 1
+            future.add_done_callback(functools.partial(self._hand_off, image_url, page_url, sink))
+
+    def _skip_pending(self):
+        while self._pending:
+            image_url, page_url = self._pending.popleft()
+            self._record({'url': image_url, 'page': page_url, 'status': 'skipped'})
+
+    def _discard(self, sink):
+        sink.discard()
+        self._parts.discard(sink.path)
+
+    def _record(self, entry):
+        self.counts[entry['status']] += 1
+        self._manifest.write(json.dumps(entry) + "\n")
+        if self.metrics:
+            host = urlsplit(entry['url']).netloc
+            self.metrics.count("images", host=host, status=entry['status'])
+            if entry.get('bytes'):
+                self.metrics.count("image_bytes", entry['bytes'], host=host)
+
+    def _hand_off(self, image_url, page_url, sink, future):
+        self._executor.submit(self._finished, image_url, page_url, sink, future)
+
+    def _finished(self, image_url, page_url, sink, future):
+        entry = {'url': image_url, 'page': page_url}
+        with self._lock:
+            try:
+                try:
+                    response = future.result()
+                except Exception as e:
+                    self._discard(sink)
+                    entry.update(status='failed', error=str(e))
+                else:
+                    content_type = response.headers.get('content-type', '')
+                    entry['http_status'] = response.status
+                    if response.truncated:
+                        self._discard(sink)
+                        entry['status'] = 'too_large'
+                    elif response.status != 200 or content_type.startswith('text/'):
+                        # Error pages and soft 404s served in place of the image
+                        self._discard(sink)
+                        entry['status'] = 'failed'
+                    else:
+                        entry.update(self._store(sink, content_type, image_url), content_type=content_type)
+            except Exception as e:
+                logging.error(f"Failed to store image {image_url}: {e!r}")
+                entry.update(status='failed', error=str(e))
+            try:
+                self._record(entry)
+            finally:
+                # Whatever happened to this download, close() must not wait for it any longer
+                self._in_flight -= 1
+                self._lock.notify_all()
+                self._pump()
+
+    def _store(self, sink, content_type, image_url):
+        sink.close()
+        digest = sink.sha256.hexdigest()
+        name = os.path.join(digest[:2], digest + file_extension(content_type, image_url))
+        path = os.path.join(self.directory, name)
+        if os.path.exists(path):
+            os.remove(sink.path)
+            status = 'duplicate'
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(sink.path, path)
+            status = 'saved'
+        self._parts.discard(sink.path)
+        return {'status': status, 'file': name.replace(os.sep, '/'), 'sha256': digest, 'bytes': sink.size}
+
+    def close(self):
+        # Waits for the queued downloads, or only the ones in flight once the crawl is stopped
+        with self._lock:
+            while self._pending or self._in_flight:
+                if self.cancel_event is not None and self.cancel_event.is_set():
+                    self._skip_pending()
+                self._lock.wait(0.5)
+            self._manifest.close()
+        self._executor.shutdown(wait=True)
+        # Downloads that failed in a way that left their temporary file behind
+        for path in self._parts:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._parts.clear()
+        logging.info(f"Images: {self.counts['saved']} saved, {self.counts['duplicate']} duplicates, "
+                     f"{self.counts['too_large']} too large, {self.counts['failed']} failed, "
+                     f"{self.counts['skipped']} skipped, in {self.directory}")
@@ -1,5 +1,6 @@
 import logging
 
-def configure_logging():
-    logging.basicConfig(filename='scraper.log', level=logging.INFO, 
+def configure_logging(filename='scraper.log', level=logging.INFO):
+    # filename=None logs to stderr, which is what batch and cron runs want
+    logging.basicConfig(filename=filename, level=level, 
                         format='%(asctime)s %(levelname)s %(message)s')
@@ -0,0 +1,243 @@
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Upper bounds in seconds of the latency histogram buckets, as in Prometheus' defaults plus a tail
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Crawl stages in the order a page goes through them
+STAGES = ("browser_start", "fetch", "render", "dedup", "parse", "extract", "links")
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, fraction):
+        # Estimated by interpolating inside the bucket that holds the rank
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = BUCKETS[index - 1] if index else 0.0
+                upper = BUCKETS[index] if index < len(BUCKETS) else BUCKETS[-1] * 2
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return BUCKETS[-1]
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum_seconds': round(self.sum, 6),
+            'p50_ms': _ms(self.quantile(0.50)),
+            'p90_ms': _ms(self.quantile(0.90)),
+            'p99_ms': _ms(self.quantile(0.99)),
+        }
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+def _label_value(value):
+    # Backslash, double quote and newline are the characters the exposition format escapes
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _label_text(labels):
+    return ",".join(f'{name}="{_label_value(value)}"' for name, value in labels)
+
+# Counters, gauges and per-stage, per-host latency histograms for one crawl. Every method is
+# thread-safe; crawl threads record and the GUI or the snapshot writer read.
+class CrawlMetrics:
+    def __init__(self):
+        self.started = time.monotonic()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def count(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, stage, seconds, host=""):
+        with self._lock:
+            for key in ((stage, ""), (stage, host)) if host else ((stage, ""),):
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = Histogram()
+                histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage, host=""):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, host)
+
+    def total(self, name):
+        with self._lock:
+            return sum(value for (counter, _), value in self._counters.items() if counter == name)
+
+    def snapshot(self):
+        with self._lock:
+            elapsed = time.monotonic() - self.started
+            counters = {}
+            for (name, labels), value in sorted(self._counters.items()):
+                entry = counters.setdefault(name, {'total': 0, 'by_label': []})
+                entry['total'] += value
+                if labels:
+                    entry['by_label'].append({'labels': dict(labels), 'value': value})
+            stages = {}
+            hosts = {}
+            for (stage, host), histogram in sorted(self._histograms.items()):
+                if host:
+                    hosts.setdefault(host, {})[stage] = histogram.to_dict()
+                else:
+                    stages[stage] = histogram.to_dict()
+            pages = counters.get('pages', {}).get('total', 0)
+            return {
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'elapsed_seconds': round(elapsed, 3),
+                'pages': pages,
+                'pages_per_sec': round(pages / elapsed, 3) if elapsed else 0,
+                'counters': counters,
+                'gauges': dict(self._gauges),
+                'stages': stages,
+                'hosts': hosts,
+            }
+
+    def to_prometheus(self, prefix="scrappy"):
+        lines = []
+        with self._lock:
+            counter_names = sorted({name for name, _ in self._counters})
+            for name in counter_names:
+                lines.append(f"# TYPE {prefix}_{name}_total counter")
+                for (counter, labels), value in sorted(self._counters.items()):
+                    if counter == name:
+                        lines.append(f"{prefix}_{name}_total{{{_label_text(labels)}}} {value}")
+            for name, value in sorted(self._gauges.items()):
+                lines.append(f"# TYPE {prefix}_{name} gauge")
+                lines.append(f"{prefix}_{name} {value}")
+            lines.append(f"# TYPE {prefix}_stage_seconds histogram")
+            for (stage, host), histogram in sorted(self._histograms.items()):
+                labels = _label_text((("stage", stage), ("host", host or "all")))
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ("+Inf",), histogram.counts):
+                    cumulative += count
+                    lines.append(f'{prefix}_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"{prefix}_stage_seconds_sum{{{labels}}} {histogram.sum}")
+                lines.append(f"{prefix}_stage_seconds_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_snapshot(self, directory, name="crawl"):
+        # Written to a temporary file first so scrapers and readers never see half a snapshot
+        os.makedirs(directory, exist_ok=True)
+        for extension, content in (("json", json.dumps(self.snapshot(), indent=2)), ("prom", self.to_prometheus())):
+            path = os.path.join(directory, f"{name}.{extension}")
+            with open(f"{path}.tmp", 'w', encoding='utf-8') as snapshot_file:
+                snapshot_file.write(content)
+            os.replace(f"{path}.tmp", path)
+
+    def summary(self):
+        # A few lines for the GUI's live panel
+        snapshot = self.snapshot()
+        gauges = snapshot['gauges']
+        counters = snapshot['counters']
+        statuses = " ".join(f"{entry['labels']['status']}: {entry['value']}"
+                            for entry in _merge_by(counters.get('responses', {}), 'status'))
+        timings = " | ".join(f"{stage} p50 {values['p50_ms']:.0f} ms p99 {values['p99_ms']:.0f} ms"
+                             for stage, values in ((stage, snapshot['stages'].get(stage)) for stage in STAGES) if values)
+        browsers = f"{gauges.get('browsers_busy', 0)}/{gauges.get('browsers_started', 0)} of {gauges.get('browsers_size', 0)}"
+        return (f"Pages: {snapshot['pages']} ({snapshot['pages_per_sec']:.1f}/s) | Queue: {gauges.get('queue_depth', 0)} | "
+                f"Fetching: {gauges.get('fetching', 0)} | Processing: {gauges.get('processing', 0)} | Browsers busy: {browsers}\n"
+                f"{timings or 'No timings yet'}\n"
+                f"Downloaded: {counters.get('bytes', {}).get('total', 0) / (1024 * 1024):.1f} MB | "
+                f"Status: {statuses or '-'} | Errors: {counters.get('errors', {}).get('total', 0)}")
+
+def _merge_by(counter, label):
+    merged = {}
+    for entry in counter.get('by_label', []):
+        value = entry['labels'].get(label)
+        merged[value] = merged.get(value, 0) + entry['value']
+    return [{'labels': {label: value}, 'value': count} for value, count in sorted(merged.items())]
+
+# Before Python 3.12 a cProfile profile only sees the thread that enabled it, so every thread
+# gets its own. From 3.12 on one profile sees every thread and only one may run per process, so
+# it is shared by whatever is being profiled at the time, concurrent crawls included.
+PROFILE_PER_THREAD = sys.version_info < (3, 12)
+_shared_profile = {'profile': None, 'users': 0}
+_shared_lock = threading.Lock()
+
+# What pstats needs of a profile, taken without stopping it, since a shared profile may still be
+# running for another crawl
+class _ProfileSnapshot:
+    def __init__(self, profile):
+        profile.snapshot_stats()
+        self.stats = profile.stats
+
+    def create_stats(self):
+        pass
+
+# Profiles every thread that runs through call(), then merges what was seen
+class Profiler:
+    def __init__(self):
+        self._local = threading.local()
+        self._profiles = []
+        self._lock = threading.Lock()
+
+    def call(self, func, *args, **kwargs):
+        if not PROFILE_PER_THREAD:
+            return self._call_shared(func, *args, **kwargs)
+        profile = getattr(self._local, 'profile', None)
+        if profile is None:
+            profile = self._local.profile = cProfile.Profile()
+            with self._lock:
+                self._profiles.append(profile)
+        return profile.runcall(func, *args, **kwargs)
+
+    def _call_shared(self, func, *args, **kwargs):
+        # Calls nested in a profiled call, such as the crawl's workers, are seen already
+        with _shared_lock:
+            profile = _shared_profile['profile']
+            if profile is None:
+                profile = _shared_profile['profile'] = cProfile.Profile()
+                profile.enable()
+            _shared_profile['users'] += 1
+        with self._lock:
+            if profile not in self._profiles:
+                self._profiles.append(profile)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with _shared_lock:
+                _shared_profile['users'] -= 1
+                if not _shared_profile['users']:
+                    profile.disable()
+                    _shared_profile['profile'] = None
+
+    def dump(self, path):
+        with self._lock:
+            profiles = list(self._profiles)
+        if not profiles:
+            return
+        stats = pstats.Stats(*(_ProfileSnapshot(profile) for profile in profiles))
+        stats.dump_stats(path)
@@ -0,0 +1,39 @@
+from dataclasses import dataclass, field
+from config import MAX_THREADS, RATE_LIMIT, PARSE_PROCESSES, METRICS_DIR
+
+def split_list(text):
+    return [item.strip() for item in (text or "").split(",") if item.strip()]
+
+# Everything a scrape or crawl needs to know, free of any GUI state so batch jobs can build it too
+@dataclass
+class ScrapeOptions:
+    tags: list = field(default_factory=lambda: ["div"])
+    classes: list = field(default_factory=list)
+    attribute: str = "text"
+    crawl: bool = False
+    crawl_links_only: bool = False
+    scrape_images: bool = False
+    # Download the images found into this folder; None only lists them
+    image_dir: str = None
+    respect_robots: bool = False
+    search_emails: bool = False
+    search_phones: bool = False
+    contacts_only: bool = False
+    use_sitemaps: bool = False
+    skip_duplicates: bool = False
+    # Crawl scope: regexes a URL has to match (include) or must not match (exclude) to be crawled,
+    # and regex to weight rules that crawl matching URLs first
+    include: list = field(default_factory=list)
+    exclude: list = field(default_factory=list)
+    priorities: dict = field(default_factory=dict)
+    # Crawl budgets; None leaves a limit off. Depth counts links from the start page, time is in seconds.
+    max_depth: int = None
+    max_pages: int = None
+    max_bytes: int = None
+    time_limit: float = None
+    resume: bool = False
+    rate_limit: float = RATE_LIMIT
+    max_threads: int = MAX_THREADS
+    parse_processes: int = PARSE_PROCESSES
+    metrics_dir: str = METRICS_DIR
+    profile_dir: str = None
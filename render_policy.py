@@ -0,0 +1,62 @@
+import logging
+import re
+import threading
+from urllib.parse import urlparse
+from config import RENDER_MODE, RENDER_SITES, RENDER_MIN_TEXT
+
+# Markers of pages that only fill themselves in once JavaScript runs
+NOSCRIPT_REGEX = re.compile(r'<noscript[^>]*>(?:(?!</noscript>).){0,500}?(?:enable|requires?|turn on)\s+javascript', re.IGNORECASE | re.DOTALL)
+SPA_SHELL_REGEX = re.compile(
+    r'<(?:div|main|app-root)[^>]+id=["\'](?:root|app|__next|__nuxt|svelte|main-app)["\'][^>]*>\s*</(?:div|main|app-root)>'
+    r'|<app-root[^>]*>\s*</app-root>'
+    r'|\bng-app\b|\bdata-reactroot\b|window\.__NUXT__|window\.__INITIAL_STATE__',
+    re.IGNORECASE)
+BODY_REGEX = re.compile(r'<body[^>]*>(.*)</body>', re.IGNORECASE | re.DOTALL)
+INVISIBLE_REGEX = re.compile(r'<(script|style|noscript|template)[^>]*>.*?</\1>', re.IGNORECASE | re.DOTALL)
+TAG_REGEX = re.compile(r'<[^>]+>')
+SEGMENT_ID_REGEX = re.compile(r'^(?:\d+|[0-9a-f]{8,}|[0-9a-f-]{36})$', re.IGNORECASE)
+
+def needs_javascript(html_content):
+    if not html_content:
+        return True
+    if isinstance(html_content, bytes):
+        html_content = html_content.decode('utf-8', errors='replace')
+    if SPA_SHELL_REGEX.search(html_content) or NOSCRIPT_REGEX.search(html_content):
+        return True
+    match = BODY_REGEX.search(html_content)
+    body = match.group(1) if match else html_content
+    visible_text = TAG_REGEX.sub(' ', INVISIBLE_REGEX.sub(' ', body))
+    return len(''.join(visible_text.split())) < RENDER_MIN_TEXT
+
+def url_pattern(url):
+    # Pages under the same host and leading path share a template, e.g. /products/123 and /products/456
+    parsed_url = urlparse(url)
+    segments = [segment for segment in parsed_url.path.split('/') if segment]
+    head = segments[0] if segments and not SEGMENT_ID_REGEX.match(segments[0]) else ''
+    return f"{parsed_url.netloc.lower()}/{head.lower()}"
+
+class RenderPolicy:
+    def __init__(self, mode=RENDER_MODE, sites=None):
+        self.mode = mode
+        self.sites = RENDER_SITES if sites is None else sites
+        self._decisions = {}
+        self._lock = threading.Lock()
+
+    def needs_render(self, url, html_content):
+        if self.mode == 'always':
+            return True
+        if self.mode == 'never':
+            return False
+        host = urlparse(url).netloc.lower()
+        if host in self.sites:
+            return self.sites[host]
+
+        pattern = url_pattern(url)
+        with self._lock:
+            decision = self._decisions.get(pattern)
+        if decision is None:
+            decision = needs_javascript(html_content)
+            with self._lock:
+                self._decisions.setdefault(pattern, decision)
+            logging.info(f"Pages like {pattern} {'need' if decision else 'do not need'} JavaScript rendering")
+        return decision
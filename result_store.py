@@ -0,0 +1,72 @@
+import hashlib
+import sqlite3
+import threading
+from config import RESULT_CACHE_KB, RESULT_COMMIT_EVERY, EXPORT_CHUNK_SIZE
+
+def row_hash(row):
+    # 64 signed bits of blake2b, so the hash fits an SQLite integer
+    text = '\x1f'.join('' if value is None else str(value) for value in row)
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=8).digest(), 'little', signed=True)
+
+# The rows of a scrape, deduplicated by hash as they are added. They live in SQLite: by default a
+# private temporary database that keeps cache_kb of pages in memory, spills the rest to a temporary
+# file and is deleted once closed or garbage collected, so a crawl's memory stays flat however many rows it finds.
+# Rows get consecutive rowids in the order they were found, so any page of them is a range lookup.
+class ResultStore:
+    def __init__(self, path='', cache_kb=RESULT_CACHE_KB, commit_every=RESULT_COMMIT_EVERY):
+        self.path = path
+        self.commit_every = commit_every
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(f"PRAGMA cache_size=-{int(cache_kb)}")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS results (
+                hash INTEGER NOT NULL UNIQUE,
+                url TEXT,
+                content TEXT
+            );
+        """)
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._count = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def add(self, rows):
+        # Returns the rows that were not in the store yet; one-column rows such as links are fine too
+        new_rows = []
+        with self._lock:
+            insert = self._conn.execute
+            for row in rows:
+                row = tuple(row)
+                cursor = insert("INSERT OR IGNORE INTO results (hash, url, content) VALUES (?, ?, ?)",
+                                (row_hash(row), row[0], row[1] if len(row) > 1 else None))
+                if cursor.rowcount:
+                    new_rows.append(row)
+            self._count += len(new_rows)
+            self._writes += len(new_rows)
+            if self._writes >= self.commit_every:
+                self._conn.commit()
+                self._writes = 0
+        return new_rows
+
+    def page(self, offset, limit):
+        # Rows offset to offset + limit, in the order they were found
+        with self._lock:
+            rows = self._conn.execute("SELECT url, content FROM results WHERE rowid > ? AND rowid <= ? ORDER BY rowid",
+                                      (offset, offset + limit)).fetchall()
+        return [(url,) if content is None else (url, content) for url, content in rows]
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        # One page at a time, for exports
+        offset = 0
+        while True:
+            rows = self.page(offset, EXPORT_CHUNK_SIZE)
+            if not rows:
+                return
+            yield from rows
+            offset += len(rows)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,128 @@
+import queue
+import time
+from tkinter import ttk
+from config import RESULTS_POLL_MS, RESULTS_DRAIN_BUDGET_MS, RESULTS_MAX_COLUMN_WIDTH
+
+# A Treeview that only ever holds the rows currently on screen, read a page at a time from the
+# scrape's result store. Crawl threads hand new rows, progress and GUI updates to a queue; the Tk
+# thread drains it in small time-boxed batches with after().
+class ResultsView:
+    def __init__(self, tree, scrollbar, counter_label=None, progress_bar=None):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.counter_label = counter_label
+        self.progress_bar = progress_bar
+        self.results = None
+        # Rows of the store the counter and scrollbar last showed; the crawl keeps adding more
+        self._shown = 0
+        self._queue = queue.Queue()
+        self.offset = 0
+        self._content_width = 0
+
+        # The scrollbar moves our window over the store's rows, not the tree's own (tiny) item list
+        self.scrollbar.configure(command=self._on_scroll)
+        self.tree.configure(yscrollcommand="")
+        self.tree.bind("<MouseWheel>", lambda event: self._scroll_by(-1 if event.delta > 0 else 1, 'units'))
+        self.tree.bind("<Button-4>", lambda event: self._scroll_by(-1, 'units'))
+        self.tree.bind("<Button-5>", lambda event: self._scroll_by(1, 'units'))
+        self.tree.bind("<Configure>", lambda event: self._refresh())
+        self.tree.after(RESULTS_POLL_MS, self._drain)
+
+    # Thread-safe entry points
+    def put_rows(self, rows):
+        self._queue.put(('rows', list(rows)))
+
+    def put_progress(self, done, total):
+        self._queue.put(('progress', done, total))
+
+    def call_soon(self, func, *args):
+        self._queue.put(('call', func, args))
+
+    # Tk thread only
+    def clear(self, results=None):
+        # Shows the rows of the given store from now on
+        self.results = results
+        self._shown = 0
+        self.offset = 0
+        self._content_width = 0
+        self._refresh()
+
+    @property
+    def count(self):
+        return len(self.results) if self.results is not None else 0
+
+    @property
+    def visible_count(self):
+        row_height = int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+        # Leave room for the heading row
+        return max(1, (self.tree.winfo_height() - row_height) // row_height)
+
+    def _add_rows(self, rows):
+        # The rows are in the store already; they are only measured for the column width
+        for row in rows:
+            if len(row) > 1:
+                self._content_width = max(self._content_width, len(str(row[1])) * 10)
+
+    def _drain(self):
+        deadline = time.monotonic() + RESULTS_DRAIN_BUDGET_MS / 1000
+        try:
+            while time.monotonic() < deadline:
+                item = self._queue.get_nowait()
+                if item[0] == 'rows':
+                    self._add_rows(item[1])
+                elif item[0] == 'progress':
+                    if self.progress_bar is not None and item[2]:
+                        self.progress_bar['value'] = item[1] / item[2] * 100
+                else:
+                    item[1](*item[2])
+        except queue.Empty:
+            pass
+        before, self._shown = self._shown, self.count
+        if self._shown != before:
+            self.tree.column("Content", width=max(300, min(self._content_width, RESULTS_MAX_COLUMN_WIDTH)))
+            # Only redraw when the new rows land in the window on screen
+            if before < self.offset + self.visible_count:
+                self._refresh()
+            else:
+                self._update_scrollbar()
+            if self.counter_label is not None:
+                self.counter_label.config(text=f"Results: {self._shown:,}")
+        self.tree.after(RESULTS_POLL_MS, self._drain)
+
+    def _scroll_by(self, amount, unit):
+        step = self.visible_count if unit == 'pages' else 1
+        self._scroll_to(self.offset + amount * step)
+        return "break"
+
+    def _scroll_to(self, offset):
+        self.offset = max(0, min(offset, self.count - self.visible_count))
+        self._refresh()
+
+    def _on_scroll(self, action, amount, unit=None):
+        if action == 'moveto':
+            self._scroll_to(int(float(amount) * self.count))
+        else:
+            self._scroll_by(int(amount), unit)
+
+    def _update_scrollbar(self):
+        if not self.count:
+            self.scrollbar.set(0, 1)
+            return
+        first = self.offset / self.count
+        last = min(1.0, (self.offset + self.visible_count) / self.count)
+        self.scrollbar.set(first, last)
+
+    def _refresh(self):
+        # Reuse the existing items and only rewrite their values
+        window = []
+        if self.count:
+            limit = min(self.visible_count, self.count - self.offset)
+            window = [(row[0], row[1] if len(row) > 1 else "") for row in self.results.page(self.offset, limit)]
+        items = self.tree.get_children()
+        for item, values in zip(items, window):
+            self.tree.item(item, values=values)
+        if len(items) > len(window):
+            self.tree.delete(*items[len(window):])
+        for values in window[len(items):]:
+            self.tree.insert("", "end", values=values)
+        self._update_scrollbar()
@@ -1,21 +1,171 @@
+import concurrent.futures
+import threading
+import time
+from urllib.parse import urlparse, urlunparse, quote, unquote
 from urllib.robotparser import RobotFileParser
-from config import HEADERS
+from config import HEADERS, ROBOTS_TTL, ROBOTS_ERROR_TTL, ROBOTS_PREFIX_CACHE_SIZE
+from fetcher import FetchError, get_default_fetcher
 import logging
 
-def load_robots_txt(url):
+def robots_url_for(url):
     parsed_url = urlparse(url)
-    robots_url = f"{parsed_url.scheme}://{parsed_url.netloc}/robots.txt"
+    return f"{parsed_url.scheme}://{parsed_url.netloc}/robots.txt"
+
+def parse_robots_result(robots_url, result):
     rp = RobotFileParser()
     rp.set_url(robots_url)
+    # Same status handling as RobotFileParser.read()
+    if result.status in (401, 403):
+        rp.disallow_all = True
+    elif 400 <= result.status < 500:
+        rp.allow_all = True
+    elif result.status >= 500:
+        logging.warning(f"Failed to load robots.txt: HTTP {result.status}")
+        return None
+    else:
+        rp.parse(result.text.splitlines())
+    logging.info(f"Loaded robots.txt from {robots_url}")
+    return rp
+
+def load_robots_txt(url, fetcher=None):
+    robots_url = robots_url_for(url)
     try:
-        rp.read()
-        logging.info(f"Loaded robots.txt from {robots_url}")
-    except Exception as e:
+        # Fetch through the shared engine so the request gets our headers and timeouts
+        result = (fetcher or get_default_fetcher()).fetch(robots_url)
+    except FetchError as e:
         logging.warning(f"Failed to load robots.txt: {e}")
-        rp = None
-    return rp
+        return None
+    return parse_robots_result(robots_url, result)
 
 def can_fetch_url(rp, url):
     if rp is None:
         return True  # If robots.txt could not be loaded, assume it's safe to fetch
     return rp.can_fetch(HEADERS['User-Agent'], url)
+
+# The parsed rules of one host for our user agent. Rules only ever look at a path prefix as long
+# as their longest path, so can_fetch answers are cached per prefix of that length.
+class RobotsRules:
+    def __init__(self, rp=None, user_agent=HEADERS['User-Agent']):
+        self.rp = rp
+        self.user_agent = user_agent
+        self.crawl_delay = None
+        self.sitemaps = []
+        self._entry = None
+        self._prefix_length = 0
+        self._allowed = {}
+        if rp is None:
+            return
+
+        delay = rp.crawl_delay(user_agent)
+        rate = rp.request_rate(user_agent)
+        if rate and rate.requests:
+            delay = max(float(delay or 0), rate.seconds / rate.requests)
+        self.crawl_delay = float(delay) if delay else None
+        self.sitemaps = rp.site_maps() or []
+
+        # Same entry RobotFileParser.can_fetch() would pick for our user agent
+        self._entry = next((entry for entry in rp.entries if entry.applies_to(user_agent)), rp.default_entry)
+        if self._entry is not None:
+            self._prefix_length = max((len(rule.path) for rule in self._entry.rulelines), default=0)
+
+    def _path(self, url):
+        # Normalized the way RobotFileParser.can_fetch() normalizes it
+        parsed_url = urlparse(unquote(url))
+        path = quote(urlunparse(('', '', parsed_url.path, parsed_url.params, parsed_url.query, parsed_url.fragment)))
+        return path or "/"
+
+    def can_fetch(self, url):
+        rp = self.rp
+        if rp is None or rp.allow_all:
+            return True  # If robots.txt could not be loaded, assume it's safe to fetch
+        if rp.disallow_all:
+            return False
+        if self._entry is None:
+            return True
+
+        prefix = self._path(url)[:self._prefix_length]
+        allowed = self._allowed.get(prefix)
+        if allowed is None:
+            allowed = self._entry.allowance(prefix)
+            if len(self._allowed) >= ROBOTS_PREFIX_CACHE_SIZE:
+                self._allowed.clear()
+            self._allowed[prefix] = allowed
+        return allowed
+
+# robots.txt rules per host, loaded once through the fetch engine and kept for a TTL. Crawls ask
+# for rules without blocking and park a host's URLs until its load finishes.
+class RobotsCache:
+    def __init__(self, fetcher=None, ttl=ROBOTS_TTL, error_ttl=ROBOTS_ERROR_TTL):
+        self.fetcher = fetcher
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self._rules = {}
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def cached(self, url):
+        # The host's rules if they are loaded and fresh, otherwise None
+        entry = self._rules.get(urlparse(url).netloc)
+        if entry is not None and entry[1] > time.monotonic():
+            return entry[0]
+        return None
+
+    def load_async(self, url):
+        # A future for the host's rules, shared by every caller while the load is in flight
+        host = urlparse(url).netloc
+        with self._lock:
+            entry = self._rules.get(host)
+            if entry is not None and entry[1] > time.monotonic():
+                future = concurrent.futures.Future()
+                future.set_result(entry[0])
+                return future
+            future = self._loading.get(host)
+            if future is not None:
+                return future
+            future = self._loading[host] = concurrent.futures.Future()
+
+        robots_url = robots_url_for(url)
+        try:
+            fetch = (self.fetcher or get_default_fetcher()).submit(robots_url)
+        except Exception as e:
+            self._loaded(host, robots_url, None, future, e)
+            return future
+        fetch.add_done_callback(lambda done: self._loaded(host, robots_url, done, future))
+        return future
+
+    def _loaded(self, host, robots_url, fetch, future, error=None):
+        rp = None
+        try:
+            if error is None:
+                rp = parse_robots_result(robots_url, fetch.result())
+        except FetchError as e:
+            logging.warning(f"Failed to load robots.txt: {e}")
+        except Exception as e:
+            logging.error(f"Failed to parse {robots_url}: {e}")
+        else:
+            if error is not None:
+                logging.warning(f"Failed to load robots.txt: {error}")
+        rules = RobotsRules(rp)
+        # Unreachable robots.txt files are retried sooner than ones that loaded
+        ttl = self.ttl if rp is not None else self.error_ttl
+        with self._lock:
+            self._rules[host] = (rules, time.monotonic() + ttl)
+            self._loading.pop(host, None)
+        future.set_result(rules)
+
+    def get(self, url):
+        return self.cached(url) or self.load_async(url).result()
+
+    def can_fetch(self, url):
+        return self.get(url).can_fetch(url)
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+# One cache per process, shared by single page scrapes, crawls and batch runs
+def get_default_robots():
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = RobotsCache()
+        return _default_cache
@@ -0,0 +1,135 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from config import (RATE_LIMIT, AIMD_INITIAL, AIMD_MIN, AIMD_MAX, AIMD_DECREASE, AIMD_LATENCY_FACTOR,
+                    RETRY_BASE_DELAY, RETRY_MAX_DELAY)
+
+# Responses that mean the host wants us to slow down, and responses worth another try later
+THROTTLE_STATUSES = frozenset({429, 503})
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# Hands out per-host request slots so concurrent workers never hit one host faster than the rate limit
+class HostScheduler:
+    def __init__(self, delay=RATE_LIMIT, stop_event=None):
+        self.delay = delay
+        self.stop_event = stop_event
+        self._next_slot = {}
+        self._host_delays = {}
+        self._lock = threading.Lock()
+
+    def set_host_delay(self, host, delay):
+        # A host's own minimum delay, such as its robots.txt Crawl-delay; never faster than ours
+        with self._lock:
+            self._host_delays[host] = delay
+
+    def pause(self, host, seconds):
+        # No request to the host before `seconds` from now, e.g. for a Retry-After header
+        with self._lock:
+            resume = time.monotonic() + seconds
+            self._next_slot[host] = max(resume, self._next_slot.get(host, resume))
+
+    def delay_for(self, host):
+        return max(self.delay, self._host_delays.get(host) or 0)
+
+    def reserve(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.delay_for(host)
+        return slot - now
+
+    def wait(self, url):
+        delay = self.reserve(url)
+        if delay > 0:
+            if self.stop_event is not None:
+                return not self.stop_event.wait(delay)
+            time.sleep(delay)
+        return not (self.stop_event is not None and self.stop_event.is_set())
+
+def parse_retry_after(value):
+    # Seconds to wait from a Retry-After header, given either as seconds or as an HTTP date
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+def backoff_delay(attempt, retry_after=None, base=RETRY_BASE_DELAY, cap=RETRY_MAX_DELAY):
+    # Exponential backoff with jitter, so retries of many URLs do not arrive together
+    delay = min(cap, base * 2 ** attempt) * random.uniform(0.5, 1.5)
+    return max(delay, retry_after or 0)
+
+class HostState:
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+        self.latency = None
+        self.baseline = None
+        self.last_decrease = 0.0
+
+# AIMD concurrency per host: each healthy response grows a host's limit by about one request per
+# round trip, while throttling, timeouts or latency well above the host's best cut it at once.
+# Only the crawl's coordinator thread uses it.
+class HostController:
+    def __init__(self, initial=AIMD_INITIAL, minimum=AIMD_MIN, maximum=AIMD_MAX, decrease=AIMD_DECREASE,
+                 latency_factor=AIMD_LATENCY_FACTOR):
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self._hosts = {}
+
+    def _state(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = HostState(self.initial)
+        return state
+
+    def limit(self, host):
+        return int(self._state(host).limit)
+
+    def available(self, host):
+        state = self._state(host)
+        return max(0, int(state.limit) - state.in_flight)
+
+    def acquire(self, host):
+        state = self._state(host)
+        if state.in_flight >= int(state.limit):
+            return False
+        state.in_flight += 1
+        return True
+
+    def release(self, host):
+        state = self._state(host)
+        state.in_flight = max(0, state.in_flight - 1)
+
+    def _cut(self, state):
+        # One cut per round trip, so a burst of failures from one window only counts once
+        now = time.monotonic()
+        if now - state.last_decrease < (state.latency or 1.0):
+            return
+        state.limit = max(self.minimum, state.limit * self.decrease)
+        state.last_decrease = now
+
+    def on_success(self, host, latency):
+        state = self._state(host)
+        state.latency = latency if state.latency is None else 0.8 * state.latency + 0.2 * latency
+        state.baseline = state.latency if state.baseline is None else min(state.baseline, state.latency)
+        if state.latency > state.baseline * self.latency_factor:
+            self._cut(state)
+        else:
+            state.limit = min(self.maximum, state.limit + 1 / state.limit)
+
+    def on_throttle(self, host):
+        self._cut(self._state(host))
+
+    def total_limit(self):
+        return sum(int(state.limit) for state in self._hosts.values())
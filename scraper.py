@@ -1,291 +1,605 @@
+import heapq
+import itertools
+import multiprocessing
 import os
-import requests
-from bs4 import BeautifulSoup
-import gc
-import pandas as pd
 import threading
-from urllib.parse import urljoin, urlparse, urldefrag
-import concurrent.futures
 import time
+from urllib.parse import urlparse
+import concurrent.futures
 import logging
-import tkinter as tk  # Required for tk.END
-from config import HEADERS, MAX_THREADS, RATE_LIMIT
-from utils import is_valid_url, normalize_url, flash_paypal_button
-from robots import load_robots_txt, can_fetch_url
-from tkinter import filedialog, messagebox
-import re
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service as ChromeService
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-
-# Path to your ChromeDriver
-CHROME_DRIVER_PATH = 'C:\chromedriver.exe'  # Update this with the actual path
-
-# Regular expressions for emails and phone numbers
-EMAIL_REGEX = re.compile(r'[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+')
-PHONE_REGEX = re.compile(r'\+?\(?\d{1,4}\)?[\d\s.-]{5,}')
+from config import DRIVER_POOL_SIZE, METRICS_INTERVAL, RETRY_MAX_ATTEMPTS, SITEMAP_BATCH
+from utils import is_valid_url, normalize_url
+from robots import get_default_robots
+from scheduler import HostScheduler, HostController, THROTTLE_STATUSES, RETRY_STATUSES, backoff_delay, parse_retry_after
+from fetcher import FetchError, get_default_fetcher
+from crawl_store import CrawlStore, content_hash, site_name
+from result_store import ResultStore
+from metrics import CrawlMetrics, Profiler
+from url_index import new_url_index
+from frontier import Frontier, UrlRules, CrawlBudget
+from render_policy import RenderPolicy
 
 stop_scan_flag = threading.Event()
 
+DATA_COLUMNS = ["URL", "Content"]
+LINK_COLUMNS = ["URL"]
+
 def check_anti_scraping(url):
     try:
-        response = requests.get(url, headers=HEADERS, timeout=10)
-        if response.status_code in [403, 429]:
-            return True, f"HTTP Status Code {response.status_code} detected. The site might be blocking scraping."
+        response = get_default_fetcher().fetch(url)
+        if response.status == 403:
+            return True, f"HTTP Status Code {response.status} detected. The site might be blocking scraping."
+        if response.status in THROTTLE_STATUSES:
+            # Rate limiting is not a block; the crawl backs off and retries on its own
+            return False, f"HTTP Status Code {response.status} detected. The site is rate limiting, requests will back off."
         if 'captcha' in response.text.lower():
             return True, "CAPTCHA detected. The site might be blocking scraping."
         return False, "No anti-scraping measures detected."
-    except requests.exceptions.RequestException as e:
+    except FetchError as e:
         return True, f"Request failed with exception: {e}"
 
-def scrape_page(url, tags, classes, attribute, rp, search_emails_var, search_phones_var, scrape_images_var):
-    if stop_scan_flag.is_set() or (rp and not can_fetch_url(rp, url)):
-        return set()  # Return a set instead of a list
-
-    # Use Selenium to handle JavaScript-rendered content
-    driver = None
+def new_driver_pool(size=DRIVER_POOL_SIZE, metrics=None):
+    # Selenium is only imported once a page actually needs Chrome
+    from browser_pool import DriverPool
+    return DriverPool(size=size, stop_event=stop_scan_flag, metrics=metrics)
+
+def render_if_needed(url, html_content, render_policy=None, driver_pool=None, metrics=None):
+    # Only pages that look like JavaScript shells (or sites configured to need it) go through Chrome
+    render_policy = render_policy or RenderPolicy()
+    if not render_policy.needs_render(url, html_content):
+        return html_content
+    rendered = render_page(url, driver_pool, metrics)
+    return rendered if rendered is not None else html_content
+
+def render_page(url, driver_pool=None, metrics=None):
+    own_pool = driver_pool is None
+    if own_pool:
+        driver_pool = new_driver_pool(size=1, metrics=metrics)
+    start = time.perf_counter()
     try:
-        chrome_options = Options()
-        chrome_options.add_argument("--headless")  # Run in headless mode (no UI)
-        chrome_options.add_argument("--disable-gpu")
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-dev-shm-usage")
-        
-        service = ChromeService(executable_path=CHROME_DRIVER_PATH)
-        driver = webdriver.Chrome(service=service, options=chrome_options)
-        driver.get(url)
-
-        # Wait until the page is fully loaded
-        WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.TAG_NAME, 'body')))
-        
-        html_content = driver.page_source
+        rendered = driver_pool.render(url)
     except Exception as e:
         logging.error(f"Failed to retrieve {url} with Selenium: {e}")
-        return set()
+        rendered = None
     finally:
-        if driver:
-            driver.quit()
+        if own_pool:
+            driver_pool.close()
+    if metrics:
+        metrics.observe("render", time.perf_counter() - start, urlparse(url).netloc)
+        metrics.count("renders", failed=rendered is None)
+    return rendered
+
+def build_plan(options, base_domain=None, links_only=False):
+    # bs4 and lxml are only imported once there is a page to parse
+    from extraction import ExtractionPlan
+    if links_only:
+        return ExtractionPlan([], [], options.attribute, base_domain=base_domain)
+    if options.contacts_only:
+        # Scans the raw bytes for contacts without building a DOM; with neither kind ticked it looks for both
+        from contacts import ContactPlan
+        either = options.search_emails or options.search_phones
+        return ContactPlan(options.search_emails or not either, options.search_phones or not either, base_domain=base_domain)
+    # Downloading images needs them found first
+    return ExtractionPlan(options.tags, options.classes, options.attribute, search_emails=options.search_emails,
+                          search_phones=options.search_phones, scrape_images=options.scrape_images or bool(options.image_dir),
+                          base_domain=base_domain)
+
+def new_image_downloader(options, plan, fetcher=None, scheduler=None, metrics=None):
+    # Only plans that walk a DOM find images
+    if not options.image_dir or plan.streaming or not plan.scrape_images:
+        return None
+    from images import ImageDownloader
+    return ImageDownloader(options.image_dir, fetcher, scheduler, cancel_event=stop_scan_flag, metrics=metrics)
+
+def load_robots(url, options):
+    # The process-wide per-host cache; the seed host's robots.txt starts loading right away
+    if not options.respect_robots:
+        return None
+    robots = get_default_robots()
+    robots.load_async(url)
+    return robots
+
+def record_response(metrics, response):
+    host = urlparse(response.url).netloc
+    metrics.observe("fetch", response.elapsed, host)
+    metrics.count("responses", status=response.status, host=host)
+    metrics.count("bytes", len(response.content), host=host)
+
+def scrape_page(url, options, robots=None, driver_pool=None, render_policy=None, metrics=None, downloads=None):
+    if stop_scan_flag.is_set() or (robots and not robots.can_fetch(url)):
+        return set()  # Return a set instead of a list
 
+    metrics = metrics or CrawlMetrics()
     try:
-        soup = BeautifulSoup(html_content, 'html.parser')
-        data = set()  # Use a set to collect unique results
-
-        # Extracting emails and phone numbers if requested
-        if search_emails_var.get() == 1:
-            emails = EMAIL_REGEX.findall(soup.get_text())
-            for email in emails:
-                data.add((url, email))
-
-        if search_phones_var.get() == 1:
-            for a_tag in soup.find_all('a', href=True):
-                href = a_tag['href']
-                if href.startswith('tel:'):
-                    phone_number = href.replace('tel:', '').strip()
-                    data.add((url, phone_number))
-            
-            phone_numbers = PHONE_REGEX.findall(soup.get_text())
-            for phone in phone_numbers:
-                data.add((url, phone))
-
-        # Extracting specified tags and attributes
-        for tag in tags:
-            if classes:
-                for cls in classes:
-                    elements = soup.find_all(tag, class_=cls)
-                    for element in elements:
-                        if stop_scan_flag.is_set():
-                            return set()
-                        content = element.get_text(strip=True) if attribute == "text" else element.get(attribute)
-                        if content:
-                            data.add((url, content))
-            else:
-                elements = soup.find_all(tag)
-                for element in elements:
-                    if stop_scan_flag.is_set():
-                        return set()
-                    content = element.get_text(strip=True) if attribute == "text" else element.get(attribute)
-                    if content:
-                        data.add((url, content))
-
-        # Scraping images if requested
-        if scrape_images_var.get() == 1:
-            images = soup.find_all("img")
-            for img in images:
-                src = img.get("src")
-                if src:
-                    full_src = urljoin(url, src)
-                    data.add((url, full_src))
-
-        return data
-
-    finally:
-        gc.collect()
-
-def get_internal_links(url, soup, base_domain):
-    links = set()
-    for a_tag in soup.find_all('a', href=True):
-        link = urljoin(url, a_tag['href'])
-        parsed_link = urlparse(link)
-
-        # Ensure the link is within the base domain and not malformed
-        if parsed_link.netloc == base_domain and is_valid_url(link):
-            normalized_link = normalize_url(link)
-            links.add(normalized_link)
-    return links
+        response = get_default_fetcher().fetch(url)
+        record_response(metrics, response)
+        response.raise_for_status()
+    except FetchError as e:
+        logging.error(f"Failed to retrieve {url}: {e}")
+        metrics.count("errors", stage="fetch", host=urlparse(url).netloc)
+        return set()
 
-def crawl_site(url, tags, classes, attribute, crawl_links_only=False, rp=None, progress_bar=None, search_emails_var=None, search_phones_var=None, scrape_images_var=None):
+    plan = build_plan(options)
+    if plan.streaming:
+        with metrics.timer("extract"):
+            page_data, _ = plan.run(url, response.content, stop_scan_flag, response.declared_encoding)
+        metrics.count("pages", host=urlparse(url).netloc)
+        return page_data
+    html_content = render_if_needed(url, response.text, render_policy, driver_pool, metrics)
+    with metrics.timer("parse"):
+        soup = plan.parse(html_content)
+    images = set() if downloads is not None else None
+    with metrics.timer("extract"):
+        page_data, _ = plan.run_soup(url, soup, stop_scan_flag, images)
+    if images:
+        downloads.add(url, images)
+    metrics.count("pages", host=urlparse(url).netloc)
+    return page_data
+
+def new_parse_pool(plan, processes):
+    # Spawned rather than forked, since the crawl process already runs fetch and worker threads
+    from extraction import init_worker
+    return concurrent.futures.ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"),
+                                                  initializer=init_worker, initargs=(plan.spec,))
+
+def process_page(current_url, response, plan, crawl_links_only, driver_pool, render_policy, parse_pool=None, metrics=None, duplicates=None, downloads=None):
+    # Runs on a crawl worker thread once the fetch engine has the page; the one download is parsed
+    # once and walked once for link discovery, extraction and finding images to download, in a
+    # parser process if the crawl has them so the work is not serialized on the GIL. Pages that
+    # repeat one already seen are dropped before parsing, along with their links.
+    metrics = metrics or CrawlMetrics()
+    host = urlparse(current_url).netloc
+    response.raise_for_status()
+    html_content, encoding = response.content, response.declared_encoding
+    if not crawl_links_only and not plan.streaming and render_policy.needs_render(current_url, html_content):
+        rendered = render_page(current_url, driver_pool, metrics)
+        if rendered is not None:
+            html_content, encoding = rendered, None
+    if duplicates is not None:
+        with metrics.timer("dedup", host):
+            duplicate = duplicates.check(current_url, html_content, encoding)
+        if duplicate:
+            metrics.count("duplicates", host=host, kind=duplicate)
+            return set(), set()
+    images = set() if downloads is not None else None
+    if parse_pool is not None:
+        # Parsing and extraction happen together in the parser process, so they are timed as one
+        from extraction import extract_in_worker
+        with metrics.timer("extract", host):
+            result = parse_pool.submit(extract_in_worker, current_url, html_content, encoding, images is not None).result()
+        page_data, new_links = result[:2]
+        if images is not None:
+            images = result[2]
+    elif plan.streaming:
+        with metrics.timer("extract", host):
+            page_data, new_links = plan.run(current_url, html_content, stop_scan_flag, encoding)
+    else:
+        with metrics.timer("parse", host):
+            soup = plan.parse(html_content, encoding)
+        with metrics.timer("extract", host):
+            page_data, new_links = plan.run_soup(current_url, soup, stop_scan_flag, images)
+    if images:
+        downloads.add(current_url, images)
+    return (set() if crawl_links_only else page_data), new_links
+
+def apply_robots_rules(host, rules, scheduler):
+    if rules.crawl_delay:
+        logging.info(f"Using the robots.txt Crawl-delay of {rules.crawl_delay:.1f} seconds for {host}")
+        scheduler.set_host_delay(host, rules.crawl_delay)
+    if rules.sitemaps:
+        logging.info(f"robots.txt for {host} lists {len(rules.sitemaps)} sitemaps: {', '.join(rules.sitemaps)}")
+
+def sitemap_entries(url, base_domain, robots, fetcher, scheduler, metrics):
+    # Same-site pages listed in the site's sitemaps, with normalized URLs. robots.txt is read for
+    # its Sitemap lines even when the crawl does not obey its rules.
+    from sitemaps import read_sitemaps, sitemap_locations
+    locations = sitemap_locations(url, get_default_robots().get(url))
+    rules = robots.get(url) if robots else None
+    for entry in read_sitemaps(locations, rules, fetcher, scheduler, stop_scan_flag, metrics=metrics):
+        if urlparse(entry.url).netloc == base_domain and is_valid_url(entry.url):
+            yield entry._replace(url=normalize_url(entry.url))
+
+def seed_from_sitemaps(entries, to_visit, seen, store, metrics):
+    # Queues sitemap pages as they are read; the frontier ranks them by sitemap priority and then
+    # most recent change, so nothing is sorted up front. Pages the store fetched after their
+    # lastmod are marked seen without being queued. Returns how many pages were queued.
+    from sitemaps import sitemap_order, is_unchanged
+    queued = 0
+    batch = []
+    for entry in entries:
+        if store and is_unchanged(entry, store.fetched_at(entry.url)):
+            if seen.add(entry.url):
+                metrics.count("sitemap_unchanged", host=urlparse(entry.url).netloc)
+            continue
+        if seen.add(entry.url):
+            # Sitemap pages count as linked from the start page
+            to_visit.push(entry.url, 1, sitemap_order(entry))
+            queued += 1
+            if store:
+                batch.append(entry.url)
+                if len(batch) >= SITEMAP_BATCH:
+                    store.add_pending(batch, 1)
+                    batch = []
+    if batch:
+        store.add_pending(batch, 1)
+    return queued
+
+def collect_links(links, results, on_rows=None):
+    new_links = results.add((link,) for link in links)
+    if on_rows and new_links:
+        on_rows(new_links)
+
+def schedule_retry(url, attempts, retries, metrics, reason, retry_after=None):
+    # Puts a failed URL back in the retry heap with jittered exponential backoff, until it runs out of attempts
+    attempt = attempts.get(url, 0) + 1
+    if attempt > RETRY_MAX_ATTEMPTS or stop_scan_flag.is_set():
+        logging.error(f"Giving up on {url} after {attempt} attempts: {reason}")
+        attempts.pop(url, None)
+        return False
+    attempts[url] = attempt
+    delay = backoff_delay(attempt - 1, retry_after)
+    logging.warning(f"Retrying {url} in {delay:.1f} seconds (attempt {attempt + 1}): {reason}")
+    metrics.count("retries", host=urlparse(url).netloc)
+    heapq.heappush(retries, (time.monotonic() + delay, url))
+    return True
+
+def release_host(controller, host, to_visit):
+    # A host the frontier held back at its concurrency limit is offered again once it has a free slot
+    if controller.available(host):
+        to_visit.release(host)
+
+def queue_links(links, depth, to_visit, seen):
+    # Links past the depth limit or outside the URL rules are not marked seen, so a shorter path
+    # to them can still queue them
+    new_links = [link for link in links if to_visit.accepts(link, depth) and seen.add(link)]
+    to_visit.extend(new_links, depth)
+    return new_links
+
+def new_frontier(options):
+    rules = UrlRules(options.include, options.exclude, options.priorities)
+    return Frontier(rules, options.max_depth)
+
+def new_budget(options):
+    if options.max_pages is None and options.max_bytes is None and options.time_limit is None:
+        return None
+    return CrawlBudget(options.max_pages, options.max_bytes, options.time_limit)
+
+def spent_budget(budget, base_domain, to_visit):
+    # The budget that ran out, if one did. Fetches under way still finish, and everything queued
+    # stays pending for a resumed crawl.
+    exhausted = budget.exhausted()
+    if exhausted:
+        logging.info(f"Stopping the crawl of {base_domain}: its {exhausted} budget is spent, {len(to_visit)} URLs left")
+    return exhausted
+
+def update_gauges(metrics, to_visit, fetching, processing, parked, driver_pool):
+    metrics.set_gauge("queue_depth", len(to_visit))
+    metrics.set_gauge("fetching", len(fetching))
+    metrics.set_gauge("processing", len(processing))
+    metrics.set_gauge("waiting_for_robots", sum(len(urls) for urls in parked.values()))
+    if driver_pool is not None:
+        busy, started = driver_pool.utilization()
+        metrics.set_gauge("browsers_busy", busy)
+        metrics.set_gauge("browsers_started", started)
+        metrics.set_gauge("browsers_size", driver_pool.size)
+
+def crawl_site(url, options, robots=None, on_progress=None, fetcher=None, store=None, on_rows=None, metrics=None, profiler=None, results=None):
+    # Returns the result store the rows or links went to; only rows new to it are passed to on_rows
+    crawl_links_only = options.crawl_links_only
     base_domain = urlparse(url).netloc
-    visited = set()
-    to_visit = set([normalize_url(url)])
-    all_links = set()
-    all_data = []
-    total_pages = len(to_visit)
-
-    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_THREADS) as executor:
-        while to_visit:
-            current_url = to_visit.pop()
-            if current_url in visited:
-                continue
-            visited.add(current_url)
-
-            try:
-                response = requests.get(current_url, headers=HEADERS, timeout=10)
-                response.raise_for_status()
-                soup = BeautifulSoup(response.content, 'html.parser')
-
-                if crawl_links_only:
-                    new_links = get_internal_links(current_url, soup, base_domain)
-                    all_links.update(new_links)
-                    to_visit.update(new_links)
-                else:
-                    page_data = scrape_page(current_url, tags, classes, attribute, rp, search_emails_var, search_phones_var, scrape_images_var)
-                    all_data.extend(page_data)
-                    new_links = get_internal_links(current_url, soup, base_domain)
-                    to_visit.update(new_links)
-
-                total_pages += len(new_links)
-                if progress_bar:
-                    progress = len(visited) / total_pages * 100
-                    progress_bar['value'] = progress
-
-            except requests.exceptions.RequestException as e:
-                logging.error(f"Failed to retrieve {current_url}: {e}")
-
-    return all_links if crawl_links_only else all_data
-
-def display_data(data, tree):
-    if not data:
-        messagebox.showwarning("No Data", "No data found with the specified parameters.")
-        return
-
-    df = pd.DataFrame(data, columns=["URL", "Content"])
-    df = df.drop_duplicates()
-    max_content_width = max(df['Content'].apply(len)) * 10 if not df.empty else 100
-    tree.column("Content", width=max_content_width)
-
-    for i in tree.get_children():
-        tree.delete(i)
-    for index, row in df.iterrows():
-        tree.insert("", "end", values=(row['URL'], row['Content']))
-
-def display_links(links, tree):
-    for i in tree.get_children():
-        tree.delete(i)
-    for link in sorted(links):
-        tree.insert("", "end", values=(link, ""))
-
-def scrape_data(url_entry, tags_combobox, classes_combobox, attribute_choice, crawl_option, crawl_links_var, scrape_images_var, load_robots_var, search_emails_var, search_phones_var, progress_bar, verbose_output, stats_label, tree, donate_button):
-    stop_scan_flag.clear()
-    progress_bar['value'] = 0
-
-    thread = threading.Thread(target=_scrape_data_thread, args=(
-        url_entry, tags_combobox, classes_combobox, attribute_choice, crawl_option, crawl_links_var, scrape_images_var, load_robots_var, search_emails_var, search_phones_var, progress_bar, verbose_output, stats_label, tree, donate_button
-    ))
-    thread.start()
-
-def _scrape_data_thread(url_entry, tags_combobox, classes_combobox, attribute_choice, crawl_option, crawl_links_var, scrape_images_var, load_robots_var, search_emails_var, search_phones_var, progress_bar, verbose_output, stats_label, tree, donate_button):
-    url = url_entry.get()
-    
-    # Check for anti-scraping measures
-    is_blocked, message = check_anti_scraping(url)
-    verbose_output.insert(tk.END, f"{message}\n")
-    verbose_output.see(tk.END)
-    if is_blocked:
-        stats_label.config(text="Scraping aborted: Anti-scraping measures detected.")
-        return
-    
-    tags = [tag.strip() for tag in tags_combobox.get().split(",")]
-    classes = [cls.strip() for cls in classes_combobox.get().split(",") if cls.strip()]
-    attribute = attribute_choice.get()
-    crawl_links_only = crawl_links_var.get() == 1
-
-    rp = load_robots_var.get() == 1 and load_robots_txt(url) or None
-
-    start_time = time.time()
-    all_data = set()
-
-    if crawl_option.get() == 1:
+    # Every URL ever queued is remembered by fingerprint only; just the pending ones are kept as
+    # strings, shallowest and best scored first
+    to_visit = new_frontier(options)
+    to_visit.push(normalize_url(url))
+    visited_count = 0
+    results = results if results is not None else ResultStore()
+    if store:
+        # Pick up where an interrupted crawl stopped, or recrawl using the saved page validators
+        store.start(to_visit)
+        visited_count = store.done_count()
+        # Saved URLs come back at the depth they were found at, so depth budgets hold across runs
+        to_visit.clear()
+        for pending_url, depth in store.pending_entries():
+            to_visit.push(pending_url, depth)
+        # Done URLs go into the index as they are read, never all held as strings at once
+        seen = new_url_index(store.done_urls())
         if crawl_links_only:
-            all_links = crawl_site(url, tags, classes, attribute, crawl_links_only=True, rp=rp, progress_bar=progress_bar, search_emails_var=search_emails_var, search_phones_var=search_phones_var, scrape_images_var=scrape_images_var)
-            display_links(all_links, tree)
-        else:
-            all_data.update(crawl_site(url, tags, classes, attribute, rp=rp, progress_bar=progress_bar, search_emails_var=search_emails_var, search_phones_var=search_phones_var, scrape_images_var=scrape_images_var))
-            display_data(list(all_data), tree)
+            results.add((link,) for link in store.frontier_urls())
     else:
-        all_data.update(scrape_page(url, tags, classes, attribute, rp, search_emails_var, search_phones_var, scrape_images_var))
-        display_data(list(all_data), tree)
-
-    end_time = time.time()
-    elapsed_time = end_time - start_time
-
-    stats_label.config(text=f"Pages crawled: {len(all_data) if not crawl_links_only else len(all_links)} | Time taken: {elapsed_time:.2f} seconds")
-
-    flash_paypal_button(donate_button)
-
-    progress_bar['value'] = 0
-
-def export_data(export_format, url_entry, tags_combobox, classes_combobox, attribute_choice, crawl_option, crawl_links_var, scrape_images_var, load_robots_var, search_emails_var, search_phones_var, tree):
-    df = scrape_data_for_export(url_entry, tags_combobox, classes_combobox, attribute_choice, crawl_option, crawl_links_var, scrape_images_var, load_robots_var, search_emails_var, search_phones_var)
-    if df is not None and not df.empty:
-        file_types = [("CSV files", "*.csv")] if export_format == "csv" else [("JSON files", "*.json")]
-        file_path = filedialog.asksaveasfilename(defaultextension=f".{export_format}", filetypes=file_types)
-        if file_path:
-            if export_format == "csv":
-                df.to_csv(file_path, index=False)
-            elif export_format == "json":
-                df.to_json(file_path, orient='records', lines=True)
-            elif export_format == "excel":
-                df.to_excel(file_path, index=False)
-            messagebox.showinfo("Success", f"Data exported successfully as {export_format.upper()}.")
-
-def scrape_data_for_export(url_entry, tags_combobox, classes_combobox, attribute_choice, crawl_option, crawl_links_var, scrape_images_var, load_robots_var, search_emails_var, search_phones_var):
-    url = url_entry.get()
-    tags = [tag.strip() for tag in tags_combobox.get().split(",")]
-    classes = [cls.strip() for cls in classes_combobox.get().split(",") if cls.strip()]
-    attribute = attribute_choice.get()
-    crawl_links_only = crawl_links_var.get() == 1
-    
-    rp = load_robots_var.get() == 1 and load_robots_txt(url) or None
-    
-    if crawl_option.get() == 1:  # Crawl entire site
+        seen = new_url_index()
+    seen.update(to_visit)
+    metrics = metrics or CrawlMetrics()
+    fetcher = fetcher or get_default_fetcher()
+    scheduler = HostScheduler(delay=options.rate_limit, stop_event=stop_scan_flag)
+    controller = HostController()
+    render_policy = RenderPolicy()
+    plan = build_plan(options, base_domain=base_domain, links_only=crawl_links_only)
+    duplicates = None
+    if options.skip_duplicates:
+        from dedup import DuplicateDetector
+        duplicates = DuplicateDetector()
+    downloads = None if crawl_links_only else new_image_downloader(options, plan, fetcher, scheduler, metrics)
+
+    # The crawl owns its browsers so Chrome starts once per worker instead of once per page; they
+    # only start if a page turns out to need rendering
+    driver_pool = None if crawl_links_only or plan.streaming else new_driver_pool(metrics=metrics)
+    parse_processes = (os.cpu_count() or 1) if options.parse_processes < 0 else options.parse_processes
+    parse_pool = new_parse_pool(plan, parse_processes) if parse_processes else None
+    # With parser processes the threads mostly wait on them, so keep enough threads to feed every process
+    max_workers = max(options.max_threads, parse_processes)
+
+    # Only this thread touches the frontier. Fetches wait for their host's slot inside the fetch
+    # engine, then rendering and extraction run on the thread pool and hand links back through
+    # their futures.
+    fetching = {}
+    processing = {}
+    # URLs of hosts whose robots.txt is still loading wait here instead of blocking the frontier
+    robots_loading = {}
+    parked = {}
+    robots_hosts = set()
+    # Failed fetches wait in a heap ordered by the time they may be retried
+    retries = []
+    attempts = {}
+    if options.use_sitemaps:
+        entries = (entry for entry in sitemap_entries(url, base_domain, robots, fetcher, scheduler, metrics)
+                   if to_visit.accepts(entry.url, 1))
         if crawl_links_only:
-            all_links = crawl_site(url, tags, classes, attribute, crawl_links_only=True, rp=rp, search_emails_var=search_emails_var, search_phones_var=search_phones_var, scrape_images_var=scrape_images_var)
-            return pd.DataFrame({'URL': list(all_links)})
+            # The sitemaps are the link inventory, so the pages are only crawled if there are none.
+            # Links go to the results in batches as the sitemaps are parsed.
+            listed = len(results)
+            while True:
+                links = [entry.url for entry in itertools.islice(entries, SITEMAP_BATCH)]
+                if not links:
+                    break
+                collect_links(links, results, on_rows)
+            if len(results) > listed:
+                logging.info(f"Took {len(results) - listed} links for {base_domain} from its sitemaps instead of crawling")
+                if store:
+                    for pending_url in to_visit:
+                        store.mark_done(pending_url)
+                to_visit.clear()
+        else:
+            queued = seed_from_sitemaps(entries, to_visit, seen, store, metrics)
+            logging.info(f"Queued {queued} pages for {base_domain} from its sitemaps")
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    metrics.set_gauge("workers", max_workers)
+    metrics.set_gauge("parse_processes", parse_processes)
+    next_snapshot = time.monotonic() + METRICS_INTERVAL
+    budget = new_budget(options)
+    exhausted = None
+    try:
+        while (to_visit or fetching or processing or robots_loading or retries) and not stop_scan_flag.is_set():
+            now = time.monotonic()
+            while retries and retries[0][0] <= now:
+                to_visit.requeue(heapq.heappop(retries)[1])
+            if budget and not exhausted:
+                exhausted = spent_budget(budget, base_domain, to_visit)
+            if exhausted:
+                # Failed fetches are not tried again once the budget is spent
+                retries.clear()
+            while not exhausted and len(fetching) < fetcher.max_in_flight:
+                current_url = to_visit.pop()
+                if current_url is None:
+                    break
+                host = urlparse(current_url).netloc
+                if duplicates is not None and current_url not in attempts:
+                    # Parameters learned since the URL was queued are dropped before it is fetched
+                    canonical = normalize_url(duplicates.canonical(current_url))
+                    if canonical != current_url:
+                        if not seen.add(canonical):
+                            metrics.count("params_dropped", host=host)
+                            visited_count += 1
+                            if store:
+                                store.mark_done(current_url)
+                            to_visit.done(current_url)
+                            continue
+                        # The saved frontier follows, or the old URL would stay pending for good
+                        if store:
+                            store.add_pending([canonical], to_visit.depth(current_url))
+                            store.mark_done(current_url)
+                        to_visit.rename(current_url, canonical)
+                        current_url = canonical
+                if robots:
+                    rules = robots.cached(current_url)
+                    if rules is None:
+                        if host not in parked:
+                            parked[host] = set()
+                            robots_loading[robots.load_async(current_url)] = host
+                        parked[host].add(current_url)
+                        continue
+                    if host not in robots_hosts:
+                        robots_hosts.add(host)
+                        apply_robots_rules(host, rules, scheduler)
+                    if not rules.can_fetch(current_url):
+                        metrics.count("robots_blocked", host=host)
+                        visited_count += 1
+                        if store:
+                            store.mark_done(current_url)
+                        to_visit.done(current_url)
+                        continue
+                if not controller.acquire(host):
+                    to_visit.hold(current_url)
+                    continue
+                if current_url not in attempts:
+                    visited_count += 1
+                    if budget:
+                        budget.pages += 1
+                        exhausted = spent_budget(budget, base_domain, to_visit)
+                headers = store.conditional_headers(current_url) if store else None
+                future = fetcher.submit(current_url, headers=headers, delay=scheduler.reserve(current_url), cancel_event=stop_scan_flag)
+                fetching[future] = current_url
+            if not fetching and not processing and not robots_loading and not retries:
+                break
+
+            update_gauges(metrics, to_visit, fetching, processing, parked, driver_pool)
+            metrics.set_gauge("retry_queue", len(retries))
+            metrics.set_gauge("host_concurrency", controller.total_limit())
+            if options.metrics_dir and time.monotonic() >= next_snapshot:
+                metrics.write_snapshot(options.metrics_dir, site_name(url))
+                next_snapshot = time.monotonic() + METRICS_INTERVAL
+
+            timeout = 0.5 if not retries else min(0.5, max(0.0, retries[0][0] - time.monotonic()))
+            done, _ = concurrent.futures.wait(list(fetching) + list(processing) + list(robots_loading), timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                if future in robots_loading:
+                    # The rules are cached now, so the host's parked URLs go back on the frontier
+                    for parked_url in parked.pop(robots_loading.pop(future)):
+                        to_visit.requeue(parked_url)
+                    continue
+
+                if future in fetching:
+                    current_url = fetching.pop(future)
+                    host = urlparse(current_url).netloc
+                    controller.release(host)
+                    # A finished fetch frees a slot, and a healthy one may have raised the host's limit
+                    try:
+                        response = future.result()
+                    except FetchError as e:
+                        # Timeouts and connection failures: back off and try again later
+                        controller.on_throttle(host)
+                        if not schedule_retry(current_url, attempts, retries, metrics, str(e)):
+                            metrics.count("errors", stage="fetch", host=host)
+                            if store:
+                                store.mark_done(current_url)
+                            to_visit.done(current_url)
+                        release_host(controller, host, to_visit)
+                        continue
+                    record_response(metrics, response)
+                    if budget:
+                        budget.bytes += len(response.content)
+
+                    if response.status in RETRY_STATUSES:
+                        retry_after = parse_retry_after(response.headers.get('retry-after'))
+                        if response.status in THROTTLE_STATUSES:
+                            controller.on_throttle(host)
+                            if retry_after:
+                                scheduler.pause(host, retry_after)
+                        if schedule_retry(current_url, attempts, retries, metrics, f"HTTP {response.status}", retry_after):
+                            release_host(controller, host, to_visit)
+                            continue
+                    else:
+                        controller.on_success(host, response.elapsed)
+                    attempts.pop(current_url, None)
+                    release_host(controller, host, to_visit)
+
+                    page_hash = None
+                    if store:
+                        # Unchanged pages skip extraction and reuse the links saved on the last visit
+                        previous = store.page(current_url)
+                        if previous and response.status != 304 and response.status < 400:
+                            page_hash = content_hash(response.content)
+                        if previous and (response.status == 304 or page_hash == previous['content_hash']):
+                            store.touch_page(current_url)
+                            store.mark_done(current_url)
+                            metrics.count("pages", host=urlparse(current_url).netloc, unchanged=True)
+                            new_links = previous['links']
+                            if crawl_links_only:
+                                collect_links(new_links, results, on_rows)
+                            depth = to_visit.depth(current_url) + 1
+                            new_links = queue_links(new_links, depth, to_visit, seen)
+                            to_visit.done(current_url)
+                            store.add_pending(new_links, depth)
+                            continue
+                    task_args = (current_url, response, plan, crawl_links_only, driver_pool, render_policy, parse_pool, metrics, duplicates, downloads)
+                    future = executor.submit(profiler.call, process_page, *task_args) if profiler else executor.submit(process_page, *task_args)
+                    processing[future] = (current_url, response, page_hash)
+                    continue
+
+                current_url, response, page_hash = processing.pop(future)
+                host = urlparse(current_url).netloc
+                depth = to_visit.depth(current_url)
+                to_visit.done(current_url)
+                if store:
+                    store.mark_done(current_url)
+                try:
+                    page_data, new_links = future.result()
+                except FetchError as e:
+                    logging.error(f"Failed to retrieve {current_url}: {e}")
+                    metrics.count("errors", stage="fetch", host=host)
+                    continue
+                except Exception as e:
+                    logging.error(f"Failed to process {current_url}: {e}")
+                    metrics.count("errors", stage="process", host=host)
+                    continue
+
+                metrics.count("pages", host=host, unchanged=False)
+                metrics.count("rows", len(page_data), host=host)
+                link_start = time.perf_counter()
+                if duplicates is not None:
+                    new_links = {normalize_url(duplicates.canonical(link)) for link in new_links}
+                if crawl_links_only:
+                    collect_links(new_links, results, on_rows)
+                else:
+                    page_data = results.add(page_data)
+                    if on_rows and page_data:
+                        on_rows(page_data)
+                if store:
+                    store.save_page(current_url, response, page_hash or content_hash(response.content), new_links)
+                new_links = queue_links(new_links, depth + 1, to_visit, seen)
+                if store:
+                    store.add_pending(new_links, depth + 1)
+                metrics.observe("links", time.perf_counter() - link_start, host)
+
+                if on_progress:
+                    # Against the budget closest to running out, if there is one, since the
+                    # number of URLs found keeps growing
+                    progress = budget.progress() if budget else None
+                    on_progress(*(progress or (visited_count, len(seen))))
+    finally:
+        for future in list(fetching) + list(processing):
+            future.cancel()
+        executor.shutdown(wait=True)
+        if parse_pool:
+            parse_pool.shutdown(wait=True)
+        if driver_pool:
+            driver_pool.close()
+        if downloads:
+            downloads.close()
+        if store:
+            store.commit()
+        seen.close()
+        if duplicates is not None:
+            for host, params in duplicates.learned_params().items():
+                logging.info(f"Learned that {', '.join(params)} do not change pages on {host}")
+        update_gauges(metrics, to_visit, fetching, processing, parked, driver_pool)
+        if options.metrics_dir:
+            metrics.write_snapshot(options.metrics_dir, site_name(url))
+
+    return results
+
+def run_scrape(url, options, on_progress=None, on_rows=None, fetcher=None, metrics=None, results=None):
+    # Scrape one page or crawl one site as the options say; returns the columns and the result
+    # store the rows went to, which the caller closes
+    metrics = metrics or CrawlMetrics()
+    results = results if results is not None else ResultStore()
+    robots = load_robots(url, options)
+    if not options.crawl:
+        downloads = new_image_downloader(options, build_plan(options), metrics=metrics)
+        try:
+            page_data = results.add(scrape_page(url, options, robots, metrics=metrics, downloads=downloads))
+        finally:
+            if downloads:
+                downloads.close()
+        if on_rows and page_data:
+            on_rows(page_data)
+        if options.metrics_dir:
+            metrics.write_snapshot(options.metrics_dir, site_name(url))
+        return DATA_COLUMNS, results
+
+    # The profiler covers this crawl's coordinator and worker threads, not the fetch engine's loop;
+    # from Python 3.12 on it sees every thread, including other crawls running at the same time
+    profiler = Profiler() if options.profile_dir else None
+    store = CrawlStore.for_site(url) if options.resume else None
+    try:
+        crawl_args = (url, options, robots, on_progress, fetcher, store, on_rows, metrics, profiler, results)
+        if profiler:
+            profiler.call(crawl_site, *crawl_args)
         else:
-            return pd.DataFrame(crawl_site(url, tags, classes, attribute, rp=rp, search_emails_var=search_emails_var, search_phones_var=search_phones_var, scrape_images_var=scrape_images_var))
-    else:  # Scrape single page
-        return pd.DataFrame(scrape_page(url, tags, classes, attribute, rp, search_emails_var, search_phones_var, scrape_images_var))
-
-def stop_scan(verbose_output):
-    stop_scan_flag.set()  # Signal threads to stop
-    verbose_output.insert(tk.END, "Stop button pressed, stopping scan...\n")
-    verbose_output.see(tk.END)
-
-def clear_results(tree, verbose_output):
-    for i in tree.get_children():
-        tree.delete(i)
-    verbose_output.delete(1.0, tk.END)
-    verbose_output.insert(tk.END, "Results cleared.\n")
+            crawl_site(*crawl_args)
+    finally:
+        if store:
+            store.close()
+        if profiler:
+            os.makedirs(options.profile_dir, exist_ok=True)
+            profiler.dump(os.path.join(options.profile_dir, f"{site_name(url)}.prof"))
+    return (LINK_COLUMNS if options.crawl_links_only else DATA_COLUMNS), results
@@ -0,0 +1,145 @@
+import concurrent.futures
+import gzip
+import io
+import logging
+import tempfile
+import xml.etree.ElementTree as ET
+from collections import deque, namedtuple
+from datetime import datetime, timezone
+from functools import lru_cache
+from urllib.parse import urljoin, urlparse
+from config import SITEMAP_PATHS, SITEMAP_MAX_FILES, SITEMAP_MAX_BYTES
+from fetcher import FetchError, get_default_fetcher
+
+# One <url> of a sitemap; lastmod is a Unix timestamp and priority defaults to the protocol's 0.5
+SitemapEntry = namedtuple('SitemapEntry', ['url', 'lastmod', 'priority'])
+
+DEFAULT_PRIORITY = 0.5
+
+# Sitemaps tend to repeat a handful of dates thousands of times
+@lru_cache(maxsize=4096)
+def parse_lastmod(text):
+    # W3C datetimes: 2024-05-01, 2024-05-01T10:00Z, 2024-05-01T10:00:00.123+02:00, ...
+    text = (text or '').strip()
+    if not text:
+        return None
+    if text.endswith(('Z', 'z')):
+        text = text[:-1] + '+00:00'
+    if '.' in text:
+        # fromisoformat() before Python 3.11 only takes 3 or 6 digit fractions, which nothing here needs
+        head, _, tail = text.partition('.')
+        zone = next((index for index, char in enumerate(tail) if char in '+-'), len(tail))
+        text = head + tail[zone:]
+    try:
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+def parse_priority(text):
+    try:
+        return min(1.0, max(0.0, float(text)))
+    except (TypeError, ValueError):
+        return DEFAULT_PRIORITY
+
+def iter_sitemap(source):
+    # Yields ('url', SitemapEntry) and ('sitemap', SitemapEntry) for a urlset or sitemap index,
+    # given as bytes or a seekable binary file. The gzip stream is inflated and parsed a block at a
+    # time, and every finished entry is dropped from the tree, so a 50,000 URL sitemap never sits
+    # in memory as a whole.
+    stream = io.BytesIO(source) if isinstance(source, bytes) else source
+    magic = stream.read(2)
+    stream.seek(0)
+    if magic == b'\x1f\x8b':
+        stream = gzip.GzipFile(fileobj=stream)
+    root = None
+    # Tags without their namespace, worked out once per distinct tag
+    names = {}
+    try:
+        for event, element in ET.iterparse(stream, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = element
+                continue
+            kind = names.get(element.tag) or names.setdefault(element.tag, element.tag.rpartition('}')[2])
+            if kind not in ('url', 'sitemap'):
+                continue
+            fields = {}
+            for child in element:
+                name = names.get(child.tag) or names.setdefault(child.tag, child.tag.rpartition('}')[2])
+                fields[name] = (child.text or '').strip()
+            if fields.get('loc'):
+                yield kind, SitemapEntry(fields['loc'], parse_lastmod(fields.get('lastmod')),
+                                         parse_priority(fields.get('priority')))
+            root.clear()
+    except (ET.ParseError, EOFError, OSError) as e:
+        # A cut off or corrupt file still gives the entries before the damage
+        logging.warning(f"Stopped reading a sitemap early: {e}")
+
+def sitemap_locations(url, rules=None):
+    # The sitemaps robots.txt lists, or the usual places when it lists none
+    if rules is not None and rules.sitemaps:
+        return list(rules.sitemaps)
+    return [urljoin(url, path) for path in SITEMAP_PATHS]
+
+def read_sitemaps(locations, rules=None, fetcher=None, scheduler=None, cancel_event=None, max_files=SITEMAP_MAX_FILES, metrics=None,
+                  max_bytes=SITEMAP_MAX_BYTES):
+    # Yields the SitemapEntry of every page in the given sitemaps, following sitemap indexes; with
+    # rules, sitemap files robots.txt disallows are left alone. Each round of sitemap files is
+    # downloaded concurrently, spaced by the crawl's host scheduler, into temporary files that are
+    # parsed as they finish, so sitemaps are never held in memory and get their own size limit.
+    fetcher = fetcher or get_default_fetcher()
+    pending = deque(locations)
+    requested = set(pending)
+    fetched = 0
+    while pending and fetched < max_files and not (cancel_event and cancel_event.is_set()):
+        futures = {}
+        while pending and fetched < max_files:
+            location = pending.popleft()
+            if rules is not None and not rules.can_fetch(location):
+                continue
+            delay = scheduler.reserve(location) if scheduler else 0
+            sink = tempfile.TemporaryFile()
+            futures[fetcher.submit_download(location, sink, max_bytes, delay=delay, cancel_event=cancel_event)] = location, sink
+            fetched += 1
+        for future in concurrent.futures.as_completed(futures):
+            location, sink = futures[future]
+            with sink:
+                try:
+                    response = future.result()
+                except FetchError as e:
+                    logging.warning(f"Failed to fetch sitemap {location}: {e}")
+                    continue
+                if metrics:
+                    metrics.count("sitemaps", host=urlparse(location).netloc, status=response.status)
+                if response.status != 200:
+                    continue
+                if response.truncated:
+                    logging.warning(f"Sitemap {location} is larger than {max_bytes} bytes; reading the part that was downloaded")
+                sink.seek(0)
+                pages = children = 0
+                for kind, entry in iter_sitemap(sink):
+                    if kind == 'sitemap':
+                        children += 1
+                        if entry.url not in requested:
+                            requested.add(entry.url)
+                            pending.append(entry.url)
+                    else:
+                        pages += 1
+                        yield entry
+                if children:
+                    logging.info(f"Sitemap index {location} lists {children} sitemaps")
+                if pages or not children:
+                    logging.info(f"Read {pages} URLs from sitemap {location}")
+    if pending:
+        logging.warning(f"Stopped after {max_files} sitemap files; {len(pending)} more were not read")
+
+def sitemap_order(entry):
+    # Highest priority first, then the most recently changed
+    return (-entry.priority, -(entry.lastmod or 0.0))
+
+def is_unchanged(entry, fetched_at):
+    # A page fetched after the sitemap says it last changed does not need fetching again
+    return entry.lastmod is not None and fetched_at is not None and fetched_at >= entry.lastmod
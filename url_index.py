@@ -0,0 +1,125 @@
+import hashlib
+import math
+import mmap
+import tempfile
+from array import array
+from config import URL_INDEX, URL_BLOOM_CAPACITY, URL_BLOOM_ERROR_RATE, URL_BLOOM_DIR
+
+MAX_LOAD = 0.7
+
+def fingerprint(url):
+    # 64 bits of blake2b; 0 marks an empty slot, so it is folded onto 1
+    value = int.from_bytes(hashlib.blake2b(url.encode('utf-8', 'surrogatepass'), digest_size=8).digest(), 'little')
+    return value or 1
+
+# A set of URLs that only keeps their 64-bit fingerprints, in one flat open-addressing table:
+# about 11-23 bytes per URL instead of a full string plus a set entry
+class FingerprintSet:
+    def __init__(self, urls=(), capacity=1024):
+        self._allocate(1 << max(10, math.ceil(capacity / MAX_LOAD).bit_length()))
+        self.update(urls)
+
+    def _allocate(self, size):
+        self._slots = array('Q', bytes(8 * size))
+        self._mask = size - 1
+        self._limit = int(size * MAX_LOAD)
+        self._count = 0
+
+    def _index(self, value):
+        slots, mask = self._slots, self._mask
+        index = value & mask
+        while True:
+            slot = slots[index]
+            if slot == value or slot == 0:
+                return index
+            index = (index + 1) & mask
+
+    def add_fingerprint(self, value):
+        index = self._index(value)
+        if self._slots[index] == value:
+            return False
+        self._slots[index] = value
+        self._count += 1
+        if self._count > self._limit:
+            old_slots = self._slots
+            self._allocate(len(old_slots) * 2)
+            for old_value in old_slots:
+                if old_value:
+                    self._slots[self._index(old_value)] = old_value
+                    self._count += 1
+        return True
+
+    def add(self, url):
+        # True if the URL was not in the set yet
+        return self.add_fingerprint(fingerprint(url))
+
+    def update(self, urls):
+        for url in urls:
+            self.add(url)
+
+    def __contains__(self, url):
+        value = fingerprint(url)
+        return self._slots[self._index(value)] == value
+
+    def __len__(self):
+        return self._count
+
+    def close(self):
+        pass
+
+# A fixed-size Bloom filter over the same fingerprints for crawls too large even for that. It never
+# misses a URL it has seen, but treats about error_rate of new URLs as seen. With a directory the
+# bits live in a temporary file mapped into memory, so the OS can page them out.
+class BloomFilter:
+    def __init__(self, urls=(), capacity=URL_BLOOM_CAPACITY, error_rate=URL_BLOOM_ERROR_RATE, directory=URL_BLOOM_DIR):
+        self.bit_count = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.bit_count / capacity * math.log(2)))
+        size = (self.bit_count + 7) // 8
+        self._file = None
+        if directory:
+            self._file = tempfile.TemporaryFile(dir=directory)
+            self._file.truncate(size)
+            self._bits = mmap.mmap(self._file.fileno(), size)
+        else:
+            self._bits = bytearray(size)
+        self._count = 0
+        self.update(urls)
+
+    def _positions(self, value):
+        # Double hashing: k positions from the two halves of one fingerprint
+        first, step = value & 0xFFFFFFFF, (value >> 32) | 1
+        return [(first + i * step) % self.bit_count for i in range(self.hash_count)]
+
+    def add(self, url):
+        bits = self._bits
+        added = False
+        for position in self._positions(fingerprint(url)):
+            mask = 1 << (position & 7)
+            if not bits[position >> 3] & mask:
+                bits[position >> 3] |= mask
+                added = True
+        if added:
+            self._count += 1
+        return added
+
+    def update(self, urls):
+        for url in urls:
+            self.add(url)
+
+    def __contains__(self, url):
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(fingerprint(url)))
+
+    def __len__(self):
+        return self._count
+
+    def close(self):
+        if self._file is not None:
+            self._bits.close()
+            self._file.close()
+            self._file = None
+
+def new_url_index(urls=(), kind=URL_INDEX):
+    if kind == 'bloom':
+        return BloomFilter(urls)
+    return FingerprintSet(urls)
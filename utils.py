@@ -1,21 +1,26 @@
 import re
+from functools import lru_cache
+from urllib.parse import urlsplit, urlunsplit
+from config import NORMALIZE_CACHE_SIZE
+
+# Compiled once; every candidate link on every page is checked against it
+VALID_URL_REGEX = re.compile(
+    r'^(?:http|ftp)s?://'  # http:// or https://
+    r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+(?:[A-Z]{2,6}\.?|[A-Z0-9-]{2,}\.?)|'  # domain...
+    r'localhost|'  # localhost...
+    r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}|'  # ...or ipv4
+    r'\[?[A-F0-9]*:[A-F0-9:]+\]?)'  # ...or ipv6
+    r'(?::\d+)?'  # optional port
+    r'(?:/?|[/?]\S+)$', re.IGNORECASE)
 
 def is_valid_url(url):
-    VALID_URL_REGEX = re.compile(
-        r'^(?:http|ftp)s?://'  # http:// or https://
-        r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+(?:[A-Z]{2,6}\.?|[A-Z0-9-]{2,}\.?)|'  # domain...
-        r'localhost|'  # localhost...
-        r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}|'  # ...or ipv4
-        r'\[?[A-F0-9]*:[A-F0-9:]+\]?)'  # ...or ipv6
-        r'(?::\d+)?'  # optional port
-        r'(?:/?|[/?]\S+)$', re.IGNORECASE)
-    return re.match(VALID_URL_REGEX, url) is not None
+    return VALID_URL_REGEX.match(url) is not None
 
+# Navigation links repeat on every page of a site, so most calls are cache hits
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
 def normalize_url(url):
-    from urllib.parse import urlparse, urldefrag
-    parsed_url = urlparse(url)
-    cleaned_url, _ = urldefrag(parsed_url.geturl())
-    return cleaned_url.lower().rstrip('/')
+    scheme, netloc, path, query, _ = urlsplit(url)
+    return urlunsplit((scheme, netloc, path, query, '')).lower().rstrip('/')
 
 def flash_paypal_button(donate_button, count=10):
     if count > 0:
@@ -26,6 +31,8 @@ def flash_paypal_button(donate_button, count=10):
 
 
 def copy_to_clipboard(event):
+    tree = event.widget
+    root = tree.winfo_toplevel()
     selected_items = tree.selection()
     selected_text = ""
     for item in selected_items: